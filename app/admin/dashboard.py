@@ -6,10 +6,12 @@ import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from app.database import SessionLocal
+from app.database import SessionLocal, read_session
 from app.models.user import APIKey
-from app.models.usage import APIUsage
+from app.models.usage import APIUsage, UsageRollup
+from app.services.usage_rollups import DAY, LATENCY_COLUMNS, rollup_window_start
 from app.utils.helpers import generate_api_key
+from app.services.api_key_cache import invalidate_api_key
 import stripe
 from app.config import settings
 
@@ -34,6 +36,11 @@ def get_db():
         pass  # Don't close here, let Streamlit handle it
 
 
+def get_read_db():
+    """Get session for analytics pages (read replica when available)"""
+    return read_session()
+
+
 def main():
     """Main dashboard function"""
     # Check authentication
@@ -68,7 +75,7 @@ def show_overview():
     """Show overview dashboard"""
     st.header("Overview")
     
-    db = get_db()
+    db = get_read_db()
     
     try:
         # Total partners
@@ -76,16 +83,16 @@ def show_overview():
             APIKey.is_active == True
         ).scalar() or 0
         
-        # Total queries (last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        total_queries = db.query(func.count(APIUsage.id)).filter(
-            APIUsage.created_at >= thirty_days_ago
-        ).scalar() or 0
-        
-        # Total revenue (last 30 days)
-        total_revenue = db.query(func.sum(APIUsage.cost)).filter(
-            APIUsage.created_at >= thirty_days_ago
-        ).scalar() or 0.0
+        # Total queries and revenue (last 30 days)
+        thirty_days_ago = rollup_window_start(30)
+        total_queries, total_revenue = db.query(
+            func.sum(UsageRollup.request_count), func.sum(UsageRollup.cost_sum)
+        ).filter(
+            UsageRollup.granularity == DAY,
+            UsageRollup.bucket_start >= thirty_days_ago
+        ).one()
+        total_queries = total_queries or 0
+        total_revenue = total_revenue or 0.0
         
         # Active API keys
         active_keys = db.query(APIKey).filter(
@@ -172,19 +179,21 @@ def show_partners():
         partners = db.query(APIKey).filter(APIKey.is_active == True).all()
         
         if partners:
+            # Usage stats for every partner in one query
+            usage_counts = dict(db.query(
+                UsageRollup.api_key_id, func.sum(UsageRollup.request_count)
+            ).filter(
+                UsageRollup.granularity == DAY,
+                UsageRollup.bucket_start >= rollup_window_start(30)
+            ).group_by(UsageRollup.api_key_id).all())
+            
             partner_data = []
             for partner in partners:
-                # Get usage stats
-                usage_count = db.query(func.count(APIUsage.id)).filter(
-                    APIUsage.api_key_id == partner.id,
-                    APIUsage.created_at >= datetime.utcnow() - timedelta(days=30)
-                ).scalar() or 0
-                
                 partner_data.append({
                     "ID": partner.id,
                     "Partner Name": partner.partner_name,
                     "Email": partner.partner_email,
-                    "Queries (30d)": usage_count,
+                    "Queries (30d)": usage_counts.get(partner.id) or 0,
                     "Created": partner.created_at.strftime("%Y-%m-%d"),
                     "Status": "Active" if partner.is_active else "Inactive"
                 })
@@ -202,6 +211,7 @@ def show_partners():
                 if partner:
                     partner.is_active = False
                     db.commit()
+                    invalidate_api_key(partner.key)
                     st.success("API Key revoked successfully")
                     st.rerun()
         else:
@@ -215,7 +225,7 @@ def show_analytics():
     """Show usage analytics"""
     st.header("Usage Analytics")
     
-    db = get_db()
+    db = get_read_db()
     
     try:
         # Date range selector
@@ -225,18 +235,19 @@ def show_analytics():
         with col2:
             end_date = st.date_input("End Date", value=datetime.utcnow().date())
         
-        # Query usage data
-        usage_data = db.query(APIUsage).filter(
-            func.date(APIUsage.created_at) >= start_date,
-            func.date(APIUsage.created_at) <= end_date
+        # Query the daily rollups for the range
+        rollups = db.query(UsageRollup).filter(
+            UsageRollup.granularity == DAY,
+            UsageRollup.bucket_start >= datetime.combine(start_date, datetime.min.time()),
+            UsageRollup.bucket_start < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
         ).all()
         
-        if usage_data:
+        if rollups:
             # Daily usage chart
             daily_counts = {}
-            for usage in usage_data:
-                date = usage.created_at.date()
-                daily_counts[date] = daily_counts.get(date, 0) + 1
+            for rollup in rollups:
+                date = rollup.bucket_start.date()
+                daily_counts[date] = daily_counts.get(date, 0) + rollup.request_count
             
             chart_data = pd.DataFrame({
                 "Date": list(daily_counts.keys()),
@@ -248,8 +259,8 @@ def show_analytics():
             
             # Endpoint breakdown
             endpoint_counts = {}
-            for usage in usage_data:
-                endpoint_counts[usage.endpoint] = endpoint_counts.get(usage.endpoint, 0) + 1
+            for rollup in rollups:
+                endpoint_counts[rollup.endpoint] = endpoint_counts.get(rollup.endpoint, 0) + rollup.request_count
             
             st.subheader("Endpoint Usage")
             endpoint_df = pd.DataFrame({
@@ -259,12 +270,15 @@ def show_analytics():
             st.bar_chart(endpoint_df.set_index("Endpoint"))
             
             # Response time distribution
-            response_times = [u.response_time_ms for u in usage_data if u.response_time_ms]
-            if response_times:
+            latency_count = sum(r.latency_count for r in rollups)
+            if latency_count:
                 st.subheader("Response Time Distribution")
-                st.metric("Average", f"{sum(response_times) / len(response_times):.2f} ms")
-                st.metric("Min", f"{min(response_times):.2f} ms")
-                st.metric("Max", f"{max(response_times):.2f} ms")
+                st.metric("Average", f"{sum(r.latency_sum_ms for r in rollups) / latency_count:.2f} ms")
+                histogram_df = pd.DataFrame({
+                    "Bucket": [column.replace("latency_", "") for column in LATENCY_COLUMNS],
+                    "Requests": [sum(getattr(r, column) for r in rollups) for column in LATENCY_COLUMNS]
+                })
+                st.bar_chart(histogram_df.set_index("Bucket"))
         else:
             st.info("No usage data for selected period")
             
@@ -276,13 +290,14 @@ def show_billing():
     """Show billing information"""
     st.header("Billing & Revenue")
     
-    db = get_db()
+    db = get_read_db()
     
     try:
         # Revenue metrics
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        total_revenue = db.query(func.sum(APIUsage.cost)).filter(
-            APIUsage.created_at >= thirty_days_ago
+        thirty_days_ago = rollup_window_start(30)
+        total_revenue = db.query(func.sum(UsageRollup.cost_sum)).filter(
+            UsageRollup.granularity == DAY,
+            UsageRollup.bucket_start >= thirty_days_ago
         ).scalar() or 0.0
         
         st.metric("Revenue (Last 30 Days)", f"${total_revenue:,.2f}")
@@ -291,11 +306,12 @@ def show_billing():
         st.subheader("Revenue by Partner")
         partner_revenue = db.query(
             APIKey.partner_name,
-            func.sum(APIUsage.cost).label("revenue")
+            func.sum(UsageRollup.cost_sum).label("revenue")
         ).join(
-            APIUsage, APIKey.id == APIUsage.api_key_id
+            UsageRollup, APIKey.id == UsageRollup.api_key_id
         ).filter(
-            APIUsage.created_at >= thirty_days_ago
+            UsageRollup.granularity == DAY,
+            UsageRollup.bucket_start >= thirty_days_ago
         ).group_by(APIKey.partner_name).all()
         
         if partner_revenue:
@@ -1,36 +1,43 @@
 """
 API dependencies for authentication and rate limiting
 """
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, Response
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.database import get_db
-from app.models.user import APIKey
-from app.services.cache_service import CacheService
+from app.database import get_async_db
+from app.services.api_key_cache import ResolvedAPIKey, resolve_api_key
+from app.services.cache_service import CacheService, RateLimitResult, get_cache_service
 from app.config import settings
 from datetime import datetime
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
-cache_service = CacheService()
+
+
+def get_cache() -> CacheService:
+    """Dependency providing the shared cache service"""
+    return get_cache_service()
 
 
 async def get_api_key(
     x_api_key: Optional[str] = Header(None, alias="X-API-Key"),
-    db: Session = Depends(get_db)
-) -> APIKey:
+    db: AsyncSession = Depends(get_async_db)
+) -> ResolvedAPIKey:
     """
     Dependency to authenticate API key
     
+    Active keys are cached in-process; the database is only queried on a miss.
+    
     Args:
         x_api_key: API key from header
         db: Database session
         
     Returns:
-        APIKey model instance
+        ResolvedAPIKey record
         
     Raises:
         HTTPException if authentication fails
@@ -42,11 +49,7 @@ async def get_api_key(
             headers={"WWW-Authenticate": "ApiKey"}
         )
     
-    # Query database for API key
-    api_key = db.query(APIKey).filter(
-        APIKey.key == x_api_key,
-        APIKey.is_active == True
-    ).first()
+    api_key = await resolve_api_key(db, x_api_key)
     
     if not api_key:
         logger.warning(f"Invalid API key attempt: {x_api_key[:10]}... (truncated)")
@@ -66,58 +69,66 @@ async def get_api_key(
     return api_key
 
 
-def check_rate_limit(api_key: APIKey) -> bool:
+def check_rate_limit(api_key: ResolvedAPIKey) -> RateLimitResult:
     """
-    Check if API key has exceeded rate limits
+    Check and consume rate limit quota for an API key
+    
+    Both the per-minute and per-day windows are checked and consumed
+    atomically in a single Redis round-trip.
     
     Args:
-        api_key: APIKey model instance
+        api_key: Authenticated API key
         
     Returns:
-        True if within limits, False otherwise
+        RateLimitResult for the most restrictive window
     """
-    # Check per-minute limit
-    minute_count = cache_service.get_rate_limit_count(api_key.key, "minute")
-    if minute_count >= api_key.rate_limit_per_minute:
-        return False
-    
-    # Check per-day limit
-    day_count = cache_service.get_rate_limit_count(api_key.key, "day")
-    if day_count >= api_key.rate_limit_per_day:
-        return False
-    
-    return True
+    return get_cache_service().consume_rate_limit(
+        api_key.key,
+        [
+            ("minute", api_key.rate_limit_per_minute or settings.api_rate_limit_per_minute, 60),
+            ("day", api_key.rate_limit_per_day or settings.api_rate_limit_per_day, 86400),
+        ]
+    )
 
 
-def increment_rate_limit(api_key: APIKey):
-    """Increment rate limit counters"""
-    cache_service.increment_rate_limit(api_key.key, "minute", ttl=60)
-    cache_service.increment_rate_limit(api_key.key, "day", ttl=86400)
+def rate_limit_headers(result: RateLimitResult) -> dict:
+    """Build X-RateLimit-* response headers"""
+    headers = {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(result.remaining),
+        "X-RateLimit-Reset": str(math.ceil(result.reset_after)),
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(math.ceil(result.retry_after), 1))
+    return headers
 
 
 async def verify_api_key_and_rate_limit(
-    api_key: APIKey = Depends(get_api_key)
-) -> APIKey:
+    response: Response,
+    api_key: ResolvedAPIKey = Depends(get_api_key)
+) -> ResolvedAPIKey:
     """
     Combined dependency for authentication and rate limiting
     
     Args:
+        response: Response used to attach rate limit headers
         api_key: Authenticated API key
         
     Returns:
-        APIKey model instance
+        ResolvedAPIKey record
         
     Raises:
         HTTPException if rate limit exceeded
     """
-    if not check_rate_limit(api_key):
+    result = check_rate_limit(api_key)
+    headers = rate_limit_headers(result)
+    
+    if not result.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Rate limit exceeded. Please try again later."
+            detail="Rate limit exceeded. Please try again later.",
+            headers=headers
         )
     
-    # Increment counters
-    increment_rate_limit(api_key)
-    
+    response.headers.update(headers)
     return api_key
-
@@ -2,15 +2,18 @@
 API key management routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime, timedelta
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import APIKey
+from app.services.api_key_cache import ResolvedAPIKey
 from app.api.deps import verify_api_key_and_rate_limit
 from app.utils.helpers import generate_api_key
 from app.api.deps import get_api_key as verify_api_key
+from app.services.api_key_cache import invalidate_api_key
 
 router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
 
@@ -58,7 +61,7 @@ class APIKeyResponse(BaseModel):
 )
 async def create_api_key(
     key_data: APIKeyCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new API key for a partner
@@ -74,10 +77,10 @@ async def create_api_key(
     **Note**: In production, this endpoint may require admin approval.
     """
     # Check if email already has an active key
-    existing = db.query(APIKey).filter(
+    existing = await db.scalar(select(APIKey).where(
         APIKey.partner_email == key_data.partner_email,
         APIKey.is_active == True
-    ).first()
+    ))
     
     if existing:
         raise HTTPException(
@@ -105,8 +108,8 @@ async def create_api_key(
     )
     
     db.add(api_key)
-    db.commit()
-    db.refresh(api_key)
+    await db.commit()
+    await db.refresh(api_key)
     
     # Send welcome email
     try:
@@ -125,7 +128,7 @@ async def create_api_key(
 
 @router.get("/keys/me", response_model=APIKeyResponse)
 async def get_current_api_key(
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit)
 ):
     """Get current API key information"""
     return api_key
@@ -134,14 +137,14 @@ async def get_current_api_key(
 @router.post("/keys/{key_id}/revoke", status_code=status.HTTP_200_OK)
 async def revoke_api_key(
     key_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Revoke an API key
     
     Note: In production, this should be protected by admin authentication
     """
-    api_key = db.query(APIKey).filter(APIKey.id == key_id).first()
+    api_key = await db.scalar(select(APIKey).where(APIKey.id == key_id))
     
     if not api_key:
         raise HTTPException(
@@ -150,7 +153,8 @@ async def revoke_api_key(
         )
     
     api_key.is_active = False
-    db.commit()
+    await db.commit()
+    invalidate_api_key(api_key.key)
     
     return {"message": "API key revoked successfully"}
 
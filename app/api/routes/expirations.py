@@ -1,20 +1,25 @@
 """
 Patent expiration endpoints
 """
-from fastapi import APIRouter, Depends, Query, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Callable, Dict, Optional, List
 from datetime import datetime
-from app.database import get_db
-from app.models.user import APIKey
+from app.config import settings
+from app.services.api_key_cache import ResolvedAPIKey
 from app.models.patent import PatentExpiration
-from app.models.usage import APIUsage
 from app.api.deps import verify_api_key_and_rate_limit
 from app.services.uspto_client import USPTOClient
 from app.services.ai_service import AIService
+from app.services.expiration_service import ExpirationService, InvalidCursorError
+from app.services.usage_recorder import usage_recorder
 from app.utils.validators import ExpirationQueryParams
-from app.utils.helpers import format_patent_response, parse_industry_keywords, calculate_billing_cost
-from app.utils.validators import ExpirationQueryParams
+from app.utils.helpers import (
+    format_patent_response, calculate_billing_cost, data_version, make_etag, etag_matches
+)
+from app.utils.responses import PatentPageResponse, page_version, patent_json
+import csv
+import io
 import time
 import logging
 
@@ -24,6 +29,81 @@ router = APIRouter(prefix="/api/v1/expirations", tags=["Expirations"])
 
 uspto_client = USPTOClient()
 ai_service = AIService()
+expiration_service = ExpirationService(uspto_client, ai_service)
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Streamed rows are sent in chunks of about this many bytes
+STREAM_CHUNK_BYTES = 16384
+
+
+def with_dependency_headers(result: Response, response: Response) -> Response:
+    """
+    Copy headers dependencies set on the injected response (X-RateLimit-*)
+    onto a response the endpoint returns directly, which FastAPI sends as is
+    """
+    for name, value in response.headers.items():
+        if name not in ("content-length", "content-type") and name not in result.headers:
+            result.headers[name] = value
+    return result
+
+
+def cache_headers(etag: Optional[str] = None) -> Dict[str, str]:
+    """
+    HTTP caching headers for expiration responses
+
+    Bodies differ per API key (effective branding is a key setting, and the
+    branding query parameter is part of the URL), so shared caches must key
+    on X-API-Key as well.
+    """
+    headers = {
+        "Cache-Control": f"public, max-age={settings.expirations_http_max_age}, must-revalidate",
+        "Vary": "X-API-Key, Accept-Encoding",
+    }
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+async def stream_patents(
+    patents: AsyncIterator[Dict],
+    response_format: str,
+    branding: bool,
+    on_complete: Callable[[int], None]
+) -> AsyncIterator[str]:
+    """
+    Format patents one at a time as NDJSON lines or CSV rows
+
+    Args:
+        patents: Processed patents, as they are produced
+        response_format: "ndjson" or "csv"
+        branding: Include the powered_by field
+        on_complete: Called with the number of patents sent (also on disconnect)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if response_format == "csv":
+        writer.writerow(format_patent_response({}, branding).keys())
+
+    count = 0
+    try:
+        async for patent in patents:
+            if response_format == "csv":
+                writer.writerow(format_patent_response(patent, branding).values())
+            else:
+                buffer.write(patent_json(patent, branding))
+                buffer.write("\n")
+            count += 1
+            if buffer.tell() >= STREAM_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    except Exception as e:
+        logger.error(f"Error streaming expiring patents after {count} rows: {e}")
+        raise
+    finally:
+        on_complete(count)
 
 
 @router.get(
@@ -36,11 +116,13 @@ ai_service = AIService()
     
     **Industries**: biotech, electronics, software, medical, automotive, energy, materials
     
-    Returns patent data with AI summaries and relevance scores.
+    Returns patent data with AI summaries and relevance scores. Pass `next_cursor`
+    back as `cursor` to fetch the following page.
     """,
     response_description="List of expiring patents with AI summaries and metadata"
 )
 async def get_expiring_patents(
+    response: Response,
     industry: Optional[str] = Query(
         None, 
         description="Industry filter. Options: biotech, electronics, software, medical, automotive, energy, materials",
@@ -64,13 +146,23 @@ async def get_expiring_patents(
         description="Offset for pagination",
         example=0
     ),
+    cursor: Optional[str] = Query(
+        None,
+        description="Opaque cursor from a previous response's next_cursor (replaces offset)"
+    ),
     branding: bool = Query(
         True, 
         description="Include API provider branding in response. Set to false for white-label.",
         example=True
     ),
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    response_format: str = Query(
+        "json",
+        alias="format",
+        pattern="^(json|ndjson|csv)$",
+        description="json (one document), or ndjson / csv streamed row by row"
+    ),
+    if_none_match: Optional[str] = Header(None),
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit)
 ):
     """
     Get patents expiring in the specified date range.
@@ -82,7 +174,13 @@ async def get_expiring_patents(
     - `date_range`: next_7_days, next_30_days, next_90_days, next_365_days
     - `limit`: Max results (1-1000, default: 50)
     - `offset`: Pagination offset (default: 0)
+    - `cursor`: `next_cursor` from the previous page; stable and cheap for deep pagination
     - `branding`: Include API branding (default: true, false for white-label)
+    - `format`: `json` (default), or `ndjson` / `csv` streamed as rows are read, with the
+      total and next cursor in the `X-Total-Count` and `X-Next-Cursor` headers
+    
+    JSON responses carry a strong `ETag`; send it back in `If-None-Match` to get
+    `304 Not Modified` while the data is unchanged.
     
     **Returns**: Patent objects with AI summaries, relevance scores, and metadata.
     """
@@ -98,68 +196,103 @@ async def get_expiring_patents(
             branding=branding if api_key.branding_enabled else False
         )
         
-        # Get date range
-        start_date, end_date = query_params.get_date_range_tuple()
-        
-        # Parse industry keywords
-        industry_keywords = parse_industry_keywords(query_params.industry)
+        # Local store when the range is synced, else USPTO + AI (served from cache when warm)
+        if response_format in STREAM_MEDIA_TYPES:
+            page = await expiration_service.stream_page(query_params, cursor)
+            headers = {"X-Total-Count": str(page["total"])}
+            if page["next_cursor"]:
+                headers["X-Next-Cursor"] = page["next_cursor"]
+
+            def record_stream(count: int):
+                usage_recorder.record(
+                    api_key_id=api_key.id,
+                    endpoint="/api/v1/expirations",
+                    method="GET",
+                    query_params=str(query_params.dict()),
+                    response_status=200,
+                    response_time_ms=(time.time() - start_time) * 1000,
+                    query_count=count,
+                    cost=calculate_billing_cost(count)
+                )
+
+            return with_dependency_headers(StreamingResponse(
+                stream_patents(page["patents"], response_format, query_params.branding, record_stream),
+                media_type=STREAM_MEDIA_TYPES[response_format],
+                headers={**headers, **cache_headers()}
+            ), response)
         
-        # Query USPTO API
-        patents = await uspto_client.get_expiring_patents(
-            start_date=start_date,
-            end_date=end_date,
-            industry_keywords=industry_keywords if industry_keywords else None,
-            limit=query_params.limit,
-            offset=query_params.offset
-        )
+        page = await expiration_service.get_page(query_params, cursor)
         
-        # Process with AI
-        processed_patents = ai_service.process_patents(patents, industry_keywords)
+        # Validate against the page data before spending time on encoding
+        etag = make_etag(page_version(page["patents"], page["total"], page["next_cursor"]), query_params.branding)
+        if etag_matches(if_none_match, etag):
+            usage_recorder.record(
+                api_key_id=api_key.id,
+                endpoint="/api/v1/expirations",
+                method="GET",
+                query_params=str(query_params.dict()),
+                response_status=304,
+                response_time_ms=(time.time() - start_time) * 1000,
+                query_count=0
+            )
+            return with_dependency_headers(
+                Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag)), response
+            )
         
-        # Format response
-        response_data = [
-            format_patent_response(patent, query_params.branding)
-            for patent in processed_patents
-        ]
+        patents = page["patents"]
         
         # Calculate response time
         response_time_ms = (time.time() - start_time) * 1000
         
-        # Track usage for billing
-        usage = APIUsage(
+        # Track usage for billing (written in the background)
+        usage_recorder.record(
             api_key_id=api_key.id,
             endpoint="/api/v1/expirations",
             method="GET",
             query_params=str(query_params.dict()),
             response_status=200,
             response_time_ms=response_time_ms,
-            query_count=len(response_data),
-            cost=calculate_billing_cost(len(response_data))
+            query_count=len(patents),
+            cost=calculate_billing_cost(len(patents))
         )
-        db.add(usage)
-        db.commit()
         
-        return {
-            "data": response_data,
-            "count": len(response_data),
-            "limit": query_params.limit,
-            "offset": query_params.offset,
-            "total_estimated": len(response_data)  # In production, get actual total from USPTO
-        }
+        # Patents are spliced in from their pre-encoded fragments
+        return with_dependency_headers(PatentPageResponse(
+            {
+                "data": patents,
+                "branding": query_params.branding,
+                "count": len(patents),
+                "limit": query_params.limit,
+                "offset": query_params.offset,
+                "total_estimated": page["total"],
+                "next_cursor": page["next_cursor"]
+            },
+            headers=cache_headers(etag)
+        ), response)
         
+    except InvalidCursorError as e:
+        usage_recorder.record(
+            api_key_id=api_key.id,
+            endpoint="/api/v1/expirations",
+            method="GET",
+            response_status=400,
+            response_time_ms=(time.time() - start_time) * 1000
+        )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error fetching expiring patents: {e}")
         
         # Track failed usage
-        usage = APIUsage(
+        usage_recorder.record(
             api_key_id=api_key.id,
             endpoint="/api/v1/expirations",
             method="GET",
             response_status=500,
             response_time_ms=(time.time() - start_time) * 1000
         )
-        db.add(usage)
-        db.commit()
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -181,20 +314,23 @@ async def get_expiring_patents(
 )
 async def get_patent_by_id(
     patent_id: str,
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit)
 ):
     """
     Get single patent by ID.
     
     **Authentication Required**: Include API key in `X-API-Key` header.
     
-    Returns detailed patent information with AI summary.
+    Returns detailed patent information with AI summary. Supports
+    `If-None-Match` like the list endpoint.
     """
     start_time = time.time()
     
     try:
-        patent = await uspto_client.get_patent_by_id(patent_id)
+        # Local store first, then USPTO
+        patent = await expiration_service.find_patent(patent_id)
         
         if not patent:
             raise HTTPException(
@@ -202,10 +338,23 @@ async def get_patent_by_id(
                 detail=f"Patent {patent_id} not found"
             )
         
-        # Process with AI
-        processed = ai_service.process_patents([patent])
-        if processed:
-            patent = processed[0]
+        # The record's version decides the ETag, so a match skips AI and formatting
+        etag = make_etag(data_version(patent), api_key.branding_enabled)
+        if etag_matches(if_none_match, etag):
+            usage_recorder.record(
+                api_key_id=api_key.id,
+                endpoint=f"/api/v1/expirations/{patent_id}",
+                method="GET",
+                response_status=304,
+                response_time_ms=(time.time() - start_time) * 1000,
+                query_count=0,
+                route="/api/v1/expirations/{patent_id}"
+            )
+            return with_dependency_headers(
+                Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag)), response
+            )
+        response.headers.update(cache_headers(etag))
+        patent = expiration_service.enrich_patent(patent)
         
         # Format response
         response_data = format_patent_response(
@@ -214,17 +363,16 @@ async def get_patent_by_id(
         )
         
         # Track usage
-        usage = APIUsage(
+        usage_recorder.record(
             api_key_id=api_key.id,
             endpoint=f"/api/v1/expirations/{patent_id}",
             method="GET",
             response_status=200,
             response_time_ms=(time.time() - start_time) * 1000,
             query_count=1,
-            cost=calculate_billing_cost(1)
+            cost=calculate_billing_cost(1),
+            route="/api/v1/expirations/{patent_id}"
         )
-        db.add(usage)
-        db.commit()
         
         return response_data
         
@@ -3,15 +3,17 @@ Monitoring and metrics endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.middleware.monitoring import get_metrics
-from app.api.deps import verify_api_key_and_rate_limit
-from app.models.user import APIKey
+from app.services.cache_service import CacheService, get_cache_metrics
+from app.services.usage_recorder import usage_recorder
+from app.api.deps import get_cache, verify_api_key_and_rate_limit
+from app.services.api_key_cache import ResolvedAPIKey
 
 router = APIRouter(prefix="/api/v1/monitoring", tags=["Monitoring"])
 
 
 @router.get("/metrics")
 async def get_api_metrics(
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit)
 ):
     """
     Get API performance metrics.
@@ -21,19 +23,22 @@ async def get_api_metrics(
     # In production, check if API key has admin permissions
     # For now, allow any authenticated user
     metrics = get_metrics()
+    metrics["cache"] = get_cache_metrics()
+    metrics["usage_recorder"] = usage_recorder.stats()
     return metrics
 
 
 @router.get("/health/detailed", include_in_schema=False)
-async def detailed_health_check():
+async def detailed_health_check(cache: CacheService = Depends(get_cache)):
     """
     Detailed health check with system status.
     
     No authentication required.
     """
     from app.config import settings
-    from app.services.cache_service import CacheService
-    from app.database import SessionLocal
+    from app.services.cache_service import REDIS_AVAILABLE
+    from app.database import AsyncSessionLocal
+    from sqlalchemy import text
     from datetime import datetime
     
     health_status = {
@@ -45,10 +50,11 @@ async def detailed_health_check():
     
     # Check Redis
     try:
-        cache = CacheService()
         if cache.redis_client:
             cache.redis_client.ping()
             health_status["services"]["redis"] = "healthy"
+        elif REDIS_AVAILABLE:
+            health_status["services"]["redis"] = "degraded: using in-process cache"
         else:
             health_status["services"]["redis"] = "disabled"
     except Exception as e:
@@ -56,13 +62,21 @@ async def detailed_health_check():
     
     # Check Database
     try:
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
         health_status["services"]["database"] = "healthy"
     except Exception as e:
         health_status["services"]["database"] = f"unhealthy: {str(e)}"
     
+    # Check read replica (analytics fall back to the primary when it is unusable)
+    from app.database import async_replica_available, replica_status, async_replica_engine
+    if async_replica_engine is not None:
+        if await async_replica_available():
+            health_status["services"]["database_replica"] = "healthy"
+        else:
+            health_status["services"]["database_replica"] = "degraded: reading from primary"
+        health_status["replica"] = replica_status.snapshot()
+    
     # Check USPTO API (basic connectivity)
     health_status["services"]["uspto_api"] = "configured" if settings.uspto_api_key else "not_configured"
     
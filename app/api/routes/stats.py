@@ -2,14 +2,18 @@
 Usage statistics endpoints
 """
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from typing import Dict
-from app.database import get_db
-from app.models.user import APIKey
-from app.models.usage import APIUsage
-from app.api.deps import verify_api_key_and_rate_limit
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+from app.config import settings
+from app.database import get_async_read_db
+from app.services.api_key_cache import ResolvedAPIKey
+from app.models.usage import UsageRollup
+from app.services.cache_service import CacheService
+from app.services.usage_counters import ENDPOINT_FIELD_PREFIX, read_counters
+from app.services.usage_rollups import DAY, rollup_window_start
+from app.api.deps import get_cache, verify_api_key_and_rate_limit
 
 router = APIRouter(prefix="/api/v1/stats", tags=["Statistics"])
 
@@ -21,68 +25,120 @@ router = APIRouter(prefix="/api/v1/stats", tags=["Statistics"])
     response_description="Usage statistics including query counts, costs, and analytics"
 )
 async def get_usage_stats(
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit),
+    db: AsyncSession = Depends(get_async_read_db),
+    cache: CacheService = Depends(get_cache)
 ):
     """Get usage statistics for current API key. Returns queries, costs, response times, and rate limits."""
-    
-    # Get stats for last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    # Total queries
-    total_queries = db.query(func.count(APIUsage.id)).filter(
-        APIUsage.api_key_id == api_key.id,
-        APIUsage.created_at >= thirty_days_ago
-    ).scalar() or 0
-    
-    # Total cost
-    total_cost = db.query(func.sum(APIUsage.cost)).filter(
-        APIUsage.api_key_id == api_key.id,
-        APIUsage.created_at >= thirty_days_ago
-    ).scalar() or 0.0
-    
-    # Average response time
-    avg_response_time = db.query(func.avg(APIUsage.response_time_ms)).filter(
-        APIUsage.api_key_id == api_key.id,
-        APIUsage.created_at >= thirty_days_ago,
-        APIUsage.response_time_ms.isnot(None)
-    ).scalar() or 0.0
-    
-    # Queries by endpoint
-    endpoint_stats = db.query(
-        APIUsage.endpoint,
-        func.count(APIUsage.id).label("count")
-    ).filter(
-        APIUsage.api_key_id == api_key.id,
-        APIUsage.created_at >= thirty_days_ago
-    ).group_by(APIUsage.endpoint).all()
-    
-    # Daily usage (last 7 days)
+    # Real-time Redis counters; the database rollups only while Redis is down
+    counters = read_counters(api_key.id, cache=cache)
+    if counters is not None:
+        stats = _stats_from_counters(counters)
+    else:
+        cache_key = f"stats:{api_key.id}"
+        stats = cache.get(cache_key)
+        if stats is None:
+            stats = await _compute_usage_stats(db, api_key.id)
+            cache.set(cache_key, stats, ttl=settings.stats_cache_ttl)
+
+    return {
+        **stats,
+        "rate_limits": {
+            "per_minute": api_key.rate_limit_per_minute,
+            "per_day": api_key.rate_limit_per_day
+        }
+    }
+
+
+def _stats_from_counters(days: List[Tuple[date, Dict[str, float]]]) -> Dict:
+    """Build the stats payload from 30 days of usage counters (oldest first)"""
+    total_queries = 0
+    total_cost = 0.0
+    latency_sum = 0.0
+    latency_count = 0
+    endpoint_counts: Dict[str, int] = {}
+    for _, fields in days:
+        total_queries += int(fields.get("request_count", 0))
+        total_cost += fields.get("cost_sum", 0.0)
+        latency_sum += fields.get("latency_sum_ms", 0.0)
+        latency_count += int(fields.get("latency_count", 0))
+        for field, count in fields.items():
+            if field.startswith(ENDPOINT_FIELD_PREFIX):
+                endpoint = field[len(ENDPOINT_FIELD_PREFIX):]
+                endpoint_counts[endpoint] = endpoint_counts.get(endpoint, 0) + int(count)
+
+    return {
+        "period": "last_30_days",
+        "total_queries": total_queries,
+        "total_cost": round(total_cost, 2),
+        "average_response_time_ms": round(latency_sum / latency_count, 2) if latency_count else 0.0,
+        "endpoints": [
+            {"endpoint": endpoint, "count": count}
+            for endpoint, count in endpoint_counts.items()
+        ],
+        "daily_usage": [
+            {"date": day.isoformat(), "count": int(fields.get("request_count", 0))}
+            for day, fields in days[-7:]
+        ]
+    }
+
+
+async def _compute_usage_stats(db: AsyncSession, api_key_id: str) -> Dict:
+    """
+    Aggregate the last 30 days of daily rollups for one key
+
+    One range scan on the rollup primary key (api_key_id, granularity,
+    bucket_start) returns at most one row per day and endpoint, which covers
+    totals, endpoints and the daily series.
+    """
+    thirty_days_ago = rollup_window_start(30)
+    seven_days_ago = rollup_window_start(7)
+
+    rows = (await db.execute(select(
+        UsageRollup.bucket_start,
+        UsageRollup.endpoint,
+        UsageRollup.request_count,
+        UsageRollup.cost_sum,
+        UsageRollup.latency_sum_ms,
+        UsageRollup.latency_count
+    ).where(
+        UsageRollup.api_key_id == api_key_id,
+        UsageRollup.granularity == DAY,
+        UsageRollup.bucket_start >= thirty_days_ago
+    ))).all()
+
+    total_queries = 0
+    total_cost = 0.0
+    latency_sum = 0.0
+    latency_count = 0
+    endpoint_counts: Dict[str, int] = {}
+    daily_counts: Dict = {}
+    for bucket, endpoint, count, cost, bucket_latency_sum, bucket_latency_count in rows:
+        total_queries += count
+        total_cost += cost
+        latency_sum += bucket_latency_sum
+        latency_count += bucket_latency_count
+        endpoint_counts[endpoint] = endpoint_counts.get(endpoint, 0) + count
+        if bucket >= seven_days_ago:
+            daily_counts[bucket.date()] = daily_counts.get(bucket.date(), 0) + count
+
+    # Daily usage (last 7 days, oldest first)
     daily_usage = []
     for i in range(7):
-        date = datetime.utcnow().date() - timedelta(days=i)
-        count = db.query(func.count(APIUsage.id)).filter(
-            func.date(APIUsage.created_at) == date,
-            APIUsage.api_key_id == api_key.id
-        ).scalar() or 0
+        date = (seven_days_ago + timedelta(days=i)).date()
         daily_usage.append({
             "date": date.isoformat(),
-            "count": count
+            "count": daily_counts.get(date, 0)
         })
-    
+
     return {
         "period": "last_30_days",
         "total_queries": total_queries,
         "total_cost": round(float(total_cost), 2),
-        "average_response_time_ms": round(float(avg_response_time), 2),
+        "average_response_time_ms": round(latency_sum / latency_count, 2) if latency_count else 0.0,
         "endpoints": [
             {"endpoint": endpoint, "count": count}
-            for endpoint, count in endpoint_stats
+            for endpoint, count in endpoint_counts.items()
         ],
-        "daily_usage": list(reversed(daily_usage)),
-        "rate_limits": {
-            "per_minute": api_key.rate_limit_per_minute,
-            "per_day": api_key.rate_limit_per_day
-        }
+        "daily_usage": daily_usage
     }
-
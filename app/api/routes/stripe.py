@@ -2,12 +2,12 @@
 Stripe payment processing endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import stripe
 import logging
-from app.database import get_db
-from app.models.user import APIKey
+from app.database import get_async_db
+from app.services.api_key_cache import ResolvedAPIKey
 from app.models.usage import APIUsage
 from app.api.deps import verify_api_key_and_rate_limit
 from app.config import settings
@@ -89,8 +89,8 @@ async def stripe_webhook(
 @router.post("/create-checkout-session")
 async def create_checkout_session(
     plan: str,  # starter, professional, enterprise
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create Stripe checkout session for subscription.
@@ -2,11 +2,13 @@
 Webhook management endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
-from app.database import get_db
-from app.models.user import APIKey, WebhookConfig
+from app.database import get_async_db
+from app.models.user import WebhookConfig
+from app.services.api_key_cache import ResolvedAPIKey
 from app.api.deps import verify_api_key_and_rate_limit
 from app.utils.helpers import generate_api_key
 from datetime import datetime
@@ -42,15 +44,15 @@ class WebhookResponse(BaseModel):
 )
 async def create_webhook(
     webhook_data: WebhookCreate,
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a webhook endpoint. Webhook receives POST requests when patents expire. Optional secret for HMAC verification."""
     # Check if webhook already exists for this API key and URL
-    existing = db.query(WebhookConfig).filter(
+    existing = await db.scalar(select(WebhookConfig).where(
         WebhookConfig.api_key_id == api_key.id,
         WebhookConfig.url == str(webhook_data.url)
-    ).first()
+    ))
     
     if existing:
         raise HTTPException(
@@ -68,8 +70,8 @@ async def create_webhook(
     )
     
     db.add(webhook)
-    db.commit()
-    db.refresh(webhook)
+    await db.commit()
+    await db.refresh(webhook)
     
     return webhook
 
@@ -81,13 +83,14 @@ async def create_webhook(
     description="Get all registered webhook endpoints for your API key. Requires authentication."
 )
 async def list_webhooks(
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all webhooks for current API key. Returns active webhook configurations."""
-    webhooks = db.query(WebhookConfig).filter(
+    result = await db.scalars(select(WebhookConfig).where(
         WebhookConfig.api_key_id == api_key.id
-    ).all()
+    ))
+    webhooks = result.all()
     
     return webhooks
 
@@ -100,14 +103,14 @@ async def list_webhooks(
 )
 async def delete_webhook(
     webhook_id: str,
-    api_key: APIKey = Depends(verify_api_key_and_rate_limit),
-    db: Session = Depends(get_db)
+    api_key: ResolvedAPIKey = Depends(verify_api_key_and_rate_limit),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a webhook. Permanently removes the endpoint. You can only delete webhooks associated with your API key."""
-    webhook = db.query(WebhookConfig).filter(
+    webhook = await db.scalar(select(WebhookConfig).where(
         WebhookConfig.id == webhook_id,
         WebhookConfig.api_key_id == api_key.id
-    ).first()
+    ))
     
     if not webhook:
         raise HTTPException(
@@ -115,8 +118,8 @@ async def delete_webhook(
             detail="Webhook not found"
         )
     
-    db.delete(webhook)
-    db.commit()
+    await db.delete(webhook)
+    await db.commit()
     
     return {"message": "Webhook deleted successfully"}
 
@@ -17,16 +17,83 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///./patent_alert.db"
+    async_database_url: str = ""  # Derived from database_url (aiosqlite / asyncpg) when empty
+    # Engine profile: pooled servers (Postgres, ...)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30  # Seconds to wait for a pooled connection
+    db_pool_recycle: int = 1800  # Reconnect pooled connections older than this (seconds)
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 0  # Postgres statement_timeout; 0 = no limit
+    # Engine profile: SQLite (applied to every new connection)
+    sqlite_journal_mode: str = "WAL"  # Readers don't block the writer
+    sqlite_synchronous: str = "NORMAL"  # Safe with WAL; FULL fsyncs every commit
+    sqlite_mmap_size: int = 268435456  # 256 MB of memory-mapped I/O
+    sqlite_busy_timeout_ms: int = 5000  # Wait for the write lock instead of failing
+    # Read replica for analytics (stats endpoint, admin dashboard)
+    database_replica_url: str = ""  # Empty = analytics read from the primary
+    replica_max_lag_seconds: float = 30.0  # Use the primary while the replica is further behind
+    replica_check_interval: int = 10  # Seconds between replica health/lag checks
+    
+    # Usage recording (buffered, bulk-inserted off the request path)
+    usage_flush_interval_ms: int = 500
+    usage_flush_batch_size: int = 500
+    usage_queue_max: int = 50000  # Events beyond this are dropped
+    usage_spool_path: str = ""  # Append-only spool that survives crashes; empty = memory only
+    usage_flush_max_retries: int = 5  # Failed writes of one batch before it is dead-lettered
+    # Usage retention (older months move from api_usage to archive files)
+    usage_retention_months: int = 3  # Closed months kept in api_usage; 0 = keep everything
+    usage_archive_dir: str = "./archive/usage"
+    usage_archive_format: str = "auto"  # auto (Parquet when pyarrow is installed), parquet, csv
+    usage_partition_months_ahead: int = 2  # Postgres monthly partitions created in advance
+    usage_counter_reconcile_interval: int = 300  # Seconds between Redis counter / rollup reconciliations
     
     # Redis
     redis_url: str = "redis://localhost:6379/0"
+    redis_urls: str = ""  # Comma-separated nodes for client-side consistent hashing
+    redis_cluster: bool = False  # Treat redis_url as a Redis Cluster seed node
     redis_cache_ttl: int = 86400  # 24 hours in seconds
+    redis_max_connections: int = 50  # Pool size per process (per node when sharded)
+    redis_pool_timeout: float = 2.0  # Seconds to wait for a free pooled connection
+    redis_socket_timeout: float = 5.0
+    redis_socket_connect_timeout: float = 5.0
+    redis_health_check_interval: int = 30  # Ping idle pooled connections before reuse
+    cache_codec: str = "auto"  # auto, orjson, json, msgpack
+    cache_compression: str = "auto"  # auto, zstd, gzip, none
+    cache_compression_threshold: int = 1024  # Compress payloads larger than this (bytes)
+    cache_l1_enabled: bool = True  # In-process cache in front of Redis
+    cache_l1_max_entries: int = 1024
+    cache_l1_ttl: int = 30  # seconds
+    cache_l1_prefixes: str = "uspto_query:,patent:,memo:"  # Hot key prefixes kept in L1
+    cache_invalidation_channel: str = "cache:invalidate"
+    cache_fallback_max_entries: int = 10000  # In-process cache size while Redis is down
+    redis_reconnect_interval: int = 30  # Seconds between reconnect attempts
+    api_key_cache_ttl: int = 60  # Seconds a resolved API key is trusted without a DB lookup
+    stats_cache_ttl: int = 30  # Seconds a key's /api/v1/stats result is reused
+    rate_limit_fallback_workers: int = 1  # Split limits across workers when Redis is down
+    expirations_cache_ttl: int = 3600  # Processed (AI-enriched) expiration results
+    uspto_query_cache_ttl: int = 3600  # Raw USPTO query results
+    expirations_http_max_age: int = 300  # Cache-Control max-age on expiration responses (then revalidate by ETag)
+    cache_stale_ttl: int = 1800  # Serve expired query results this long while refreshing
+    cache_revalidate_lock_ttl: int = 120  # One background refresh per key per worker fleet
+    
+    # Cache warming
+    cache_warm_enabled: bool = True
+    cache_warm_interval: int = 3000  # Seconds; shorter than expirations_cache_ttl
+    cache_warm_stagger_seconds: float = 2.0  # Pause between warmed queries
+    cache_warm_limit: int = 50  # Page size warmed for each query
     
     # USPTO API
     uspto_api_key: str = ""
     uspto_patentsview_url: str = "https://api.patentsview.org/patents/query"
     uspto_bulk_data_url: str = "https://bulkdata.uspto.gov/data/patent"
     
+    # Local patent store (nightly USPTO sync into patent_expirations)
+    patent_sync_days: int = 90  # Expiration days ahead synced; longer ranges query USPTO
+    patent_sync_page_size: int = 1000
+    patent_sync_max_pages: int = 50  # A range needing more pages is left uncovered
+    patent_coverage_max_age_hours: int = 48  # Synced ranges older than this are not served
+    
     # Hugging Face
     hf_api_key: str = ""
     hf_model_name: str = "facebook/bart-large-cnn"
@@ -1,21 +1,222 @@
 """
 Database connection and session management
 """
-from sqlalchemy import create_engine
+from typing import Optional
+import logging
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
-    echo=settings.debug
-)
+logger = logging.getLogger(__name__)
+
+# Async drivers used for each sync backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """Async driver URL for a sync database URL (sqlite -> aiosqlite, postgres -> asyncpg)"""
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver).render_as_string(hide_password=False) if driver else database_url
+
+
+def sqlite_pragmas() -> dict:
+    """PRAGMAs applied to every SQLite connection"""
+    return {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "mmap_size": settings.sqlite_mmap_size,
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+    }
+
+
+def engine_options(database_url: str, is_async: bool = False) -> dict:
+    """
+    create_engine keyword arguments for the backend in database_url
+    
+    Args:
+        database_url: Database URL
+        is_async: Options for create_async_engine
+    """
+    backend = make_url(database_url).get_backend_name()
+    options = {"echo": settings.debug}
+    
+    if backend == "sqlite":
+        if is_async:
+            # SQLite connections are cheap and must not outlive the event loop that opened them
+            options["poolclass"] = NullPool
+        else:
+            options["connect_args"] = {"check_same_thread": False}
+        return options
+    
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    if backend in ("postgresql", "postgres") and settings.db_statement_timeout_ms:
+        timeout = str(settings.db_statement_timeout_ms)
+        options["connect_args"] = (
+            {"server_settings": {"statement_timeout": timeout}} if is_async
+            else {"options": f"-c statement_timeout={timeout}"}
+        )
+    return options
+
+
+def _set_sqlite_pragmas(pragmas: dict):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+
+def create_db_engine(database_url: str, pragmas: Optional[dict] = None, **overrides):
+    """
+    Sync engine configured with the engine profile for its backend
+    
+    Args:
+        database_url: Database URL
+        pragmas: SQLite PRAGMAs (defaults to sqlite_pragmas())
+        **overrides: Extra create_engine arguments
+    """
+    db_engine = create_engine(database_url, **{**engine_options(database_url), **overrides})
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine, "connect", _set_sqlite_pragmas(sqlite_pragmas() if pragmas is None else pragmas))
+    return db_engine
+
+
+def create_async_db_engine(database_url: str, pragmas: Optional[dict] = None, **overrides):
+    """Async counterpart of create_db_engine"""
+    db_engine = create_async_engine(database_url, **{**engine_options(database_url, is_async=True), **overrides})
+    if db_engine.dialect.name == "sqlite":
+        event.listen(
+            db_engine.sync_engine, "connect",
+            _set_sqlite_pragmas(sqlite_pragmas() if pragmas is None else pragmas)
+        )
+    return db_engine
+
+
+# Sync engine: Alembic, the admin dashboard and background jobs
+engine = create_db_engine(settings.database_url)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: request handlers
+async_database_url = settings.async_database_url or get_async_database_url(settings.database_url)
+async_engine = create_async_db_engine(async_database_url)
+
+# Objects stay usable after commit; there is no lazy loading in async code
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Read replica for analytics; sessions fall back to the primary when it is down or lagging
+replica_engine = None
+async_replica_engine = None
+ReadSessionLocal = None
+AsyncReadSessionLocal = None
+if settings.database_replica_url:
+    replica_engine = create_db_engine(settings.database_replica_url)
+    async_replica_engine = create_async_db_engine(get_async_database_url(settings.database_replica_url))
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    AsyncReadSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+
+# Seconds the replica is behind the primary, per dialect (others are assumed current)
+REPLICA_LAG_SQL = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_is_in_recovery() "
+        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+        "ELSE 0 END"
+    ),
+}
+
+
+class ReplicaStatus:
+    """Replica health and lag, rechecked at most every replica_check_interval seconds"""
+    
+    def __init__(self):
+        self.healthy: Optional[bool] = None
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def claim_check(self) -> bool:
+        """True if the caller should run a check now (one caller per interval)"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self.checked_at < settings.replica_check_interval:
+                return False
+            self.checked_at = now
+            return True
+    
+    def record(self, lag_seconds: Optional[float], error: Optional[Exception] = None):
+        if error is not None:
+            if self.healthy is not False:
+                logger.warning(f"Read replica unavailable, using primary: {error}")
+            self.healthy, self.lag_seconds, self.error = False, None, str(error)
+        else:
+            self.healthy, self.lag_seconds, self.error = True, lag_seconds, None
+    
+    @property
+    def usable(self) -> bool:
+        return bool(self.healthy) and (self.lag_seconds or 0.0) <= settings.replica_max_lag_seconds
+    
+    def snapshot(self) -> dict:
+        return {
+            "configured": replica_engine is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "usable": self.usable,
+            "error": self.error,
+        }
+
+
+replica_status = ReplicaStatus()
+
+
+def replica_available() -> bool:
+    """Check (at most once per interval) whether analytics can read from the replica"""
+    if replica_engine is None:
+        return False
+    if replica_status.claim_check():
+        try:
+            sql = REPLICA_LAG_SQL.get(replica_engine.dialect.name)
+            with replica_engine.connect() as conn:
+                lag = float(conn.execute(text(sql)).scalar() or 0.0) if sql else 0.0
+            replica_status.record(lag)
+        except Exception as e:
+            replica_status.record(None, e)
+    return replica_status.usable
+
+
+async def async_replica_available() -> bool:
+    """Async counterpart of replica_available"""
+    if async_replica_engine is None:
+        return False
+    if replica_status.claim_check():
+        try:
+            sql = REPLICA_LAG_SQL.get(async_replica_engine.dialect.name)
+            async with async_replica_engine.connect() as conn:
+                lag = float((await conn.execute(text(sql))).scalar() or 0.0) if sql else 0.0
+            replica_status.record(lag)
+        except Exception as e:
+            replica_status.record(None, e)
+    return replica_status.usable
+
 # Base class for models
 Base = declarative_base()
 
@@ -29,6 +230,33 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def read_session():
+    """Session for read-only analytics: the replica when healthy and caught up, else the primary"""
+    return ReadSessionLocal() if replica_available() else SessionLocal()
+
+
+def get_read_db():
+    """Dependency for getting a read-only analytics session"""
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    """Dependency for getting a read-only async analytics session"""
+    factory = AsyncReadSessionLocal if await async_replica_available() else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
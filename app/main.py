@@ -6,7 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from fastapi.openapi.utils import get_openapi
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, async_engine
 from app.api.routes import health, expirations, auth, webhooks, stats, monitoring
 from app.api.routes import stripe as stripe_routes
 from app.middleware.monitoring import MonitoringMiddleware
@@ -114,6 +114,15 @@ app.include_router(stripe_routes.router)
 async def startup_event():
     """Initialize database on startup"""
     init_db()
+    
+    # Connect the shared cache pool once, before the first request
+    from app.services.cache_service import get_cache_service
+    app.state.cache = get_cache_service()
+    
+    # Background writer for API usage events
+    from app.services.usage_recorder import usage_recorder
+    await usage_recorder.start()
+    
     logging.info(f"{settings.app_name} v{settings.app_version} started")
     
     # Start background scheduler for webhooks
@@ -134,6 +143,14 @@ async def shutdown_event():
     # Stop scheduler
     if hasattr(app.state, 'scheduler'):
         app.state.scheduler.stop()
+    
+    # Write usage events still queued
+    from app.services.usage_recorder import usage_recorder
+    await usage_recorder.stop()
+    
+    from app.services.cache_service import close_cache_service
+    close_cache_service()
+    await async_engine.dispose()
     logging.info(f"{settings.app_name} shutting down")
 
 
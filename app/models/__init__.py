@@ -2,8 +2,8 @@
 Database models for the Patent Alert API
 """
 from app.models.user import APIKey, WebhookConfig
-from app.models.patent import PatentExpiration
-from app.models.usage import APIUsage
+from app.models.patent import PatentExpiration, PatentCoverage
+from app.models.usage import APIUsage, UsageRollup
 
-__all__ = ["APIKey", "WebhookConfig", "PatentExpiration", "APIUsage"]
+__all__ = ["APIKey", "WebhookConfig", "PatentExpiration", "PatentCoverage", "APIUsage", "UsageRollup"]
 
@@ -34,3 +34,16 @@ class PatentExpiration(Base):
     def __repr__(self):
         return f"<PatentExpiration(id='{self.id}', expiration_date='{self.expiration_date}')>"
 
+
+class PatentCoverage(Base):
+    """Expiration date range fully synced from USPTO into patent_expirations"""
+    __tablename__ = "patent_coverage"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    start_date = Column(DateTime, nullable=False)
+    end_date = Column(DateTime, nullable=False)
+    synced_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f"<PatentCoverage(start_date='{self.start_date}', end_date='{self.end_date}')>"
+
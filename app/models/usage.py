@@ -1,7 +1,7 @@
 """
 API usage tracking models
 """
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -11,9 +11,13 @@ import uuid
 class APIUsage(Base):
     """API usage tracking for billing and analytics"""
     __tablename__ = "api_usage"
+    __table_args__ = (
+        # Per-key range scans; also serves lookups by api_key_id alone
+        Index("ix_api_usage_api_key_id_created_at", "api_key_id", "created_at"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    api_key_id = Column(String, ForeignKey("api_keys.id"), nullable=False, index=True)
+    api_key_id = Column(String, ForeignKey("api_keys.id"), nullable=False)
     endpoint = Column(String, nullable=False)
     method = Column(String, nullable=False)
     query_params = Column(Text, nullable=True)  # JSON string
@@ -29,3 +33,32 @@ class APIUsage(Base):
     def __repr__(self):
         return f"<APIUsage(endpoint='{self.endpoint}', status={self.response_status})>"
 
+
+# Upper bounds (ms) of the latency histogram columns on UsageRollup; slower requests go to latency_gt_1000ms
+ROLLUP_LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000)
+
+
+class UsageRollup(Base):
+    """API usage pre-aggregated per key, endpoint and hour/day bucket"""
+    __tablename__ = "api_usage_rollups"
+    
+    # Key order serves the stats query: one key, one granularity, a bucket range
+    api_key_id = Column(String, ForeignKey("api_keys.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    endpoint = Column(String, primary_key=True)  # Route template, e.g. /api/v1/expirations/{patent_id}
+    request_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)  # Responses with status >= 400
+    query_count = Column(Integer, nullable=False, default=0)
+    cost_sum = Column(Float, nullable=False, default=0.0)
+    latency_sum_ms = Column(Float, nullable=False, default=0.0)
+    latency_count = Column(Integer, nullable=False, default=0)
+    latency_le_50ms = Column(Integer, nullable=False, default=0)
+    latency_le_100ms = Column(Integer, nullable=False, default=0)
+    latency_le_250ms = Column(Integer, nullable=False, default=0)
+    latency_le_500ms = Column(Integer, nullable=False, default=0)
+    latency_le_1000ms = Column(Integer, nullable=False, default=0)
+    latency_gt_1000ms = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UsageRollup(endpoint='{self.endpoint}', {self.granularity}={self.bucket_start}, requests={self.request_count})>"
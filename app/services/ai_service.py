@@ -4,6 +4,7 @@ AI service for patent processing using Hugging Face
 from typing import List, Dict, Optional
 import logging
 from app.config import settings
+from app.utils.performance import memoize
 
 logger = logging.getLogger(__name__)
 
@@ -69,24 +70,32 @@ class AIService:
             return None
         
         try:
-            # Truncate if too long (models have token limits)
-            max_input_length = 1024
-            if len(abstract) > max_input_length:
-                abstract = abstract[:max_input_length]
-            
-            result = self.summarizer(
-                abstract,
-                max_length=max_length,
-                min_length=min_length,
-                do_sample=False
-            )
-            
-            return result[0].get("summary_text", "") if result else None
-            
+            return self._summarize(abstract, max_length, min_length)
         except Exception as e:
             logger.error(f"Error summarizing abstract: {e}")
             return None
     
+    @memoize(ttl=86400 * 30, namespace=f"ai.summary.{settings.hf_model_name}", negative_ttl=None)
+    def _summarize(self, abstract: str, max_length: int, min_length: int) -> Optional[str]:
+        """
+        Run the summarization model (summaries cached by abstract text)
+        
+        Errors propagate, so a failed inference is never cached and the next call retries.
+        """
+        # Truncate if too long (models have token limits)
+        max_input_length = 1024
+        if len(abstract) > max_input_length:
+            abstract = abstract[:max_input_length]
+        
+        result = self.summarizer(
+            abstract,
+            max_length=max_length,
+            min_length=min_length,
+            do_sample=False
+        )
+        
+        return result[0].get("summary_text", "") if result else None
+    
     def calculate_relevance_score(
         self,
         patent: Dict,
@@ -108,9 +117,9 @@ class AIService:
         # Simple keyword matching algorithm
         # In production, use more sophisticated NLP
         text_to_search = " ".join([
-            patent.get("title", ""),
-            patent.get("abstract", ""),
-            patent.get("technology_area", "")
+            patent.get("title") or "",
+            patent.get("abstract") or "",
+            patent.get("technology_area") or ""
         ]).lower()
         
         keyword_matches = 0
@@ -140,8 +149,8 @@ class AIService:
         # Simple keyword-based classification
         # In production, use trained ML model
         text = " ".join([
-            patent.get("title", ""),
-            patent.get("abstract", "")
+            patent.get("title") or "",
+            patent.get("abstract") or ""
         ]).lower()
         
         technology_areas = {
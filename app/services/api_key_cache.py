@@ -0,0 +1,81 @@
+"""
+In-process cache of resolved API keys
+
+Authenticated requests resolve their key here instead of querying the
+database every time. Entries are plain immutable records kept in the shared
+L1 cache under ``api_key:<sha256 digest>``, so revocations published with
+invalidate_api_key() reach every worker through the existing cache
+invalidation channel.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+import hashlib
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.user import APIKey
+from app.services.cache_service import get_cache_service
+
+logger = logging.getLogger(__name__)
+
+
+class ResolvedAPIKey(NamedTuple):
+    """Read-only snapshot of an active API key"""
+    id: str
+    key: str
+    partner_name: str
+    partner_email: str
+    is_active: bool
+    rate_limit_per_minute: Optional[int]
+    rate_limit_per_day: Optional[int]
+    branding_enabled: bool
+    created_at: Optional[datetime]
+    expires_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, api_key: APIKey) -> "ResolvedAPIKey":
+        return cls(**{field: getattr(api_key, field) for field in cls._fields})
+
+
+def key_digest(key: str) -> str:
+    """Digest used to index a raw API key"""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_key(key: str) -> str:
+    return f"api_key:{key_digest(key)}"
+
+
+async def resolve_api_key(db: AsyncSession, key: str) -> Optional[ResolvedAPIKey]:
+    """
+    Look up an active API key, from the in-process cache when possible
+
+    Args:
+        db: Database session (only used on a cache miss)
+        key: Raw API key from the request
+
+    Returns:
+        ResolvedAPIKey, or None if the key is unknown or inactive
+    """
+    cache = get_cache_service()
+    cache_key = _cache_key(key)
+    resolved = cache.local_cache.get(cache_key)
+    if resolved is not None:
+        return resolved
+
+    result = await db.execute(
+        select(APIKey).where(APIKey.key == key, APIKey.is_active == True)
+    )
+    api_key = result.scalars().first()
+    if not api_key:
+        return None
+
+    resolved = ResolvedAPIKey.from_model(api_key)
+    cache.local_cache.set(cache_key, resolved, ttl=settings.api_key_cache_ttl)
+    return resolved
+
+
+def invalidate_api_key(key: str):
+    """Drop a key from every worker's cache (call after revoking or editing it)"""
+    get_cache_service().invalidate_local(_cache_key(key))
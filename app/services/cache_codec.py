@@ -0,0 +1,243 @@
+"""
+Serialization codecs for cached values
+
+Every payload written by the cache starts with a single header byte:
+
+    bits 7-4  codec version (currently 1)
+    bits 3-2  serialization format (JSON or msgpack)
+    bits 1-0  compression (none, gzip or zstd)
+
+Version 1 headers fall in 0x10-0x1F, which can never start a JSON document,
+so plain JSON values written before the header existed are still readable.
+"""
+import gzip
+import json
+from datetime import date, datetime
+from typing import Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Try to import the optional fast codecs
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+CODEC_VERSION = 1
+
+FORMAT_JSON = 0
+FORMAT_MSGPACK = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_GZIP = 1
+COMPRESSION_ZSTD = 2
+
+# Tags used to round-trip datetimes through JSON
+DATETIME_TAG = "$dt"
+DATE_TAG = "$d"
+_TAG_MARKER = b'"$d'
+
+# msgpack extension type codes
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+
+
+class CacheCodecError(Exception):
+    """Raised when a value cannot be encoded or a payload cannot be decoded"""
+
+
+def _json_default(value: Any) -> Any:
+    """Tag datetimes so they survive a JSON round-trip"""
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    if isinstance(value, date):
+        return {DATE_TAG: value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not cacheable")
+
+
+def _json_object_hook(obj: dict) -> Any:
+    """Revive tagged datetimes (stdlib json decoder hook)"""
+    if len(obj) == 1:
+        if DATETIME_TAG in obj:
+            return datetime.fromisoformat(obj[DATETIME_TAG])
+        if DATE_TAG in obj:
+            return date.fromisoformat(obj[DATE_TAG])
+    return obj
+
+
+def _revive(value: Any) -> Any:
+    """Revive tagged datetimes in an already decoded structure"""
+    if isinstance(value, dict):
+        if len(value) == 1:
+            revived = _json_object_hook(value)
+            if revived is not value:
+                return revived
+        return {k: _revive(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_revive(v) for v in value]
+    return value
+
+
+def _msgpack_default(value: Any) -> Any:
+    """Encode datetimes as msgpack extension types"""
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, date):
+        return msgpack.ExtType(_EXT_DATE, value.isoformat().encode())
+    raise TypeError(f"Object of type {type(value).__name__} is not cacheable")
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    """Decode msgpack extension types"""
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+class CacheCodec:
+    """Encode and decode cache values with an optional compression step"""
+
+    def __init__(
+        self,
+        fmt: str = "auto",
+        compression: str = "auto",
+        compression_threshold: int = 1024,
+        compression_level: int = 3
+    ):
+        self.format = self._resolve_format(fmt)
+        self.compression = self._resolve_compression(compression)
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+
+        if self.compression == COMPRESSION_ZSTD:
+            self._zstd_compressor = zstandard.ZstdCompressor(level=compression_level)
+        if ZSTD_AVAILABLE:
+            self._zstd_decompressor = zstandard.ZstdDecompressor()
+
+    @staticmethod
+    def _resolve_format(fmt: str) -> int:
+        """Map a configured format name to a format id"""
+        fmt = (fmt or "auto").lower()
+        if fmt == "msgpack":
+            if MSGPACK_AVAILABLE:
+                return FORMAT_MSGPACK
+            logger.warning("msgpack not installed. Falling back to JSON cache codec.")
+        elif fmt not in ("auto", "json", "orjson"):
+            logger.warning(f"Unknown cache codec '{fmt}'. Falling back to JSON.")
+        return FORMAT_JSON
+
+    @staticmethod
+    def _resolve_compression(compression: str) -> int:
+        """Map a configured compression name to a compression id"""
+        compression = (compression or "auto").lower()
+        if compression in ("none", "off", ""):
+            return COMPRESSION_NONE
+        if compression == "gzip":
+            return COMPRESSION_GZIP
+        if compression in ("zstd", "auto"):
+            if ZSTD_AVAILABLE:
+                return COMPRESSION_ZSTD
+            if compression == "zstd":
+                logger.warning("zstandard not installed. Falling back to gzip cache compression.")
+            return COMPRESSION_GZIP
+        logger.warning(f"Unknown cache compression '{compression}'. Compression disabled.")
+        return COMPRESSION_NONE
+
+    def _serialize(self, value: Any) -> bytes:
+        if self.format == FORMAT_MSGPACK:
+            return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(
+                value,
+                default=_json_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            )
+        return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+    def _compress(self, data: bytes) -> tuple[int, bytes]:
+        if self.compression == COMPRESSION_NONE or len(data) < self.compression_threshold:
+            return COMPRESSION_NONE, data
+        if self.compression == COMPRESSION_ZSTD:
+            return COMPRESSION_ZSTD, self._zstd_compressor.compress(data)
+        return COMPRESSION_GZIP, gzip.compress(data, compresslevel=min(self.compression_level, 9))
+
+    def encode(self, value: Any) -> bytes:
+        """
+        Serialize a value for storage
+
+        Raises:
+            CacheCodecError if the value cannot be serialized
+        """
+        try:
+            data = self._serialize(value)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise CacheCodecError(f"Cannot serialize {type(value).__name__}: {e}") from e
+
+        compression, data = self._compress(data)
+        header = (CODEC_VERSION << 4) | (self.format << 2) | compression
+        return bytes((header,)) + data
+
+    def decode(self, payload: bytes) -> Any:
+        """
+        Deserialize a stored payload
+
+        Raises:
+            CacheCodecError if the payload is corrupt or uses an unknown format
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if not payload:
+            raise CacheCodecError("Empty cache payload")
+
+        header = payload[0]
+        try:
+            if header >> 4 != CODEC_VERSION:
+                # Legacy payload written as plain JSON text
+                return json.loads(payload, object_hook=_json_object_hook)
+
+            fmt = (header >> 2) & 0x03
+            compression = header & 0x03
+            data = payload[1:]
+
+            if compression == COMPRESSION_GZIP:
+                data = gzip.decompress(data)
+            elif compression == COMPRESSION_ZSTD:
+                if not ZSTD_AVAILABLE:
+                    raise CacheCodecError("zstd payload but zstandard is not installed")
+                data = self._zstd_decompressor.decompress(data)
+            elif compression != COMPRESSION_NONE:
+                raise CacheCodecError(f"Unknown compression id {compression}")
+
+            if fmt == FORMAT_MSGPACK:
+                if not MSGPACK_AVAILABLE:
+                    raise CacheCodecError("msgpack payload but msgpack is not installed")
+                return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False)
+            if fmt != FORMAT_JSON:
+                raise CacheCodecError(f"Unknown format id {fmt}")
+
+            if ORJSON_AVAILABLE:
+                value = orjson.loads(data)
+                # Only walk the structure when it actually contains tagged dates
+                return _revive(value) if _TAG_MARKER in data else value
+            return json.loads(data, object_hook=_json_object_hook)
+        except CacheCodecError:
+            raise
+        except Exception as e:
+            raise CacheCodecError(f"Cannot decode cache payload: {e}") from e
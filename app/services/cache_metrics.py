@@ -0,0 +1,122 @@
+"""
+Per key-prefix cache metrics
+
+Keys are grouped by the text before their first colon, so ``uspto_query:*``,
+``patent:*`` and ``rate_limit:*`` each get their own counters and latency
+histogram.
+"""
+import bisect
+import threading
+from typing import Optional
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+COUNTERS = (
+    "hits",
+    "misses",
+    "l1_hits",
+    "writes",
+    "deletes",
+    "errors",
+    "serialization_errors",
+    "deserialization_errors",
+    "bytes_read",
+    "bytes_written",
+)
+
+
+def key_prefix(key: str) -> str:
+    """Metrics group for a cache key"""
+    prefix, sep, _ = key.partition(":")
+    return prefix if sep else "other"
+
+
+class CacheMetrics:
+    """Thread-safe counters and latency histograms per key prefix"""
+
+    def __init__(self, max_prefixes: int = 50):
+        self.max_prefixes = max_prefixes
+        self._prefixes: dict = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, prefix: str) -> dict:
+        entry = self._prefixes.get(prefix)
+        if entry is None:
+            if len(self._prefixes) >= self.max_prefixes:
+                # Bound cardinality if callers invent many prefixes
+                prefix = "other"
+                entry = self._prefixes.get(prefix)
+            if entry is None:
+                entry = {name: 0 for name in COUNTERS}
+                entry["operations"] = 0
+                entry["latency_sum_ms"] = 0.0
+                entry["latency_buckets"] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                self._prefixes[prefix] = entry
+        return entry
+
+    def record(self, key: str, latency_ms: Optional[float] = None, **counts: int):
+        """
+        Record counters (and optionally one Redis call latency) for key
+
+        Args:
+            key: Cache key; only its prefix is used
+            latency_ms: Duration of the Redis call
+            **counts: Increments for any of COUNTERS
+        """
+        with self._lock:
+            entry = self._entry(key_prefix(key))
+            for name, value in counts.items():
+                if value:
+                    entry[name] += value
+            if latency_ms is not None:
+                entry["operations"] += 1
+                entry["latency_sum_ms"] += latency_ms
+                entry["latency_buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def reset(self):
+        """Clear every counter"""
+        with self._lock:
+            self._prefixes.clear()
+
+    @staticmethod
+    def _percentile(buckets: list, total: int, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given percentile"""
+        if not total:
+            return None
+        threshold = total * fraction
+        seen = 0
+        for index, count in enumerate(buckets):
+            seen += count
+            if seen >= threshold:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else float("inf")
+        return None
+
+    def snapshot(self) -> dict:
+        """Get metrics per prefix plus totals"""
+        with self._lock:
+            prefixes = {
+                prefix: {**entry, "latency_buckets": list(entry["latency_buckets"])}
+                for prefix, entry in self._prefixes.items()
+            }
+
+        totals = {name: 0 for name in COUNTERS}
+        for entry in prefixes.values():
+            for name in COUNTERS:
+                totals[name] += entry[name]
+            lookups = entry["hits"] + entry["misses"]
+            operations = entry["operations"]
+            entry["hit_ratio"] = round(entry["hits"] / lookups, 4) if lookups else None
+            entry["average_latency_ms"] = round(entry["latency_sum_ms"] / operations, 3) if operations else None
+            entry["p50_latency_ms"] = self._percentile(entry["latency_buckets"], operations, 0.50)
+            entry["p95_latency_ms"] = self._percentile(entry["latency_buckets"], operations, 0.95)
+            entry["p99_latency_ms"] = self._percentile(entry["latency_buckets"], operations, 0.99)
+            entry["latency_sum_ms"] = round(entry["latency_sum_ms"], 3)
+            entry["latency_buckets"] = dict(zip(
+                [str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"],
+                entry["latency_buckets"]
+            ))
+
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else None
+        return {"totals": totals, "prefixes": prefixes}
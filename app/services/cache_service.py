@@ -1,133 +1,996 @@
 """
 Redis caching service
 """
-import json
-from typing import Optional, Any
+from typing import Optional, Any, Awaitable, Callable, Dict, Iterable, List, Tuple, NamedTuple
+from contextlib import contextmanager
 from datetime import timedelta
 from app.config import settings
+from app.services.cache_codec import CacheCodec, CacheCodecError
+from app.services.cache_metrics import CacheMetrics, key_prefix
+from app.services.local_cache import LocalCache, LocalRateLimiter, clone_value
+from app.services.redis_sharding import connection_pools, create_redis_client, pool_stats, tagged_key
+import asyncio
 import logging
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Simple in-memory cache metrics, exposed through the monitoring endpoint
+cache_metrics = {
+    "mode": "local",  # "redis" when connected, "local" when degraded
+    "redis_connected": 0,
+    "reconnect_attempts": 0,
+    "connection_failures": 0,
+    "clients_created": 0,  # Should stay at 1 per process unless Redis drops out
+}
+prefix_metrics = CacheMetrics()
+
+# Process-wide L1 cache shared by every CacheService instance
+local_cache = LocalCache(
+    max_entries=settings.cache_l1_max_entries if settings.cache_l1_enabled else 0,
+    default_ttl=settings.cache_l1_ttl
+)
+_INSTANCE_ID = uuid.uuid4().hex
+_invalidation_listener = None
+
+# Process-wide CacheService, see get_cache_service()
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+# Background revalidation tasks (kept referenced until they finish)
+_background_refreshes = set()
+
+# Degraded mode stores, used while Redis is unreachable
+fallback_cache = LocalCache(max_entries=settings.cache_fallback_max_entries, default_ttl=300)
+fallback_rate_limiter = LocalRateLimiter()
+
+# Generic cell rate algorithm over several windows in one round-trip.
+# KEYS: one theoretical-arrival-time key per window
+# ARGV: cost, then limit and period (ms) for each window
+# Returns: allowed flag, then remaining / reset_ms / retry_after_ms per window
+RATE_LIMIT_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local allowed = 1
+local state = {}
+
+for i = 1, #KEYS do
+    local limit = tonumber(ARGV[i * 2])
+    local period = tonumber(ARGV[i * 2 + 1])
+    local interval = period / limit
+    local tat = tonumber(redis.call('GET', KEYS[i])) or now
+    if tat < now then
+        tat = now
+    end
+    local new_tat = math.ceil(tat + interval * cost)
+    local retry_after = new_tat - period - now
+    if retry_after > 0 then
+        allowed = 0
+    else
+        retry_after = 0
+    end
+    state[i] = {tat, new_tat, interval, period, retry_after}
+end
+
+local result = {allowed}
+for i = 1, #KEYS do
+    local tat, new_tat, interval, period, retry_after = unpack(state[i])
+    if allowed == 1 then
+        tat = new_tat
+        redis.call('SET', KEYS[i], string.format('%d', new_tat), 'PX', math.max(new_tat - now, 1))
+    end
+    local remaining = math.floor((period - (tat - now)) / interval)
+    if remaining < 0 then
+        remaining = 0
+    end
+    result[#result + 1] = remaining
+    result[#result + 1] = math.ceil(tat - now)
+    result[#result + 1] = math.ceil(retry_after)
+end
+return result
+"""
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a rate limit check for the most restrictive window"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # Seconds until the window is fully replenished
+    retry_after: float  # Seconds until the next request is allowed (0 if allowed)
+
+
 # Try to import redis, but make it optional
 try:
     import redis
     REDIS_AVAILABLE = True
+    CONNECTION_ERRORS = (
+        redis.ConnectionError,
+        redis.TimeoutError,
+        getattr(redis.exceptions, "ClusterDownError", redis.ConnectionError),
+    )
 except ImportError:
     REDIS_AVAILABLE = False
+    CONNECTION_ERRORS = ()
     logger.warning("Redis not installed. Caching and rate limiting will be disabled. Install with: pip install redis")
 
 
+def _soft_ttl_envelope(value: Any, soft_ttl: int, stale_ttl: Optional[int]) -> Tuple[dict, int]:
+    """Wrap value with its soft expiry; returns (envelope, hard ttl)"""
+    stale_ttl = settings.cache_stale_ttl if stale_ttl is None else stale_ttl
+    return {"value": value, "soft_expires_at": time.time() + soft_ttl}, soft_ttl + stale_ttl
+
+
+class CacheBatch:
+    """
+    Cache operations queued and executed in a single round-trip
+    
+    Use through CacheService.pipeline():
+    
+        with cache.pipeline() as batch:
+            batch.get("a")
+            batch.set("b", value, ttl=60)
+        batch.results  # [value_of_a, True]
+    """
+    
+    def __init__(self, cache: "CacheService"):
+        self.cache = cache
+        self.operations: List[Tuple[str, tuple]] = []
+        self.results: List[Any] = []
+    
+    def get(self, key: str) -> "CacheBatch":
+        self.operations.append(("get", (key,)))
+        return self
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> "CacheBatch":
+        self.operations.append(("set", (key, value, ttl or self.cache.default_ttl)))
+        return self
+    
+    def set_with_soft_ttl(
+        self,
+        key: str,
+        value: Any,
+        soft_ttl: int,
+        stale_ttl: Optional[int] = None
+    ) -> "CacheBatch":
+        envelope, ttl = _soft_ttl_envelope(value, soft_ttl, stale_ttl)
+        return self.set(key, envelope, ttl=ttl)
+    
+    def delete(self, key: str) -> "CacheBatch":
+        self.operations.append(("delete", (key,)))
+        return self
+    
+    def exists(self, key: str) -> "CacheBatch":
+        self.operations.append(("exists", (key,)))
+        return self
+    
+    def increment(self, key: str, amount: int = 1) -> "CacheBatch":
+        self.operations.append(("increment", (key, amount)))
+        return self
+    
+    def set_expiry(self, key: str, seconds: int) -> "CacheBatch":
+        self.operations.append(("set_expiry", (key, seconds)))
+        return self
+    
+    def execute(self) -> List[Any]:
+        """Run every queued operation; results are in queue order"""
+        operations, self.operations = self.operations, []
+        self.results = self.cache._execute_batch(operations)
+        return self.results
+
+
 class CacheService:
-    """Redis cache service for patent data and rate limiting"""
+    """
+    Redis cache service for patent data and rate limiting
+    
+    When Redis is unreachable the service degrades to an in-process TTL cache
+    and per-worker rate limiting, and reconnects automatically once Redis is
+    back (at most one attempt every redis_reconnect_interval seconds).
+    """
     
     def __init__(self):
+        self.codec = CacheCodec(
+            fmt=settings.cache_codec,
+            compression=settings.cache_compression,
+            compression_threshold=settings.cache_compression_threshold
+        )
+        self.default_ttl = settings.redis_cache_ttl
+        
+        # In-process L1 for hot keys, kept coherent across workers via pub/sub
+        self.local_cache = local_cache
+        self.l1_prefixes = tuple(
+            prefix.strip() for prefix in settings.cache_l1_prefixes.split(",") if prefix.strip()
+        )
+        self.instance_id = _INSTANCE_ID
+        
+        self.fallback_cache = fallback_cache
+        self.fallback_rate_limiter = fallback_rate_limiter
+        
+        self.redis_client = None
+        self._rate_limit_script = None
+        self._last_connect_attempt = 0.0
+        self._connect_lock = threading.Lock()
+        
         if not REDIS_AVAILABLE:
-            self.redis_client = None
-            self.default_ttl = settings.redis_cache_ttl
-            logger.warning("Redis not available. Running without cache.")
+            logger.warning("Redis not available. Running with in-process cache only.")
             return
         
+        self._connect()
+    
+    def _connect(self) -> bool:
+        """Connect to Redis; returns True when the connection is usable"""
+        self._last_connect_attempt = time.monotonic()
         try:
-            self.redis_client = redis.from_url(
+            client = create_redis_client(
                 settings.redis_url,
-                decode_responses=True,
-                socket_connect_timeout=5
+                urls=settings.redis_urls,
+                cluster=settings.redis_cluster,
+                pool_timeout=settings.redis_pool_timeout,
+                decode_responses=False,
+                max_connections=settings.redis_max_connections,
+                socket_timeout=settings.redis_socket_timeout,
+                socket_connect_timeout=settings.redis_socket_connect_timeout,
+                health_check_interval=settings.redis_health_check_interval
             )
             # Test connection
-            self.redis_client.ping()
-            self.default_ttl = settings.redis_cache_ttl
-            logger.info("Redis connection established")
+            client.ping()
         except Exception as e:
-            logger.warning(f"Failed to connect to Redis: {e}. Running without cache.")
+            logger.warning(f"Failed to connect to Redis: {e}. Running with in-process cache.")
+            self._set_mode(False)
+            return False
+        
+        self.redis_client = client
+        cache_metrics["clients_created"] += 1
+        self._rate_limit_script = client.register_script(RATE_LIMIT_SCRIPT)
+        # Invalidations published while we were away were missed
+        self.local_cache.clear()
+        self.fallback_cache.clear()
+        self._set_mode(True)
+        logger.info("Redis connection established")
+        self._start_invalidation_listener()
+        return True
+    
+    def _set_mode(self, connected: bool):
+        """Update the connection mode gauge"""
+        cache_metrics["mode"] = "redis" if connected else "local"
+        cache_metrics["redis_connected"] = 1 if connected else 0
+    
+    def _client(self):
+        """Get the Redis client, attempting a throttled reconnect when down"""
+        if self.redis_client is not None or not REDIS_AVAILABLE:
+            return self.redis_client
+        if time.monotonic() - self._last_connect_attempt < settings.redis_reconnect_interval:
+            return None
+        if not self._connect_lock.acquire(blocking=False):
+            return None
+        try:
+            cache_metrics["reconnect_attempts"] += 1
+            self._connect()
+        finally:
+            self._connect_lock.release()
+        return self.redis_client
+    
+    def _handle_error(self, e: Exception, operation: str):
+        """Switch to degraded mode on connection errors"""
+        if isinstance(e, CONNECTION_ERRORS):
+            if self.redis_client is not None:
+                logger.warning(f"Lost Redis connection during {operation}: {e}. Switching to in-process cache.")
+            cache_metrics["connection_failures"] += 1
             self.redis_client = None
-            self.default_ttl = settings.redis_cache_ttl
+            self._last_connect_attempt = time.monotonic()
+            self._set_mode(False)
+        else:
+            logger.warning(f"Redis {operation} failed: {e}")
+    
+    def close(self):
+        """Stop the invalidation listener and release pooled connections"""
+        global _invalidation_listener
+        if _invalidation_listener is not None:
+            try:
+                _invalidation_listener.stop()
+            except Exception as e:
+                logger.warning(f"Failed to stop cache invalidation listener: {e}")
+            _invalidation_listener = None
+        client, self.redis_client = self.redis_client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Failed to close Redis client: {e}")
+        self._set_mode(False)
+    
+    def pool_stats(self) -> Optional[dict]:
+        """Connection pool size and usage, None when not connected"""
+        if self.redis_client is None:
+            return None
+        try:
+            return pool_stats(connection_pools(self.redis_client))
+        except Exception as e:
+            logger.debug(f"Connection pool stats unavailable: {e}")
+            return None
+    
+    @property
+    def is_degraded(self) -> bool:
+        """True when running on the in-process fallback"""
+        return self.redis_client is None
+    
+    def _is_l1_key(self, key: str) -> bool:
+        """Check whether key is eligible for the in-process L1 cache"""
+        return self.local_cache.max_entries > 0 and key.startswith(self.l1_prefixes)
+    
+    def _start_invalidation_listener(self):
+        """Subscribe to L1 invalidation messages from other workers"""
+        global _invalidation_listener
+        if self.local_cache.max_entries <= 0 or _invalidation_listener is not None:
+            return
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{settings.cache_invalidation_channel: self._handle_invalidation})
+            _invalidation_listener = pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=self._handle_listener_error
+            )
+        except Exception as e:
+            logger.warning(f"Failed to subscribe to cache invalidations: {e}. L1 cache disabled.")
+            self.local_cache.max_entries = 0
+    
+    def _handle_listener_error(self, e: Exception, pubsub, thread):
+        """Keep the listener alive across Redis outages"""
+        logger.warning(f"Cache invalidation listener error: {e}")
+        # Messages may have been missed, so L1 can no longer be trusted
+        self.local_cache.clear()
+        time.sleep(settings.redis_reconnect_interval)
+    
+    def _handle_invalidation(self, message: dict):
+        """Drop keys invalidated by another worker from L1"""
+        data = message.get("data")
+        if isinstance(data, bytes):
+            data = data.decode()
+        origin, _, keys = str(data).partition("|")
+        if origin == self.instance_id:
+            return
+        for key in keys.split("\n"):
+            if key == "*":
+                self.local_cache.clear()
+            else:
+                self.local_cache.delete(key)
+    
+    def _publish_invalidation(self, client, keys):
+        """Tell other workers to drop one or more keys from their L1"""
+        if isinstance(keys, str):
+            keys = [keys]
+        try:
+            client.publish(settings.cache_invalidation_channel, f"{self.instance_id}|" + "\n".join(keys))
+        except Exception as e:
+            self._handle_error(e, "publish")
+    
+    def invalidate_local(self, key: Optional[str] = None):
+        """Drop one key (or everything) from L1 on every worker"""
+        if key is None:
+            self.local_cache.clear()
+        else:
+            self.local_cache.delete(key)
+        client = self._client()
+        if client is not None:
+            self._publish_invalidation(client, key or "*")
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        if not self.redis_client:
-            return None
+        client = self._client()
+        if client is None:
+            value = self.fallback_cache.get(key)
+            prefix_metrics.record(key, hits=value is not None, misses=value is None)
+            return clone_value(value)
+        l1 = self._is_l1_key(key)
+        if l1:
+            value = self.local_cache.get(key)
+            if value is not None:
+                prefix_metrics.record(key, hits=1, l1_hits=1)
+                return clone_value(value)
+        started = time.perf_counter()
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
+            value = client.get(key)
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "get")
             return None
-        except Exception:
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000)
+        decoded = self._decode(key, value)
+        prefix_metrics.record(key, hits=decoded is not None, misses=decoded is None)
+        if decoded is None:
             return None
+        if l1:
+            self.local_cache.set(key, clone_value(decoded))
+        return decoded
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache with optional TTL"""
-        if not self.redis_client:
+        ttl = ttl or self.default_ttl
+        client = self._client()
+        if client is None:
+            self.fallback_cache.set(key, clone_value(value), ttl=ttl)
+            prefix_metrics.record(key, writes=1)
+            return True
+        serialized = self._encode(key, value)
+        if serialized is None:
             return False
+        started = time.perf_counter()
         try:
-            ttl = ttl or self.default_ttl
-            serialized = json.dumps(value)
-            return self.redis_client.setex(key, ttl, serialized)
-        except Exception:
+            stored = bool(client.setex(key, ttl, serialized))
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "set")
             return False
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000, writes=1)
+        if self._is_l1_key(key):
+            self.local_cache.set(key, clone_value(value), ttl=min(ttl, self.local_cache.default_ttl))
+            self._publish_invalidation(client, key)
+        return stored
     
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
-        if not self.redis_client:
-            return False
+        client = self._client()
+        if client is None:
+            return self.fallback_cache.delete(key)
+        started = time.perf_counter()
         try:
-            return bool(self.redis_client.delete(key))
-        except Exception:
+            deleted = bool(client.delete(key))
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "delete")
+            if self._is_l1_key(key):
+                self.local_cache.delete(key)
             return False
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000, deletes=1)
+        if self._is_l1_key(key):
+            # Only once Redis no longer has the value, or a peer could refill its L1 with it
+            self.local_cache.delete(key)
+            self._publish_invalidation(client, key)
+        return deleted
     
     def exists(self, key: str) -> bool:
         """Check if key exists in cache"""
-        if not self.redis_client:
-            return False
+        client = self._client()
+        if client is None:
+            return self.fallback_cache.get(key) is not None
+        started = time.perf_counter()
         try:
-            return bool(self.redis_client.exists(key))
-        except Exception:
+            found = bool(client.exists(key))
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "exists")
             return False
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000)
+        return found
     
     def increment(self, key: str, amount: int = 1) -> int:
-        """Increment counter (for rate limiting)"""
-        if not self.redis_client:
-            return 0
+        """Increment counter"""
+        client = self._client()
+        if client is None:
+            count = (self.fallback_cache.get(key) or 0) + amount
+            self.fallback_cache.set(key, count, ttl=self.default_ttl)
+            return count
+        started = time.perf_counter()
         try:
-            return self.redis_client.incrby(key, amount)
-        except Exception:
+            count = client.incrby(key, amount)
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "increment")
             return 0
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000, writes=1)
+        return count
     
     def set_expiry(self, key: str, seconds: int) -> bool:
         """Set expiry on existing key"""
-        if not self.redis_client:
+        client = self._client()
+        if client is None:
+            value = self.fallback_cache.get(key)
+            if value is None:
+                return False
+            self.fallback_cache.set(key, value, ttl=seconds)
+            return True
+        started = time.perf_counter()
+        try:
+            updated = bool(client.expire(key, seconds))
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "expire")
             return False
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000)
+        return updated
+    
+    def acquire_lock(self, key: str, ttl: int) -> bool:
+        """
+        Take a short-lived lock shared by every worker (SET NX)
+        
+        The lock is never released explicitly; it expires after ttl seconds.
+        While Redis is down the lock only covers this process.
+        """
+        client = self._client()
+        if client is None:
+            if self.fallback_cache.get(key) is not None:
+                return False
+            self.fallback_cache.set(key, self.instance_id, ttl=ttl)
+            return True
+        started = time.perf_counter()
         try:
-            return bool(self.redis_client.expire(key, seconds))
-        except Exception:
+            acquired = bool(client.set(key, self.instance_id, nx=True, ex=max(int(ttl), 1)))
+        except Exception as e:
+            prefix_metrics.record(key, errors=1)
+            self._handle_error(e, "lock")
             return False
+        prefix_metrics.record(key, latency_ms=(time.perf_counter() - started) * 1000)
+        return acquired
     
-    def get_rate_limit_count(self, api_key: str, window: str = "minute") -> int:
-        """Get current rate limit count for API key"""
-        if not self.redis_client:
-            return 0
-        key = f"rate_limit:{api_key}:{window}"
+    def get_with_staleness(self, key: str) -> Tuple[Optional[Any], bool]:
+        """
+        Get a value stored with set_with_soft_ttl
+        
+        Returns:
+            (value, is_stale); value is None on a miss. Values written
+            without a soft TTL are returned as fresh.
+        """
+        envelope = self.get(key)
+        if envelope is None:
+            return None, False
+        if isinstance(envelope, dict) and "soft_expires_at" in envelope and "value" in envelope:
+            return envelope["value"], time.time() >= envelope["soft_expires_at"]
+        return envelope, False
+    
+    def set_with_soft_ttl(
+        self,
+        key: str,
+        value: Any,
+        soft_ttl: int,
+        stale_ttl: Optional[int] = None
+    ) -> bool:
+        """
+        Store a value that goes stale after soft_ttl but is kept for stale_ttl more
+        
+        Stale values can still be served while a refresh runs in the
+        background (stale-while-revalidate).
+        """
+        envelope, ttl = _soft_ttl_envelope(value, soft_ttl, stale_ttl)
+        return self.set(key, envelope, ttl=ttl)
+    
+    def revalidate(self, key: str, refresh: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Refresh a stale key in the background
+        
+        A short lock makes sure only one worker refreshes a given key.
+        
+        Args:
+            key: Stale cache key
+            refresh: Coroutine factory that recomputes and stores the value
+            
+        Returns:
+            True if this call scheduled the refresh
+        """
         try:
-            count = self.redis_client.get(key)
-            return int(count) if count else 0
-        except (ValueError, Exception):
-            return 0
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if not self.acquire_lock(f"lock:revalidate:{key}", ttl=settings.cache_revalidate_lock_ttl):
+            return False
+        
+        async def run():
+            try:
+                await refresh()
+            except Exception as e:
+                logger.warning(f"Background refresh of {key} failed: {e}")
+        
+        task = loop.create_task(run())
+        _background_refreshes.add(task)
+        task.add_done_callback(_background_refreshes.discard)
+        return True
     
-    def increment_rate_limit(self, api_key: str, window: str = "minute", ttl: int = 60) -> int:
-        """Increment rate limit counter"""
-        if not self.redis_client:
-            return 0
-        key = f"rate_limit:{api_key}:{window}"
+    def mget(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get many values in one round-trip
+        
+        Returns:
+            Dict of key -> value for keys that were found
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        client = self._client()
+        if client is None:
+            found = {key: self.fallback_cache.get(key) for key in keys}
+            for key, value in found.items():
+                prefix_metrics.record(key, hits=value is not None, misses=value is None)
+            return {key: clone_value(value) for key, value in found.items() if value is not None}
+        
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local_cache.get(key) if self._is_l1_key(key) else None
+            if value is not None:
+                prefix_metrics.record(key, hits=1, l1_hits=1)
+                found[key] = clone_value(value)
+            else:
+                remote_keys.append(key)
+        if not remote_keys:
+            return found
+        
+        started = time.perf_counter()
         try:
-            count = self.redis_client.incr(key)
-            if count == 1:  # First request, set expiry
-                self.redis_client.expire(key, ttl)
-            return count
-        except Exception:
+            # Cluster clients cannot MGET across slots in one command
+            mget = getattr(client, "mget_nonatomic", client.mget)
+            values = mget(remote_keys)
+        except Exception as e:
+            self._record_latency(remote_keys, None, errors=1)
+            self._handle_error(e, "mget")
+            return found
+        self._record_latency(remote_keys, started)
+        
+        for key, raw in zip(remote_keys, values):
+            value = self._decode(key, raw)
+            prefix_metrics.record(key, hits=value is not None, misses=value is None)
+            if value is None:
+                continue
+            if self._is_l1_key(key):
+                self.local_cache.set(key, clone_value(value))
+            found[key] = value
+        return found
+    
+    def mset_with_ttl(self, items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Set many values with the same TTL in one round-trip"""
+        if not items:
+            return True
+        with self.pipeline() as batch:
+            for key, value in items.items():
+                batch.set(key, value, ttl=ttl)
+        return all(batch.results)
+    
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete many keys in one round-trip; returns number deleted"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
             return 0
+        with self.pipeline() as batch:
+            for key in keys:
+                batch.delete(key)
+        return sum(1 for deleted in batch.results if deleted)
+    
+    def increment_hashes(self, items: Dict[str, Dict[str, float]], ttl: int) -> bool:
+        """
+        Add to numeric hash fields (HINCRBYFLOAT) in one round-trip
+        
+        Redis only: counters are not kept while degraded.
+        
+        Args:
+            items: key -> {field: amount}
+            ttl: Expiry (seconds) refreshed on every written key
+            
+        Returns:
+            True if every increment was applied
+        """
+        client = self._client()
+        if client is None or not items:
+            return client is not None
+        pipe = client.pipeline(transaction=False)
+        for key, fields in items.items():
+            for field, amount in fields.items():
+                if amount:
+                    pipe.hincrbyfloat(key, field, amount)
+            pipe.expire(key, ttl)
+        started = time.perf_counter()
+        try:
+            pipe.execute()
+        except Exception as e:
+            self._record_latency(items, None, errors=1)
+            self._handle_error(e, "increment hashes")
+            return False
+        self._record_latency(items, started, writes=1)
+        return True
+    
+    def get_hashes(self, keys: Iterable[str]) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        Read numeric hashes in one round-trip
+        
+        Returns:
+            key -> {field: value} ({} for missing keys), or None while degraded
+        """
+        keys = list(dict.fromkeys(keys))
+        client = self._client()
+        if client is None:
+            return None
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        started = time.perf_counter()
+        try:
+            replies = pipe.execute() if keys else []
+        except Exception as e:
+            self._record_latency(keys, None, errors=1)
+            self._handle_error(e, "get hashes")
+            return None
+        self._record_latency(keys, started)
+        return {
+            key: {
+                (field.decode() if isinstance(field, bytes) else field): float(value)
+                for field, value in reply.items()
+            }
+            for key, reply in zip(keys, replies)
+        }
+    
+    def replace_hashes(self, items: Dict[str, Dict[str, float]], ttl: int) -> bool:
+        """Overwrite whole hashes (DEL + HSET + EXPIRE) in one round-trip"""
+        client = self._client()
+        if client is None or not items:
+            return client is not None
+        pipe = client.pipeline(transaction=False)
+        for key, fields in items.items():
+            pipe.delete(key)
+            if fields:
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, ttl)
+        started = time.perf_counter()
+        try:
+            pipe.execute()
+        except Exception as e:
+            self._record_latency(items, None, errors=1)
+            self._handle_error(e, "replace hashes")
+            return False
+        self._record_latency(items, started, writes=1)
+        return True
+    
+    @contextmanager
+    def pipeline(self):
+        """Queue cache operations and execute them in one round-trip on exit"""
+        batch = CacheBatch(self)
+        yield batch
+        if batch.operations:
+            batch.execute()
+    
+    def _decode(self, key: str, raw: Optional[bytes]) -> Optional[Any]:
+        """Decode a raw Redis value, counting bytes and failures"""
+        if raw is None:
+            return None
+        try:
+            value = self.codec.decode(raw)
+        except CacheCodecError as e:
+            prefix_metrics.record(key, deserialization_errors=1)
+            logger.warning(f"Failed to decode cached value for {key}: {e}")
+            return None
+        prefix_metrics.record(key, bytes_read=len(raw))
+        return value
+    
+    def _encode(self, key: str, value: Any) -> Optional[bytes]:
+        """Encode a value for Redis, counting bytes and failures"""
+        try:
+            serialized = self.codec.encode(value)
+        except CacheCodecError as e:
+            prefix_metrics.record(key, serialization_errors=1)
+            logger.warning(f"Failed to serialize value for {key}: {e}")
+            return None
+        prefix_metrics.record(key, bytes_written=len(serialized))
+        return serialized
+    
+    def _record_latency(self, keys: Iterable[str], started: Optional[float], **counts: int):
+        """Record one multi-key round-trip against every prefix involved"""
+        latency_ms = (time.perf_counter() - started) * 1000 if started is not None else None
+        seen = set()
+        for key in keys:
+            prefix = key_prefix(key)
+            if prefix not in seen:
+                seen.add(prefix)
+                prefix_metrics.record(key, latency_ms=latency_ms, **counts)
+    
+    def _execute_local_batch(self, operations: List[Tuple[str, tuple]]) -> List[Any]:
+        """Apply queued operations to the in-process fallback"""
+        handlers = {
+            "get": self.get,
+            "set": self.set,
+            "delete": self.delete,
+            "exists": self.exists,
+            "increment": self.increment,
+            "set_expiry": self.set_expiry,
+        }
+        return [handlers[name](*args) for name, args in operations]
+    
+    def _execute_batch(self, operations: List[Tuple[str, tuple]]) -> List[Any]:
+        """Execute queued operations in a single Redis pipeline"""
+        client = self._client()
+        if client is None:
+            return self._execute_local_batch(operations)
+        
+        pipe = client.pipeline(transaction=False)
+        results: List[Any] = [None] * len(operations)
+        pending = []  # Indexes of operations sent to Redis
+        invalidated = []
+        
+        for index, (name, args) in enumerate(operations):
+            key = args[0]
+            if name == "get":
+                value = self.local_cache.get(key) if self._is_l1_key(key) else None
+                if value is not None:
+                    prefix_metrics.record(key, hits=1, l1_hits=1)
+                    results[index] = clone_value(value)
+                    continue
+                pipe.get(key)
+            elif name == "set":
+                _, value, ttl = args
+                serialized = self._encode(key, value)
+                if serialized is None:
+                    results[index] = False
+                    continue
+                pipe.setex(key, ttl, serialized)
+            elif name == "delete":
+                pipe.delete(key)
+                if self._is_l1_key(key):
+                    self.local_cache.delete(key)
+            elif name == "exists":
+                pipe.exists(key)
+            elif name == "increment":
+                pipe.incrby(key, args[1])
+            elif name == "set_expiry":
+                pipe.expire(key, args[1])
+            pending.append(index)
+        
+        if not pending:
+            return results
+        pending_keys = [operations[index][1][0] for index in pending]
+        started = time.perf_counter()
+        try:
+            replies = pipe.execute(raise_on_error=False)
+        except Exception as e:
+            self._record_latency(pending_keys, None, errors=1)
+            self._handle_error(e, "pipeline")
+            return results
+        self._record_latency(pending_keys, started)
+        
+        for index, reply in zip(pending, replies):
+            name, args = operations[index]
+            if isinstance(reply, Exception):
+                prefix_metrics.record(args[0], errors=1)
+                logger.warning(f"Redis {name} failed for {args[0]}: {reply}")
+                continue
+            if name == "get":
+                value = self._decode(args[0], reply)
+                prefix_metrics.record(args[0], hits=value is not None, misses=value is None)
+                if value is not None and self._is_l1_key(args[0]):
+                    self.local_cache.set(args[0], clone_value(value))
+                results[index] = value
+            elif name == "increment":
+                prefix_metrics.record(args[0], writes=1)
+                results[index] = int(reply)
+            else:
+                # L1 follows Redis only for writes Redis actually applied
+                if name == "set":
+                    prefix_metrics.record(args[0], writes=1)
+                    if self._is_l1_key(args[0]):
+                        _, value, ttl = args
+                        self.local_cache.set(args[0], clone_value(value), ttl=min(ttl, self.local_cache.default_ttl))
+                        invalidated.append(args[0])
+                elif name == "delete":
+                    prefix_metrics.record(args[0], deletes=1)
+                    if self._is_l1_key(args[0]):
+                        self.local_cache.delete(args[0])
+                        invalidated.append(args[0])
+                results[index] = bool(reply)
+        if invalidated:
+            self._publish_invalidation(client, invalidated)
+        return results
+    
+    def _rate_limit_key(self, api_key: str, window: str) -> str:
+        """Redis key holding the GCRA state for one rate limit window"""
+        # Hash-tagged so every window of a key lives on the same node
+        return tagged_key("rate_limit", api_key, window)
+    
+    def _consume_local_rate_limit(
+        self,
+        api_key: str,
+        windows: List[Tuple[str, int, int]],
+        cost: int
+    ) -> RateLimitResult:
+        """Approximate per-worker rate limiting while Redis is down"""
+        workers = max(settings.rate_limit_fallback_workers, 1)
+        local_windows = [(name, max(int(limit) // workers, 1), period) for name, limit, period in windows]
+        allowed, state = self.fallback_rate_limiter.consume(api_key, local_windows, cost)
+        
+        results = [
+            RateLimitResult(allowed, limit, remaining, reset_after, retry_after)
+            for (_, limit, _), (remaining, reset_after, retry_after) in zip(windows, state)
+        ]
+        if allowed:
+            return min(results, key=lambda r: r.remaining)
+        return max(results, key=lambda r: r.retry_after)
+    
+    def consume_rate_limit(
+        self,
+        api_key: str,
+        windows: List[Tuple[str, int, int]],
+        cost: int = 1
+    ) -> RateLimitResult:
+        """
+        Atomically check and consume quota in every rate limit window
+        
+        Runs a single server-side GCRA script, so all windows are checked and
+        updated in one round-trip and concurrent requests cannot race past
+        the limit. Quota is only consumed when every window allows it.
+        Falls back to per-worker limiting when Redis is unreachable.
+        
+        Args:
+            api_key: API key string
+            windows: (name, limit, period_seconds) for each window
+            cost: Units of quota to consume
+            
+        Returns:
+            RateLimitResult for the most restrictive window
+        """
+        client = self._client()
+        if client is None:
+            return self._consume_local_rate_limit(api_key, windows, cost)
+        
+        keys = [self._rate_limit_key(api_key, name) for name, _, _ in windows]
+        args = [cost]
+        for _, limit, period in windows:
+            args.extend([max(int(limit), 1), int(period) * 1000])
+        
+        started = time.perf_counter()
+        try:
+            reply = self._rate_limit_script(keys=keys, args=args, client=client)
+        except Exception as e:
+            prefix_metrics.record(keys[0], errors=1)
+            self._handle_error(e, "rate limit")
+            return self._consume_local_rate_limit(api_key, windows, cost)
+        prefix_metrics.record(keys[0], latency_ms=(time.perf_counter() - started) * 1000)
+        
+        allowed = bool(int(reply[0]))
+        results = []
+        for i, (_, limit, _) in enumerate(windows):
+            remaining, reset_ms, retry_ms = (int(v) for v in reply[1 + i * 3:4 + i * 3])
+            results.append(RateLimitResult(allowed, limit, remaining, reset_ms / 1000, retry_ms / 1000))
+        
+        if allowed:
+            return min(results, key=lambda r: r.remaining)
+        return max(results, key=lambda r: r.retry_after)
     
     def reset_rate_limit(self, api_key: str, window: str = "minute") -> bool:
-        """Reset rate limit counter"""
-        key = f"rate_limit:{api_key}:{window}"
+        """Reset rate limit state"""
+        self.fallback_rate_limiter.reset(api_key, window)
+        key = self._rate_limit_key(api_key, window)
         return self.delete(key)
 
+
+def get_cache_service() -> CacheService:
+    """
+    Get the process-wide CacheService
+    
+    Every caller shares one Redis connection pool. The first call connects
+    (normally during app startup); close_cache_service() releases it.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = CacheService()
+    return _shared_cache
+
+
+def close_cache_service():
+    """Close the process-wide CacheService (app shutdown)"""
+    global _shared_cache
+    with _shared_cache_lock:
+        cache, _shared_cache = _shared_cache, None
+    if cache is not None:
+        cache.close()
+
+
+def get_cache_metrics() -> dict:
+    """Get current cache metrics"""
+    result = dict(cache_metrics)
+    result.update(prefix_metrics.snapshot())
+    result["l1"] = local_cache.stats()
+    result["fallback"] = fallback_cache.stats()
+    result["pool"] = _shared_cache.pool_stats() if _shared_cache is not None else None
+    return result
@@ -0,0 +1,442 @@
+"""
+Expiration query service: local store or USPTO lookup, AI enrichment and response caching
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, List, Dict, Optional, Tuple
+import asyncio
+import base64
+import json
+import logging
+import time
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.services import patent_store
+from app.services.cache_service import CacheService
+from app.services.uspto_client import USPTOClient
+from app.services.ai_service import AIService
+from app.utils.helpers import parse_industry_keywords
+from app.utils.responses import attach_fragments
+from app.utils.validators import ExpirationQueryParams
+
+logger = logging.getLogger(__name__)
+
+# Industries advertised in the expirations endpoint docs (None = all industries)
+STANDARD_INDUSTRIES = (
+    None, "biotech", "electronics", "software", "medical", "automotive", "energy", "materials"
+)
+STANDARD_DATE_RANGES = ("next_7_days", "next_30_days", "next_90_days", "next_365_days")
+
+CURSOR_VERSION = 1
+
+# Token in every processed-page and meta key; a patent sync replaces it
+GENERATION_KEY = "expirations:generation"
+GENERATION_TTL = 86400 * 30
+
+
+class InvalidCursorError(ValueError):
+    """Raised for cursors that are malformed, belong to another query or outlived the synced data"""
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Opaque, URL-safe pagination cursor"""
+    data = json.dumps({"c": CURSOR_VERSION, **state}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        InvalidCursorError if the cursor is malformed
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if state.pop("c") != CURSOR_VERSION:
+            raise ValueError("unsupported cursor version")
+        state["key"] = (datetime.fromisoformat(state["key"][0]), str(state["key"][1]))
+        state["start"] = datetime.fromisoformat(state["start"])
+        state["end"] = datetime.fromisoformat(state["end"])
+        return state
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}") from e
+
+
+async def _iterate(items: Iterable[Dict]) -> AsyncIterator[Dict]:
+    for item in items:
+        yield item
+
+
+class ExpirationService:
+    """Produces AI-enriched expiration results and caches them per query"""
+
+    def __init__(
+        self,
+        uspto_client: Optional[USPTOClient] = None,
+        ai_service: Optional[AIService] = None,
+        cache: Optional[CacheService] = None,
+        session_factory=AsyncSessionLocal
+    ):
+        self.uspto_client = uspto_client or USPTOClient()
+        self.ai_service = ai_service or AIService()
+        self._cache = cache
+        self.session_factory = session_factory
+
+    @property
+    def cache(self) -> CacheService:
+        return self._cache or self.uspto_client.cache
+
+    def _cache_key(self, query_params: ExpirationQueryParams) -> str:
+        """
+        Cache key for processed results
+
+        Includes the start date so it rolls over at midnight, and the cache
+        generation so a patent sync retires every page and meta entry at once.
+        """
+        start_date, _ = query_params.get_date_range_tuple()
+        generation = self.cache.get(GENERATION_KEY) or 0
+        return (
+            f"expirations:{generation}:{(query_params.industry or 'all').lower()}:{query_params.date_range}:"
+            f"{start_date:%Y-%m-%d}:{query_params.limit}:{query_params.offset}"
+        )
+
+    def invalidate_cached_queries(self) -> bool:
+        """
+        Retire every cached processed page and pagination snapshot
+
+        Called after a patent sync so no query keeps serving pre-sync pages or
+        totals; the old entries simply expire.
+
+        Returns:
+            True if the new generation was stored
+        """
+        return self.cache.set(GENERATION_KEY, time.time_ns(), ttl=GENERATION_TTL)
+
+    async def get_processed_patents(
+        self,
+        query_params: ExpirationQueryParams,
+        refresh: bool = False
+    ) -> List[Dict]:
+        """
+        Get AI-enriched patents for a query
+
+        Args:
+            query_params: Validated query parameters
+            refresh: Skip the response caches and recompute
+
+        Returns:
+            List of processed patent dictionaries
+        """
+        cache_key = self._cache_key(query_params)
+        if not refresh:
+            cached, is_stale = self.cache.get_with_staleness(cache_key)
+            if cached is not None:
+                if is_stale:
+                    # Serve the stale result now, recompute in the background
+                    self.cache.revalidate(
+                        cache_key,
+                        lambda: self.get_processed_patents(query_params, refresh=True)
+                    )
+                return cached
+
+        processed = await self._local_patents(query_params)
+        if processed is None:
+            # Range not synced locally yet
+            start_date, end_date = query_params.get_date_range_tuple()
+            industry_keywords = parse_industry_keywords(query_params.industry)
+
+            patents = await self.uspto_client.get_expiring_patents(
+                start_date=start_date,
+                end_date=end_date,
+                industry_keywords=industry_keywords if industry_keywords else None,
+                limit=query_params.limit,
+                offset=query_params.offset,
+                use_cache=not refresh
+            )
+
+            # Model inference is CPU-bound; keep the event loop serving requests
+            processed = await asyncio.to_thread(self.ai_service.process_patents, patents, industry_keywords)
+
+        # Encoded once here, then spliced into every response served from the cache
+        attach_fragments(processed)
+
+        # Upstream failures also come back empty, so don't pin them in cache
+        if processed:
+            self.cache.set_with_soft_ttl(cache_key, processed, soft_ttl=settings.expirations_cache_ttl)
+
+        return processed
+
+    async def _local_patents(self, query_params: ExpirationQueryParams) -> Optional[List[Dict]]:
+        """
+        Answer a query from the local patent store
+
+        Patents are ordered by (expiration_date, id), the key cursors continue from.
+
+        Returns:
+            Processed patents, or None if the date range is not fully synced
+        """
+        start_date, end_date = query_params.get_date_range_tuple()
+        industry_keywords = parse_industry_keywords(query_params.industry)
+        try:
+            async with self.session_factory() as db:
+                if not await patent_store.async_range_covered(db, start_date, end_date):
+                    return None
+                patents = await patent_store.query_patents(
+                    db, start_date, end_date, query_params.industry, industry_keywords,
+                    limit=query_params.limit, offset=query_params.offset
+                )
+        except Exception as e:
+            logger.warning(f"Local patent store unavailable, querying USPTO: {e}")
+            return None
+        return self._rescore(patents, industry_keywords)
+
+    def _rescore(self, patents: List[Dict], industry_keywords: List[str]) -> List[Dict]:
+        """Stored scores are industry-neutral; rescore (keyword matching only, no summarization)"""
+        if industry_keywords:
+            for patent in patents:
+                patent["relevance_score"] = self.ai_service.calculate_relevance_score(patent, industry_keywords)
+        return patents
+
+    async def get_page(self, query_params: ExpirationQueryParams, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of processed patents with pagination metadata
+
+        Without a cursor this is the (cached) offset page. Pages answered from
+        the local store also carry a cursor that continues after their last
+        (expiration_date, id), so deeper pages are index range scans instead of
+        growing offsets. A cursor pins the date window and remembers the coverage
+        snapshot it was issued under: the total is only recounted once a newer
+        sync replaced that snapshot, and because the ordering key never changes,
+        a refresh between pages neither repeats nor skips patents.
+
+        Args:
+            query_params: Validated query parameters (offset is ignored with a cursor)
+            cursor: next_cursor from a previous page
+
+        Returns:
+            {"patents": [...], "total": int, "next_cursor": str or None}
+
+        Raises:
+            InvalidCursorError if the cursor can't continue this query
+        """
+        if cursor:
+            return await self._cursor_page(query_params, decode_cursor(cursor))
+
+        patents = await self.get_processed_patents(query_params)
+        start_date, end_date = query_params.get_date_range_tuple()
+        meta = await self._snapshot_meta(query_params, start_date, end_date)
+        if meta is None:
+            # Served by USPTO: only a lower bound is known
+            return {"patents": patents, "total": query_params.offset + len(patents), "next_cursor": None}
+
+        state = {"industry": query_params.industry, "start": start_date, "end": end_date, **meta}
+        keys = [(patent["expiration_date"], patent["id"]) for patent in patents]
+        if keys != sorted(keys):
+            # Page cached from USPTO before the range was synced; cursors need key order
+            return {"patents": patents, "total": meta["total"], "next_cursor": None}
+        return {
+            "patents": patents,
+            "total": meta["total"],
+            "next_cursor": self._next_cursor(state, patents, query_params.limit)
+        }
+
+    async def _snapshot_meta(
+        self,
+        query_params: ExpirationQueryParams,
+        start_date: datetime,
+        end_date: datetime
+    ) -> Optional[Dict[str, int]]:
+        """Coverage snapshot and match count of a locally synced query (cached alongside its pages)"""
+        meta_key = f"{self._cache_key(query_params).rsplit(':', 2)[0]}:meta"
+        meta = self.cache.get(meta_key)
+        if meta is not None:
+            return meta
+
+        industry_keywords = parse_industry_keywords(query_params.industry)
+        try:
+            async with self.session_factory() as db:
+                snapshot = await patent_store.coverage_version(db, start_date, end_date)
+                if snapshot is None:
+                    return None
+                total = await patent_store.count_patents(
+                    db, start_date, end_date, query_params.industry, industry_keywords
+                )
+        except Exception as e:
+            logger.warning(f"Local patent store unavailable for pagination metadata: {e}")
+            return None
+
+        meta = {"snapshot": snapshot, "total": total}
+        self.cache.set(meta_key, meta, ttl=settings.expirations_cache_ttl)
+        return meta
+
+    async def _continue_cursor(
+        self,
+        db,
+        query_params: ExpirationQueryParams,
+        state: Dict[str, Any],
+        industry_keywords: List[str]
+    ):
+        """Check a decoded cursor still applies, recounting the total if a newer sync replaced its snapshot"""
+        if (state.get("industry") or "").lower() != (query_params.industry or "").lower():
+            raise InvalidCursorError("Cursor was issued for a different industry")
+
+        # Only the part of the window still ahead of the cursor has to be synced
+        snapshot = await patent_store.coverage_version(db, state["key"][0], state["end"])
+        if snapshot is None:
+            raise InvalidCursorError("Cursor expired; restart pagination without a cursor")
+        if snapshot != state["snapshot"]:
+            # A newer sync may have added or removed matches
+            state["total"] = await patent_store.count_patents(
+                db, state["start"], state["end"], query_params.industry, industry_keywords
+            )
+            state["snapshot"] = snapshot
+
+    async def _cursor_page(self, query_params: ExpirationQueryParams, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Keyset page continuing after state["key"]"""
+        industry_keywords = parse_industry_keywords(query_params.industry)
+        async with self.session_factory() as db:
+            await self._continue_cursor(db, query_params, state, industry_keywords)
+            patents = await patent_store.query_patents(
+                db, state["start"], state["end"], query_params.industry, industry_keywords,
+                limit=query_params.limit, after=state["key"]
+            )
+
+        patents = self._rescore(patents, industry_keywords)
+        return {
+            "patents": patents,
+            "total": state["total"],
+            "next_cursor": self._next_cursor(state, patents, query_params.limit)
+        }
+
+    async def stream_page(self, query_params: ExpirationQueryParams, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Like get_page, but "patents" is an async iterator over rows as the local store returns them
+
+        The key of the page's last row is read from the index first, so the
+        total and next_cursor are known before anything is sent and the stream
+        stops exactly there even if a sync lands meanwhile. Ranges that are not
+        synced locally fall back to the get_page list (at most `limit` patents).
+
+        Raises:
+            InvalidCursorError if the cursor can't continue this query
+        """
+        industry_keywords = parse_industry_keywords(query_params.industry)
+        if cursor:
+            state = decode_cursor(cursor)
+            after, offset = state["key"], 0
+            async with self.session_factory() as db:
+                await self._continue_cursor(db, query_params, state, industry_keywords)
+                boundary = await patent_store.page_boundary(
+                    db, state["start"], state["end"], query_params.industry, industry_keywords,
+                    limit=query_params.limit, after=after
+                )
+        else:
+            start_date, end_date = query_params.get_date_range_tuple()
+            meta = await self._snapshot_meta(query_params, start_date, end_date)
+            if meta is None:
+                page = await self.get_page(query_params)
+                return {**page, "patents": _iterate(page["patents"])}
+            state = {"industry": query_params.industry, "start": start_date, "end": end_date, **meta}
+            after, offset = None, query_params.offset
+            async with self.session_factory() as db:
+                boundary = await patent_store.page_boundary(
+                    db, start_date, end_date, query_params.industry, industry_keywords,
+                    limit=query_params.limit, offset=offset
+                )
+
+        return {
+            "patents": self._stream(state, industry_keywords, query_params.limit, offset, after, boundary),
+            "total": state["total"],
+            "next_cursor": self._cursor_after(state, boundary) if boundary else None
+        }
+
+    async def _stream(
+        self,
+        state: Dict[str, Any],
+        industry_keywords: List[str],
+        limit: int,
+        offset: int,
+        after: Optional[Tuple[datetime, str]],
+        through: Optional[Tuple[datetime, str]]
+    ) -> AsyncIterator[Dict]:
+        async with self.session_factory() as db:
+            async for patent in patent_store.stream_patents(
+                db, state["start"], state["end"], state["industry"], industry_keywords,
+                limit=limit, offset=offset, after=after, through=through
+            ):
+                if industry_keywords:
+                    patent["relevance_score"] = self.ai_service.calculate_relevance_score(patent, industry_keywords)
+                yield patent
+
+    @classmethod
+    def _next_cursor(cls, state: Dict[str, Any], patents: List[Dict], limit: int) -> Optional[str]:
+        """Cursor after the last patent of a full page (None on the last page)"""
+        if len(patents) < limit:
+            return None
+        return cls._cursor_after(state, (patents[-1]["expiration_date"], patents[-1]["id"]))
+
+    @staticmethod
+    def _cursor_after(state: Dict[str, Any], key: Tuple[datetime, str]) -> str:
+        return encode_cursor({
+            "industry": state["industry"],
+            "start": state["start"].isoformat(),
+            "end": state["end"].isoformat(),
+            "snapshot": state["snapshot"],
+            "total": state["total"],
+            "key": [key[0].isoformat(), key[1]],
+        })
+
+    async def get_patent(self, patent_id: str) -> Optional[Dict]:
+        """Get one processed patent: the local store first, then USPTO + AI"""
+        patent = await self.find_patent(patent_id)
+        return self.enrich_patent(patent) if patent else None
+
+    async def find_patent(self, patent_id: str) -> Optional[Dict]:
+        """
+        Look a patent up without AI processing: the stored (already enriched)
+        patent, else the raw USPTO record (cached per patent)
+        """
+        try:
+            async with self.session_factory() as db:
+                patent = await patent_store.get_patent(db, patent_id)
+            if patent is not None:
+                return patent
+        except Exception as e:
+            logger.warning(f"Local patent store unavailable, querying USPTO: {e}")
+        return await self.uspto_client.get_patent_by_id(patent_id)
+
+    def enrich_patent(self, patent: Dict) -> Dict:
+        """AI-process a raw USPTO record from find_patent (stored patents pass through)"""
+        if patent.get("ai_summary") is not None:
+            return patent
+        processed = self.ai_service.process_patents([patent])
+        return processed[0] if processed else patent
+
+    async def warm_standard_queries(self) -> int:
+        """
+        Precompute every standard industry x date_range cell
+
+        Cells are refreshed one at a time with a pause in between so the
+        warm-up never bursts against USPTO.
+
+        Returns:
+            Number of cells warmed
+        """
+        warmed = 0
+        for date_range in STANDARD_DATE_RANGES:
+            for industry in STANDARD_INDUSTRIES:
+                query_params = ExpirationQueryParams(
+                    industry=industry,
+                    date_range=date_range,
+                    limit=settings.cache_warm_limit,
+                    offset=0
+                )
+                try:
+                    await self.get_processed_patents(query_params, refresh=True)
+                    warmed += 1
+                except Exception as e:
+                    logger.warning(f"Failed to warm {industry or 'all'}/{date_range}: {e}")
+                await asyncio.sleep(settings.cache_warm_stagger_seconds)
+
+        logger.info(f"Warmed {warmed} expiration query cells")
+        return warmed
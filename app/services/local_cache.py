@@ -0,0 +1,141 @@
+"""
+In-process caching primitives
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Hashable
+
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe, size-bounded in-process cache with per-entry TTL and LRU eviction"""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value if present and not expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value, evicting least recently used entries when full"""
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove a single entry"""
+        with self._lock:
+            return self._entries.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Get cache statistics"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+def clone_value(value: Any) -> Any:
+    """
+    Copy nested dicts and lists so callers cannot mutate a cached value
+
+    Much cheaper than copy.deepcopy for the JSON-like values we cache;
+    leaf values (str, int, datetime, ...) are immutable and shared.
+    """
+    if isinstance(value, dict):
+        return {k: clone_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone_value(v) for v in value]
+    return value
+
+
+class LocalRateLimiter:
+    """
+    Per-process GCRA rate limiter
+
+    Mirrors the Redis rate limit script for use when Redis is unreachable.
+    State lives in this process only, so limits are approximate when
+    several workers serve the same API key.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self._tats = LocalCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, windows: list, cost: int = 1) -> tuple[bool, list]:
+        """
+        Check and consume quota in every window
+
+        Args:
+            key: Rate limited identity (e.g. API key)
+            windows: (name, limit, period_seconds) for each window
+            cost: Units of quota to consume
+
+        Returns:
+            (allowed, [(remaining, reset_after, retry_after), ...]) in seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            allowed = True
+            state = []
+            for name, limit, period in windows:
+                interval = period / max(limit, 1)
+                tat = max(self._tats.get((key, name), now), now)
+                new_tat = tat + interval * cost
+                retry_after = new_tat - period - now
+                if retry_after > 0:
+                    allowed = False
+                state.append((name, tat, new_tat, interval, period, max(retry_after, 0.0)))
+
+            results = []
+            for name, tat, new_tat, interval, period, retry_after in state:
+                if allowed:
+                    tat = new_tat
+                    self._tats.set((key, name), new_tat, ttl=new_tat - now)
+                remaining = max(int((period - (tat - now)) // interval), 0)
+                results.append((remaining, tat - now, retry_after))
+            return allowed, results
+
+    def reset(self, key: str, name: str) -> bool:
+        """Reset one window"""
+        return self._tats.delete((key, name))
@@ -0,0 +1,260 @@
+"""
+Local patent store
+
+patent_expirations holds AI-enriched patents synced from USPTO by the
+scheduler, and patent_coverage records which expiration date ranges were
+synced completely. Queries inside a covered range are answered from these
+tables (including the stored ai_summary) without calling USPTO or re-running
+summarization.
+"""
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.patent import PatentCoverage, PatentExpiration
+
+# technology_area values assigned by AIService.classify_technology_area, per industry
+INDUSTRY_TECHNOLOGY_AREAS = {
+    "biotech": "biotechnology",
+    "electronics": "electronics",
+    "software": "software",
+    "medical": "medical devices",
+    "automotive": "automotive",
+    "energy": "energy",
+    "materials": "materials",
+}
+
+PATENT_COLUMNS = (
+    "id", "title", "abstract", "grant_date", "expiration_date", "inventor", "assignee",
+    "patent_type", "technology_area", "ai_summary", "relevance_score"
+)
+
+# Adjacent synced ranges (one ends at 23:59:59.999999, the next starts at midnight) join up
+_COVERAGE_GAP = timedelta(seconds=1)
+
+
+def patent_to_dict(patent: PatentExpiration) -> Dict:
+    """Stored patent in the shape produced by USPTOClient + AIService"""
+    return {column: getattr(patent, column) for column in PATENT_COLUMNS}
+
+
+def _covers(ranges: Iterable[Tuple[datetime, datetime]], start: datetime, end: datetime) -> bool:
+    """True if the union of ranges contains [start, end]"""
+    reach = start
+    for range_start, range_end in sorted(ranges):
+        if range_start > reach + _COVERAGE_GAP:
+            break
+        reach = max(reach, range_end)
+        if reach >= end:
+            return True
+    return False
+
+
+def _coverage_query(start: datetime, end: datetime):
+    max_age = datetime.utcnow() - timedelta(hours=settings.patent_coverage_max_age_hours)
+    return select(PatentCoverage.start_date, PatentCoverage.end_date).where(
+        PatentCoverage.synced_at >= max_age,
+        PatentCoverage.start_date <= end,
+        PatentCoverage.end_date >= start
+    )
+
+
+def range_covered(db: Session, start: datetime, end: datetime) -> bool:
+    """Check whether every patent expiring in [start, end] was synced recently"""
+    return _covers(db.execute(_coverage_query(start, end)).all(), start, end)
+
+
+async def async_range_covered(db: AsyncSession, start: datetime, end: datetime) -> bool:
+    """Async counterpart of range_covered"""
+    return _covers((await db.execute(_coverage_query(start, end))).all(), start, end)
+
+
+async def coverage_version(db: AsyncSession, start: datetime, end: datetime) -> Optional[int]:
+    """
+    Snapshot version of a covered range: the newest sync that overlaps it
+
+    Returns:
+        Version number, or None if [start, end] is not fully covered
+    """
+    rows = (await db.execute(_coverage_query(start, end).add_columns(PatentCoverage.id))).all()
+    if not _covers([(row.start_date, row.end_date) for row in rows], start, end):
+        return None
+    return max(row.id for row in rows)
+
+
+def _patent_query(
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None
+):
+    query = select(PatentExpiration).where(
+        PatentExpiration.expiration_date >= start,
+        PatentExpiration.expiration_date <= end
+    )
+    if industry_keywords:
+        # Same abstract keyword match as the USPTO query, plus the classified area
+        conditions = [PatentExpiration.abstract.ilike(f"%{keyword}%") for keyword in industry_keywords]
+        area = INDUSTRY_TECHNOLOGY_AREAS.get((industry or "").lower())
+        if area:
+            conditions.append(PatentExpiration.technology_area == area)
+        query = query.where(or_(*conditions))
+    return query
+
+
+async def query_patents(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    after: Optional[Tuple[datetime, str]] = None
+) -> List[Dict]:
+    """
+    Stored patents expiring in [start, end], ordered by (expiration_date, id)
+
+    Args:
+        db: Async session
+        start: Start of expiration date range
+        end: End of expiration date range
+        industry: Industry name (matched against technology_area)
+        industry_keywords: Keywords matched against the abstract
+        limit: Page size (None = every match)
+        offset: Rows skipped (offset pagination)
+        after: (expiration_date, id) of the last row already returned (keyset pagination)
+
+    Returns:
+        Patent dictionaries
+    """
+    query = _ordered_query(start, end, industry, industry_keywords, after)
+    if limit is not None:
+        query = query.limit(limit).offset(offset)
+    return [patent_to_dict(patent) for patent in (await db.scalars(query)).all()]
+
+
+def _ordered_query(
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None,
+    after: Optional[Tuple[datetime, str]] = None,
+    through: Optional[Tuple[datetime, str]] = None
+):
+    query = _patent_query(start, end, industry, industry_keywords).order_by(
+        PatentExpiration.expiration_date, PatentExpiration.id
+    )
+    # Row-value comparisons spelled out, so they work on every backend
+    if after is not None:
+        query = query.where(or_(
+            PatentExpiration.expiration_date > after[0],
+            and_(PatentExpiration.expiration_date == after[0], PatentExpiration.id > after[1])
+        ))
+    if through is not None:
+        query = query.where(or_(
+            PatentExpiration.expiration_date < through[0],
+            and_(PatentExpiration.expiration_date == through[0], PatentExpiration.id <= through[1])
+        ))
+    return query
+
+
+async def page_boundary(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None,
+    limit: int = 50,
+    offset: int = 0,
+    after: Optional[Tuple[datetime, str]] = None
+) -> Optional[Tuple[datetime, str]]:
+    """
+    (expiration_date, id) of the last row of a full page, read from the index only
+
+    Returns:
+        The key, or None if fewer than `limit` rows remain
+    """
+    query = _ordered_query(start, end, industry, industry_keywords, after).with_only_columns(
+        PatentExpiration.expiration_date, PatentExpiration.id
+    ).offset(offset + limit - 1).limit(1)
+    row = (await db.execute(query)).first()
+    return (row.expiration_date, row.id) if row else None
+
+
+async def stream_patents(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None,
+    limit: int = 50,
+    offset: int = 0,
+    after: Optional[Tuple[datetime, str]] = None,
+    through: Optional[Tuple[datetime, str]] = None,
+    batch_size: int = 100
+) -> AsyncIterator[Dict]:
+    """
+    Like query_patents, but yields patents as rows arrive
+
+    Args:
+        through: Stop after this (expiration_date, id), so a page ends where page_boundary said
+        batch_size: Rows buffered per fetch
+    """
+    query = _ordered_query(start, end, industry, industry_keywords, after, through).limit(limit).offset(offset)
+    result = await db.stream_scalars(query.execution_options(yield_per=batch_size))
+    async for patent in result:
+        yield patent_to_dict(patent)
+
+
+async def count_patents(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    industry: Optional[str] = None,
+    industry_keywords: Optional[List[str]] = None
+) -> int:
+    """Number of stored patents matching query_patents' filters"""
+    subquery = _patent_query(start, end, industry, industry_keywords).with_only_columns(PatentExpiration.id)
+    return await db.scalar(select(func.count()).select_from(subquery.subquery())) or 0
+
+
+async def get_patent(db: AsyncSession, patent_id: str) -> Optional[Dict]:
+    """Stored patent by ID"""
+    patent = await db.get(PatentExpiration, patent_id)
+    return patent_to_dict(patent) if patent else None
+
+
+def store_patents(db: Session, patents: List[Dict], chunk_size: int = 500) -> int:
+    """
+    Insert or update processed patents (the caller commits)
+
+    Returns:
+        Number of patents written
+    """
+    for i in range(0, len(patents), chunk_size):
+        chunk = [patent for patent in patents[i:i + chunk_size] if patent.get("id")]
+        existing = {
+            patent.id: patent
+            for patent in db.scalars(select(PatentExpiration).where(
+                PatentExpiration.id.in_([patent["id"] for patent in chunk])
+            ))
+        }
+        for patent in chunk:
+            values = {column: patent.get(column) for column in PATENT_COLUMNS if column != "id"}
+            row = existing.get(patent["id"])
+            if row is None:
+                db.add(PatentExpiration(id=patent["id"], **{**values, "title": values["title"] or ""}))
+            else:
+                for column, value in values.items():
+                    setattr(row, column, value)
+    return len(patents)
+
+
+def record_coverage(db: Session, start: datetime, end: datetime):
+    """Mark [start, end] as fully synced and forget coverage too old to trust (the caller commits)"""
+    db.add(PatentCoverage(start_date=start, end_date=end, synced_at=datetime.utcnow()))
+    max_age = datetime.utcnow() - timedelta(hours=settings.patent_coverage_max_age_hours)
+    db.execute(delete(PatentCoverage).where(PatentCoverage.synced_at < max_age))
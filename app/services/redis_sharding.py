@@ -0,0 +1,289 @@
+"""
+Redis client construction and client-side sharding
+
+Three topologies are supported:
+
+- a single node (REDIS_URL)
+- Redis Cluster (REDIS_CLUSTER=true, REDIS_URL points at any cluster node)
+- several independent nodes with client-side consistent hashing
+  (REDIS_URLS=redis://a:6379/0,redis://b:6379/0)
+
+Keys may contain a hash tag, e.g. ``rate_limit:{pat_abc}:minute``. Only the
+part inside the first ``{...}`` is hashed, exactly like Redis Cluster does, so
+related keys land on the same node and can be used together in one script.
+"""
+import bisect
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def hash_tag(key: str) -> str:
+    """Return the part of key that determines its node"""
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def tagged_key(prefix: str, tag: str, suffix: str = "") -> str:
+    """Build a key whose node is determined by tag alone"""
+    key = f"{prefix}:{{{tag}}}"
+    return f"{key}:{suffix}" if suffix else key
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, node_count: int, replicas: int = 160):
+        self.node_count = node_count
+        self._points: List[int] = []
+        self._nodes: List[int] = []
+        ring = sorted(
+            (self._hash(f"node-{node}-{replica}"), node)
+            for node in range(node_count)
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def get_node(self, key: str) -> int:
+        """Index of the node owning key"""
+        if self.node_count == 1:
+            return 0
+        index = bisect.bisect(self._points, self._hash(hash_tag(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class ShardedPipeline:
+    """Pipeline that fans commands out to per-node pipelines"""
+
+    def __init__(self, sharded: "ShardedRedis"):
+        self._sharded = sharded
+        self._pipes: Dict[int, Any] = {}
+        self._order: List[tuple[int, int]] = []  # (node, position in node pipeline)
+
+    def _queue(self, node: int, command: str, *args, **kwargs) -> "ShardedPipeline":
+        pipe = self._pipes.get(node)
+        if pipe is None:
+            pipe = self._sharded.nodes[node].pipeline(transaction=False)
+            self._pipes[node] = pipe
+        getattr(pipe, command)(*args, **kwargs)
+        self._order.append((node, len(pipe.command_stack) - 1))
+        return self
+
+    def _keyed(self, command: str, key: str, *args, **kwargs) -> "ShardedPipeline":
+        return self._queue(self._sharded.ring.get_node(key), command, key, *args, **kwargs)
+
+    def get(self, key):
+        return self._keyed("get", key)
+
+    def setex(self, key, ttl, value):
+        return self._keyed("setex", key, ttl, value)
+
+    def delete(self, key):
+        return self._keyed("delete", key)
+
+    def exists(self, key):
+        return self._keyed("exists", key)
+
+    def incrby(self, key, amount):
+        return self._keyed("incrby", key, amount)
+
+    def expire(self, key, seconds):
+        return self._keyed("expire", key, seconds)
+
+    def hincrbyfloat(self, key, field, amount):
+        return self._keyed("hincrbyfloat", key, field, amount)
+
+    def hgetall(self, key):
+        return self._keyed("hgetall", key)
+
+    def hset(self, key, mapping):
+        return self._keyed("hset", key, mapping=mapping)
+
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        """Execute every node pipeline and return replies in queue order"""
+        replies = {
+            node: pipe.execute(raise_on_error=raise_on_error)
+            for node, pipe in self._pipes.items()
+        }
+        results = [replies[node][position] for node, position in self._order]
+        self._pipes = {}
+        self._order = []
+        return results
+
+
+class ShardedScript:
+    """Lua script routed to the node that owns its keys"""
+
+    def __init__(self, sharded: "ShardedRedis", script: str):
+        self._sharded = sharded
+        self._scripts = [node.register_script(script) for node in sharded.nodes]
+
+    def __call__(self, keys: Sequence[str] = (), args: Sequence[Any] = (), client: Any = None):
+        nodes = {self._sharded.ring.get_node(key) for key in keys} or {0}
+        if len(nodes) > 1:
+            raise ValueError("Script keys must share a hash tag when sharding")
+        return self._scripts[nodes.pop()](keys=keys, args=args)
+
+
+class ShardedRedis:
+    """
+    Minimal Redis client that spreads keys over several independent nodes
+
+    Implements the subset of the redis-py API used by CacheService. Pub/sub
+    goes through the first node so every worker sees every message.
+    """
+
+    def __init__(self, nodes: List[Any], replicas: int = 160):
+        self.nodes = nodes
+        self.ring = HashRing(len(nodes), replicas=replicas)
+
+    def node_for(self, key: str):
+        """Client for the node owning key"""
+        return self.nodes[self.ring.get_node(key)]
+
+    def ping(self) -> bool:
+        return all(node.ping() for node in self.nodes)
+
+    def get(self, key):
+        return self.node_for(key).get(key)
+
+    def set(self, key, value, **kwargs):
+        return self.node_for(key).set(key, value, **kwargs)
+
+    def setex(self, key, ttl, value):
+        return self.node_for(key).setex(key, ttl, value)
+
+    def delete(self, *keys) -> int:
+        return sum(self.node_for(key).delete(key) for key in keys)
+
+    def exists(self, key) -> int:
+        return self.node_for(key).exists(key)
+
+    def incrby(self, key, amount=1):
+        return self.node_for(key).incrby(key, amount)
+
+    def expire(self, key, seconds):
+        return self.node_for(key).expire(key, seconds)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """MGET split into one call per node, results in key order"""
+        by_node: Dict[int, List[int]] = {}
+        for index, key in enumerate(keys):
+            by_node.setdefault(self.ring.get_node(key), []).append(index)
+        results: List[Optional[bytes]] = [None] * len(keys)
+        for node, indexes in by_node.items():
+            values = self.nodes[node].mget([keys[i] for i in indexes])
+            for index, value in zip(indexes, values):
+                results[index] = value
+        return results
+
+    def publish(self, channel, message):
+        return self.nodes[0].publish(channel, message)
+
+    def pubsub(self, **kwargs):
+        return self.nodes[0].pubsub(**kwargs)
+
+    def pipeline(self, transaction: bool = False) -> ShardedPipeline:
+        return ShardedPipeline(self)
+
+    def register_script(self, script: str) -> ShardedScript:
+        return ShardedScript(self, script)
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+
+    @property
+    def connection_pools(self) -> list:
+        return [node.connection_pool for node in self.nodes]
+
+
+def connection_pools(client) -> list:
+    """Connection pools behind a single, cluster or sharded client"""
+    pools = getattr(client, "connection_pools", None)
+    if pools is not None:
+        return list(pools)
+    if hasattr(client, "get_nodes"):
+        return [
+            node.redis_connection.connection_pool
+            for node in client.get_nodes()
+            if node.redis_connection is not None
+        ]
+    pool = getattr(client, "connection_pool", None)
+    return [pool] if pool is not None else []
+
+
+def pool_stats(pools: list) -> dict:
+    """Aggregate size and usage across connection pools"""
+    stats = {"pools": len(pools), "max_connections": 0, "created": 0, "in_use": 0, "idle": 0}
+    for pool in pools:
+        stats["max_connections"] += pool.max_connections
+        if hasattr(pool, "_connections"):
+            # BlockingConnectionPool: idle connections sit in the queue, unused slots are None
+            created = len(pool._connections)
+            idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+        else:
+            created = pool._created_connections
+            idle = len(pool._available_connections)
+        stats["created"] += created
+        stats["idle"] += idle
+        stats["in_use"] += created - idle
+    return stats
+
+
+def create_redis_client(
+    url: str,
+    urls: str = "",
+    cluster: bool = False,
+    pool_timeout: Optional[float] = None,
+    **kwargs
+):
+    """
+    Build a Redis client for the configured topology
+
+    Args:
+        url: Single node or cluster seed URL
+        urls: Comma-separated node URLs for client-side sharding
+        cluster: Connect to a Redis Cluster
+        pool_timeout: Wait this long for a free connection once max_connections
+            are in use instead of failing immediately (not used for Redis Cluster)
+        **kwargs: Passed to every underlying client
+    """
+    if not REDIS_AVAILABLE:
+        raise RuntimeError("redis is not installed")
+
+    if cluster:
+        from redis.cluster import RedisCluster
+        return RedisCluster.from_url(url, **kwargs)
+
+    def connect(node_url: str):
+        if pool_timeout is None:
+            return redis.from_url(node_url, **kwargs)
+        pool = redis.BlockingConnectionPool.from_url(node_url, timeout=pool_timeout, **kwargs)
+        client = redis.Redis(connection_pool=pool)
+        client.auto_close_connection_pool = True
+        return client
+
+    node_urls = [u.strip() for u in urls.split(",") if u.strip()]
+    if len(node_urls) > 1:
+        logger.info(f"Sharding cache across {len(node_urls)} Redis nodes")
+        return ShardedRedis([connect(u) for u in node_urls])
+
+    return connect(node_urls[0] if node_urls else url)
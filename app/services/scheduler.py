@@ -2,19 +2,28 @@
 Background scheduler for webhook triggering and periodic tasks
 """
 import asyncio
+import time
 from datetime import datetime, timedelta
 from typing import List
 import logging
 from sqlalchemy.orm import Session
+from app.config import settings
 from app.database import SessionLocal
 from app.models.user import WebhookConfig
 from app.models.patent import PatentExpiration
 from app.services.uspto_client import USPTOClient
 from app.services.webhook_service import WebhookService
 from app.services.ai_service import AIService
+from app.services.expiration_service import ExpirationService
+from app.services.patent_store import range_covered, record_coverage, store_patents
+from app.services.usage_archive import run_usage_retention
+from app.services.usage_counters import reconcile_counters
 
 logger = logging.getLogger(__name__)
 
+# Seconds between attempts while the day's patent sync keeps failing
+PATENT_SYNC_RETRY_INTERVAL = 900
+
 
 class SchedulerService:
     """Service for scheduled background tasks"""
@@ -23,7 +32,21 @@ class SchedulerService:
         self.uspto_client = USPTOClient()
         self.webhook_service = WebhookService()
         self.ai_service = AIService()
+        self.expiration_service = ExpirationService(self.uspto_client, self.ai_service)
         self.running = False
+        self._last_run = {}
+        self._last_refresh_date = None
+        self._refresh_pending = False
+        self._last_warm_date = None
+    
+    def _due(self, task: str, interval: float) -> bool:
+        """Check whether a periodic task should run now, and mark it as run"""
+        now = time.monotonic()
+        last = self._last_run.get(task)
+        if last is not None and now - last < interval:
+            return False
+        self._last_run[task] = now
+        return True
     
     async def check_expiring_patents_and_trigger_webhooks(self):
         """Check for patents expiring today/tomorrow and trigger webhooks"""
@@ -90,65 +113,111 @@ class SchedulerService:
         finally:
             db.close()
     
-    async def refresh_patent_cache(self):
-        """Periodically refresh patent expiration cache"""
-        db = SessionLocal()
+    async def refresh_patent_cache(self) -> bool:
+        """
+        Sync patents expiring in the next patent_sync_days into the local store
+
+        Returns:
+            False if the sync failed and should be retried
+        """
+        # Same bounds as the date ranges queried by the expirations endpoint
+        today = datetime.now().date()
+        start_date = datetime.combine(today, datetime.min.time())
+        end_date = datetime.combine(today + timedelta(days=settings.patent_sync_days), datetime.max.time())
+        lock_key = f"lock:patent_sync:{today.isoformat()}"
+        
+        def covered() -> bool:
+            with SessionLocal() as db:
+                return range_covered(db, start_date, end_date)
+        
+        def save(processed: List[dict]):
+            with SessionLocal() as db:
+                store_patents(db, processed)
+                record_coverage(db, start_date, end_date)
+                db.commit()
+        
         try:
-            # Get patents expiring in next 90 days
-            today = datetime.utcnow().date()
-            future_date = today + timedelta(days=90)
-            
-            # Query USPTO for fresh data
-            patents = await self.uspto_client.get_expiring_patents(
-                start_date=datetime.combine(today, datetime.min.time()),
-                end_date=datetime.combine(future_date, datetime.max.time()),
-                limit=1000
+            if self._last_refresh_date is None and await asyncio.to_thread(covered):
+                logger.info("Patent store already synced, skipping startup sync")
+                return True
+            if not self.uspto_client.cache.acquire_lock(lock_key, ttl=3600):
+                logger.info("Patent store sync already running on another worker")
+                return True
+        except Exception as e:
+            logger.error(f"Error refreshing patent cache: {e}")
+            return False
+        
+        try:
+            # Query USPTO for fresh data (None unless every page came back)
+            patents = await self.uspto_client.fetch_expiring_range(
+                start_date,
+                end_date,
+                page_size=settings.patent_sync_page_size,
+                max_pages=settings.patent_sync_max_pages
             )
+            if patents is None:
+                raise RuntimeError("USPTO sync incomplete, local patent store coverage unchanged")
             
-            # Process with AI
-            processed = self.ai_service.process_patents(patents)
+            # Summarizing tens of thousands of patents and writing them takes
+            # minutes; keep the event loop serving requests meanwhile
+            processed = await asyncio.to_thread(self.ai_service.process_patents, patents)
+            await asyncio.to_thread(save, processed)
+            # Cached pages and totals predate the sync
+            self.expiration_service.invalidate_cached_queries()
             
-            # Update database cache
-            for patent in processed:
-                existing = db.query(PatentExpiration).filter(
-                    PatentExpiration.id == patent["id"]
-                ).first()
-                
-                if existing:
-                    # Update existing
-                    existing.title = patent.get("title")
-                    existing.abstract = patent.get("abstract")
-                    existing.expiration_date = patent.get("expiration_date")
-                    existing.grant_date = patent.get("grant_date")
-                    existing.inventor = patent.get("inventor")
-                    existing.assignee = patent.get("assignee")
-                    existing.technology_area = patent.get("technology_area")
-                    existing.ai_summary = patent.get("ai_summary")
-                    existing.relevance_score = patent.get("relevance_score")
-                else:
-                    # Create new
-                    new_patent = PatentExpiration(
-                        id=patent["id"],
-                        title=patent.get("title", ""),
-                        abstract=patent.get("abstract"),
-                        grant_date=patent.get("grant_date"),
-                        expiration_date=patent.get("expiration_date"),
-                        inventor=patent.get("inventor"),
-                        assignee=patent.get("assignee"),
-                        technology_area=patent.get("technology_area"),
-                        ai_summary=patent.get("ai_summary"),
-                        relevance_score=patent.get("relevance_score")
-                    )
-                    db.add(new_patent)
-            
-            db.commit()
+            # Prime per-patent cache entries with the AI-enriched records
+            self.uspto_client.cache_patents(processed)
             logger.info(f"Refreshed patent cache with {len(processed)} patents")
+            return True
             
         except Exception as e:
             logger.error(f"Error refreshing patent cache: {e}")
-            db.rollback()
-        finally:
-            db.close()
+            # Let the retry (here or on another worker) take the lock again
+            self.uspto_client.cache.delete(lock_key)
+            return False
+    
+    async def warm_expiration_cache(self):
+        """Precompute processed responses for the standard industry x date_range matrix"""
+        today = datetime.now().date()
+        self._last_warm_date = today
+        # Only one worker warms per interval; a new day gets a fresh lock
+        lock_ttl = max(settings.cache_warm_interval - 60, 60)
+        if not self.uspto_client.cache.acquire_lock(f"lock:cache_warm:{today.isoformat()}", ttl=lock_ttl):
+            logger.info("Expiration cache warming already running on another worker")
+            return
+        try:
+            await self.expiration_service.warm_standard_queries()
+        except Exception as e:
+            logger.error(f"Error warming expiration cache: {e}")
+    
+    async def archive_usage(self):
+        """Move closed months of api_usage to archive files"""
+        today = datetime.utcnow().date()
+        if not self.uspto_client.cache.acquire_lock(f"lock:usage_archive:{today.isoformat()}", ttl=3600):
+            logger.info("Usage archival already running on another worker")
+            return
+        try:
+            # Exports can take minutes; keep the event loop serving requests
+            paths = await asyncio.to_thread(run_usage_retention)
+            if paths:
+                logger.info(f"Archived usage to {len(paths)} files")
+        except Exception as e:
+            logger.error(f"Error archiving usage: {e}")
+    
+    async def reconcile_usage_counters(self):
+        """Correct Redis usage counters that drifted from the daily rollups"""
+        lock_ttl = max(settings.usage_counter_reconcile_interval - 10, 10)
+        if not self.uspto_client.cache.acquire_lock("lock:usage_counters", ttl=lock_ttl):
+            return
+        
+        def reconcile():
+            with SessionLocal() as db:
+                return reconcile_counters(db, self.uspto_client.cache)
+        
+        try:
+            await asyncio.to_thread(reconcile)
+        except Exception as e:
+            logger.error(f"Error reconciling usage counters: {e}")
     
     async def run_scheduler(self):
         """Main scheduler loop"""
@@ -158,15 +227,40 @@ class SchedulerService:
         while self.running:
             try:
                 # Check expiring patents every hour
-                await self.check_expiring_patents_and_trigger_webhooks()
+                if self._due("webhooks", 3600):
+                    await self.check_expiring_patents_and_trigger_webhooks()
                 
-                # Refresh cache daily (at midnight UTC)
+                # Sync the local patent store on startup and daily (at midnight UTC),
+                # retrying a failed sync until it succeeds
                 now = datetime.utcnow()
-                if now.hour == 0 and now.minute < 5:
-                    await self.refresh_patent_cache()
+                if (
+                    self._last_refresh_date != now.date()
+                    and (now.hour == 0 or self._last_refresh_date is None or self._refresh_pending)
+                    and self._due("patent_sync", PATENT_SYNC_RETRY_INTERVAL)
+                ):
+                    synced = await self.refresh_patent_cache()
+                    self._refresh_pending = not synced
+                    if synced:
+                        self._last_refresh_date = now.date()
+                
+                # Keep the real-time usage counters in line with the rollups
+                if self._due("usage_counters", settings.usage_counter_reconcile_interval):
+                    await self.reconcile_usage_counters()
+                
+                # Archive closed months of usage once a day
+                if settings.usage_retention_months and self._due("usage_archive", 86400):
+                    await self.archive_usage()
+                
+                # Warm standard queries ahead of TTL expiry, and right after
+                # the date rolls over since the date ranges move with it
+                if settings.cache_warm_enabled and (
+                    self._last_warm_date != datetime.now().date()
+                    or self._due("cache_warm", settings.cache_warm_interval)
+                ):
+                    self._last_run["cache_warm"] = time.monotonic()
+                    await self.warm_expiration_cache()
                 
-                # Sleep for 1 hour
-                await asyncio.sleep(3600)
+                await asyncio.sleep(60)
                 
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
@@ -0,0 +1,310 @@
+"""
+Usage retention and archival
+
+api_usage only keeps the current month plus usage_retention_months closed
+months. Older months are exported to compressed files in usage_archive_dir
+(Parquet when pyarrow is installed, CSV.gz otherwise) and then removed from
+the hot table:
+
+- Postgres (after migration 0002): api_usage is range-partitioned by month,
+  so a closed month is detached and dropped in one step. Partitions for the
+  coming months are created ahead of time.
+- Other databases: the month is deleted with a range predicate on the
+  (api_key_id, created_at) / created_at indexes.
+
+Aggregates keep working on archived months because they read the usage
+rollups; rebuild_rollups() folds the archives back in via iter_archived_usage().
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+import csv
+import glob
+import gzip
+import logging
+import os
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.usage import APIUsage
+
+logger = logging.getLogger(__name__)
+
+# Try to import the optional Parquet writer
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+ARCHIVE_COLUMNS = (
+    "id", "api_key_id", "endpoint", "method", "query_params", "response_status",
+    "response_time_ms", "query_count", "cost", "created_at"
+)
+_INT_COLUMNS = ("response_status", "query_count")
+_FLOAT_COLUMNS = ("response_time_ms", "cost")
+
+# Rows streamed per batch while exporting
+EXPORT_BATCH_SIZE = 10000
+
+
+def month_start(timestamp: datetime) -> datetime:
+    """First instant of the month holding timestamp"""
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def shift_months(month: datetime, months: int) -> datetime:
+    """First instant of the month `months` after (or before) month"""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Postgres partition holding one month of api_usage"""
+    return f"api_usage_p{month:%Y_%m}"
+
+
+def archive_format() -> str:
+    """Resolve usage_archive_format ("auto" picks Parquet when pyarrow is installed)"""
+    fmt = settings.usage_archive_format.lower()
+    if fmt == "auto":
+        return "parquet" if PYARROW_AVAILABLE else "csv"
+    if fmt == "parquet" and not PYARROW_AVAILABLE:
+        logger.warning("pyarrow not installed, archiving usage as CSV.gz")
+        return "csv"
+    return fmt
+
+
+class _CsvGzWriter:
+    extension = ".csv.gz"
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=ARCHIVE_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, rows: List[dict]):
+        self._writer.writerows(
+            {**row, "created_at": row["created_at"].isoformat() if row["created_at"] else None}
+            for row in rows
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    extension = ".parquet"
+
+    def __init__(self, path: str):
+        self._schema = pa.schema([
+            ("id", pa.string()),
+            ("api_key_id", pa.string()),
+            ("endpoint", pa.string()),
+            ("method", pa.string()),
+            ("query_params", pa.string()),
+            ("response_status", pa.int32()),
+            ("response_time_ms", pa.float64()),
+            ("query_count", pa.int32()),
+            ("cost", pa.float64()),
+            ("created_at", pa.timestamp("us")),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: List[dict]):
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+_WRITERS = {"csv": _CsvGzWriter, "parquet": _ParquetWriter}
+
+
+def _archive_path(archive_dir: str, month: datetime, extension: str) -> str:
+    """Next free file name for a month (late rows for an archived month get a new part)"""
+    base = os.path.join(archive_dir, f"api_usage_{month:%Y_%m}")
+    path, part = base + extension, 1
+    while os.path.exists(path):
+        path, part = f"{base}.part{part}{extension}", part + 1
+    return path
+
+
+def export_month(db: Session, month: datetime, archive_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Write one month of api_usage to a compressed archive file
+
+    Args:
+        db: Sync session on the primary
+        month: First instant of the month to export
+        archive_dir: Destination directory (default: usage_archive_dir)
+
+    Returns:
+        Path of the archive file, or None if the month has no rows
+    """
+    archive_dir = archive_dir or settings.usage_archive_dir
+    os.makedirs(archive_dir, exist_ok=True)
+    writer_class = _WRITERS[archive_format()]
+    path = _archive_path(archive_dir, month, writer_class.extension)
+    tmp_path = path + ".tmp"
+
+    query = select(*(getattr(APIUsage, column) for column in ARCHIVE_COLUMNS)).where(
+        APIUsage.created_at >= month,
+        APIUsage.created_at < shift_months(month, 1)
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    exported = 0
+    writer = writer_class(tmp_path)
+    try:
+        for partition in db.execute(query).mappings().partitions():
+            rows = [dict(row) for row in partition]
+            writer.write(rows)
+            exported += len(rows)
+    finally:
+        writer.close()
+
+    if not exported:
+        os.remove(tmp_path)
+        return None
+    # Only a complete file gets the final name
+    os.replace(tmp_path, path)
+    logger.info(f"Archived {exported} usage rows for {month:%Y-%m} to {path}")
+    return path
+
+
+def is_partitioned(db: Session) -> bool:
+    """True if api_usage is a native Postgres partitioned table"""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = 'api_usage'"
+    )).first() is not None
+
+
+def ensure_partitions(db: Session, months_ahead: Optional[int] = None):
+    """Create monthly Postgres partitions for the coming months"""
+    months_ahead = settings.usage_partition_months_ahead if months_ahead is None else months_ahead
+    if not is_partitioned(db):
+        return
+    # Starts next month: the current month may already have rows in the default partition
+    current = month_start(datetime.utcnow())
+    for i in range(1, months_ahead + 1):
+        month = shift_months(current, i)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF api_usage "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{shift_months(month, 1):%Y-%m-%d}')"
+        ))
+    db.commit()
+
+
+def drop_month(db: Session, month: datetime):
+    """Remove one month from the hot table (after it has been archived)"""
+    if is_partitioned(db):
+        name = partition_name(month)
+        exists = db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists:
+            db.execute(text(f"ALTER TABLE api_usage DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+    # Rows outside a monthly partition (SQLite, or Postgres' default partition)
+    db.execute(delete(APIUsage).where(
+        APIUsage.created_at >= month,
+        APIUsage.created_at < shift_months(month, 1)
+    ))
+    db.commit()
+
+
+def archive_closed_months(
+    db: Session,
+    retention_months: Optional[int] = None,
+    archive_dir: Optional[str] = None,
+    now: Optional[datetime] = None
+) -> List[str]:
+    """
+    Archive and drop every month older than the retention window
+
+    Args:
+        db: Sync session on the primary
+        retention_months: Closed months kept in api_usage (default: usage_retention_months)
+        archive_dir: Destination directory (default: usage_archive_dir)
+        now: Current time (for tests)
+
+    Returns:
+        Paths of the archive files written
+    """
+    retention_months = settings.usage_retention_months if retention_months is None else retention_months
+    cutoff = shift_months(month_start(now or datetime.utcnow()), -retention_months)
+    oldest = db.scalar(select(func.min(APIUsage.created_at)))
+    if oldest is None:
+        return []
+
+    paths = []
+    month = month_start(oldest)
+    while month < cutoff:
+        path = export_month(db, month, archive_dir)
+        if path:
+            paths.append(path)
+        drop_month(db, month)
+        month = shift_months(month, 1)
+    return paths
+
+
+def run_usage_retention() -> List[str]:
+    """Scheduled job: create upcoming partitions and archive closed months"""
+    if not settings.usage_retention_months:
+        return []
+    with SessionLocal() as db:
+        ensure_partitions(db)
+        return archive_closed_months(db)
+
+
+def _parse_csv_row(row: dict) -> dict:
+    for column in ARCHIVE_COLUMNS:
+        if row[column] == "":
+            row[column] = None
+    for column in _INT_COLUMNS:
+        if row[column] is not None:
+            row[column] = int(row[column])
+    for column in _FLOAT_COLUMNS:
+        if row[column] is not None:
+            row[column] = float(row[column])
+    if row["created_at"] is not None:
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+def _read_archive(path: str) -> Iterator[dict]:
+    if path.endswith(".parquet"):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError(f"pyarrow is required to read {path}")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=EXPORT_BATCH_SIZE):
+            yield from batch.to_pylist()
+    else:
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as archive:
+            for row in csv.DictReader(archive):
+                yield _parse_csv_row(row)
+
+
+def iter_archived_usage(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    archive_dir: Optional[str] = None
+) -> Iterator[dict]:
+    """
+    Stream archived usage rows with start <= created_at < end
+
+    Files for months outside the range are skipped without being opened.
+    """
+    archive_dir = archive_dir or settings.usage_archive_dir
+    for path in sorted(glob.glob(os.path.join(archive_dir, "api_usage_*"))):
+        if path.endswith(".tmp"):
+            continue
+        month = datetime.strptime(os.path.basename(path)[len("api_usage_"):][:7], "%Y_%m")
+        if (start and shift_months(month, 1) <= start) or (end and month >= end):
+            continue
+        for row in _read_archive(path):
+            created_at = row["created_at"]
+            if (start and created_at < start) or (end and created_at >= end):
+                continue
+            yield row
@@ -0,0 +1,112 @@
+"""
+Real-time usage counters in Redis
+
+Every batch the usage recorder commits is also added to one Redis hash per
+API key and day (the same fields as the daily usage rollups, plus a request
+count per endpoint). /api/v1/stats reads the last 30 of these hashes in one
+round-trip instead of querying the database.
+
+Counters are only incremented after the batch is committed, so they never
+run ahead of the database. reconcile_counters() periodically compares them
+with the daily rollups and rewrites any hash that drifted (Redis restarts,
+evictions, a failed increment), so they converge within one reconcile interval.
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.usage import UsageRollup
+from app.services.cache_service import CacheService, get_cache_service
+from app.services.redis_sharding import tagged_key
+from app.services.usage_rollups import DAY, SUM_COLUMNS, rollup_deltas, rollup_window_start
+
+logger = logging.getLogger(__name__)
+
+# Days served by /api/v1/stats; hashes outlive them by a few days
+COUNTER_DAYS = 30
+COUNTER_TTL = (COUNTER_DAYS + 5) * 86400
+
+ENDPOINT_FIELD_PREFIX = "endpoint:"
+
+
+def counter_key(api_key_id: str, day: date) -> str:
+    """Redis hash holding one key's usage for one day"""
+    # Hash-tagged so a key's days live on one node and are read in one round-trip
+    return tagged_key("usage", api_key_id, day.isoformat())
+
+
+def _counter_fields(rows: Iterable) -> Dict[str, Dict[str, float]]:
+    """Group daily rollup rows (dicts or mappings) into counter hashes"""
+    items: Dict[str, Dict[str, float]] = {}
+    for row in rows:
+        if row["granularity"] != DAY:
+            continue
+        fields = items.setdefault(counter_key(row["api_key_id"], row["bucket_start"].date()), {})
+        for column in SUM_COLUMNS:
+            fields[column] = fields.get(column, 0) + row[column]
+        endpoint_field = ENDPOINT_FIELD_PREFIX + row["endpoint"]
+        fields[endpoint_field] = fields.get(endpoint_field, 0) + row["request_count"]
+    return items
+
+
+def increment_counters(events: List[dict], cache: Optional[CacheService] = None) -> bool:
+    """Add committed usage events to the counters (one round-trip)"""
+    cache = cache or get_cache_service()
+    return cache.increment_hashes(_counter_fields(rollup_deltas(events)), ttl=COUNTER_TTL)
+
+
+def read_counters(
+    api_key_id: str,
+    days: int = COUNTER_DAYS,
+    cache: Optional[CacheService] = None
+) -> Optional[List[Tuple[date, Dict[str, float]]]]:
+    """
+    Read one key's counters for the last `days` days
+
+    Returns:
+        (day, fields) oldest first, or None while Redis is unavailable
+    """
+    cache = cache or get_cache_service()
+    first_day = rollup_window_start(days).date()
+    day_list = [first_day + timedelta(days=i) for i in range(days)]
+    hashes = cache.get_hashes(counter_key(api_key_id, day) for day in day_list)
+    if hashes is None:
+        return None
+    return [(day, hashes[counter_key(api_key_id, day)]) for day in day_list]
+
+
+def _same(current: Dict[str, float], expected: Dict[str, float]) -> bool:
+    fields = {field for field, value in expected.items() if value} | {
+        field for field, value in current.items() if value
+    }
+    return all(abs(current.get(field, 0) - expected.get(field, 0)) < 1e-6 for field in fields)
+
+
+def reconcile_counters(db: Session, cache: Optional[CacheService] = None, days: int = COUNTER_DAYS) -> int:
+    """
+    Rewrite counters that differ from the daily rollups
+
+    Args:
+        db: Sync session (the primary, so rollups are current)
+        cache: Cache service (default: the shared one)
+        days: Days reconciled
+
+    Returns:
+        Number of hashes rewritten
+    """
+    cache = cache or get_cache_service()
+    rows = db.execute(select(UsageRollup.__table__).where(
+        UsageRollup.granularity == DAY,
+        UsageRollup.bucket_start >= rollup_window_start(days)
+    )).mappings()
+    expected = _counter_fields(rows)
+
+    current = cache.get_hashes(expected)
+    if current is None:
+        return 0
+    drifted = {key: fields for key, fields in expected.items() if not _same(current[key], fields)}
+    if drifted:
+        cache.replace_hashes(drifted, ttl=COUNTER_TTL)
+        logger.info(f"Reconciled {len(drifted)} of {len(expected)} usage counter hashes")
+    return len(drifted)
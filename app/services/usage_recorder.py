@@ -0,0 +1,284 @@
+"""
+Buffered API usage recorder
+
+Request handlers call usage_recorder.record(...) instead of committing an
+APIUsage row themselves. Events are queued in memory and written with one
+bulk INSERT every usage_flush_interval_ms or usage_flush_batch_size events,
+whichever comes first. Anything still queued is flushed on shutdown.
+
+With usage_spool_path set, every event is also appended to a local
+JSON-lines spool before it is queued. The spool is truncated once everything
+in it has been committed, and replayed on startup after a crash; replay is
+idempotent because events carry their own primary key.
+
+A batch that still fails after usage_flush_max_retries attempts is moved out
+of the queue so it can't block the events behind it. With spooling enabled it
+is appended to a dead-letter file next to the spool (<spool>.dead, same
+format) for inspection and manual replay; otherwise it is logged and dropped.
+
+Each batch also updates the usage rollups (see usage_rollups) in the same
+transaction, so the rollups never drift from the raw rows. Once committed,
+it is added to the real-time Redis counters (see usage_counters).
+"""
+from collections import deque
+from datetime import datetime
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from sqlalchemy import insert, select
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.usage import APIUsage
+from app.services.cache_service import CacheService, get_cache_service
+from app.services.usage_counters import increment_counters
+from app.services.usage_rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class UsageRecorder:
+    """Queues APIUsage events and writes them in bulk in the background"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        spool_path: Optional[str] = None,
+        cache: Optional[CacheService] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self._cache = cache
+        self.batch_size = batch_size or settings.usage_flush_batch_size
+        self.flush_interval = (flush_interval_ms or settings.usage_flush_interval_ms) / 1000
+        self.max_queue = max_queue or settings.usage_queue_max
+        self.spool_path = settings.usage_spool_path if spool_path is None else spool_path
+        self.max_retries = max_retries or settings.usage_flush_max_retries
+        self._queue: deque = deque()
+        self._pending_replay: list = []
+        self._spool = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._failed_attempts = 0
+        self._stats = {
+            "recorded": 0, "flushed": 0, "dropped": 0, "failed_flushes": 0, "dead_lettered": 0, "last_flush_ms": None
+        }
+
+    @property
+    def cache(self) -> CacheService:
+        return self._cache or get_cache_service()
+
+    def record(
+        self,
+        api_key_id: str,
+        endpoint: str,
+        method: str,
+        response_status: int,
+        response_time_ms: Optional[float] = None,
+        query_params: Optional[str] = None,
+        query_count: int = 1,
+        cost: Optional[float] = None,
+        route: Optional[str] = None
+    ) -> bool:
+        """
+        Queue one usage event
+        
+        Args:
+            route: Route template the endpoint belongs to, used as the rollup
+                endpoint (defaults to endpoint)
+
+        Returns:
+            False if the queue was full and the event was dropped (dropped
+            events are not spooled either)
+        """
+        event = {
+            "id": str(uuid.uuid4()),
+            "api_key_id": api_key_id,
+            "endpoint": endpoint,
+            "method": method,
+            "query_params": query_params,
+            "response_status": response_status,
+            "response_time_ms": response_time_ms,
+            "query_count": query_count,
+            "cost": cost,
+            "route": route,
+            # Set here, not by the database, so batching doesn't shift timestamps
+            "created_at": datetime.utcnow(),
+        }
+        self._stats["recorded"] += 1
+
+        if len(self._queue) >= self.max_queue:
+            self._stats["dropped"] += 1
+            logger.warning("Usage queue full, dropping event")
+            return False
+
+        self._append_to_spool(event)
+        self._queue.append(event)
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def _append_to_spool(self, event: dict):
+        if not self.spool_path:
+            return
+        try:
+            if self._spool is None:
+                self._spool = open(self.spool_path, "a", encoding="utf-8")
+            self._spool.write(_spool_line(event))
+            self._spool.flush()
+        except OSError as e:
+            logger.error(f"Failed to write usage spool {self.spool_path}: {e}")
+
+    def _dead_letter(self, batch: list):
+        """Move a batch that keeps failing out of the queue"""
+        self._stats["dead_lettered"] += len(batch)
+        if not self.spool_path:
+            logger.error(f"Dropping {len(batch)} usage events after {self.max_retries} failed writes")
+            return
+        path = f"{self.spool_path}.dead"
+        try:
+            with open(path, "a", encoding="utf-8") as dead:
+                dead.writelines(_spool_line(event) for event in batch)
+            logger.error(f"Moved {len(batch)} usage events to {path} after {self.max_retries} failed writes")
+        except OSError as e:
+            logger.error(f"Failed to write usage dead-letter file {path}, dropping {len(batch)} events: {e}")
+
+    def _truncate_spool(self):
+        if self._spool is not None:
+            self._spool.truncate(0)
+            self._spool.seek(0)
+        elif self.spool_path and os.path.exists(self.spool_path):
+            open(self.spool_path, "w").close()
+
+    def _read_spool(self) -> list:
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return []
+        events = []
+        with open(self.spool_path, encoding="utf-8") as spool:
+            for line in spool:
+                try:
+                    event = json.loads(line)
+                    event["created_at"] = datetime.fromisoformat(event["created_at"])
+                    events.append(event)
+                except (ValueError, KeyError):
+                    continue  # Torn last line after a crash
+        return events
+
+    async def _write(self, events: list, skip_existing: bool = False):
+        async with self.session_factory() as db:
+            if skip_existing:
+                existing = set((await db.scalars(
+                    select(APIUsage.id).where(APIUsage.id.in_([event["id"] for event in events]))
+                )).all())
+                events = [event for event in events if event["id"] not in existing]
+            if events:
+                await db.execute(insert(APIUsage), [
+                    {name: value for name, value in event.items() if name != "route"} for event in events
+                ])
+                await apply_rollups(db, events)
+                await db.commit()
+                increment_counters(events, self.cache)
+
+    async def flush(self) -> int:
+        """
+        Write every queued event
+
+        Returns:
+            Number of events written
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            if self._pending_replay:
+                await self._replay()
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                started = time.perf_counter()
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    self._stats["failed_flushes"] += 1
+                    self._failed_attempts += 1
+                    logger.error(f"Failed to write {len(batch)} usage events: {e}")
+                    if self._failed_attempts >= self.max_retries:
+                        # Don't let one poison batch block everything queued behind it
+                        self._failed_attempts = 0
+                        self._dead_letter(batch)
+                        continue
+                    # Put the batch back and retry on the next tick
+                    self._queue.extendleft(reversed(batch))
+                    break
+                self._failed_attempts = 0
+                written += len(batch)
+                self._stats["flushed"] += len(batch)
+                self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+            if not self._queue and not self._pending_replay:
+                # Everything spooled so far is committed
+                self._truncate_spool()
+        return written
+
+    async def _replay(self):
+        """Write events spooled by a previous process, skipping ones already committed"""
+        try:
+            while self._pending_replay:
+                await self._write(self._pending_replay[:self.batch_size], skip_existing=True)
+                del self._pending_replay[:self.batch_size]
+        except Exception as e:
+            logger.error(f"Failed to replay usage spool ({len(self._pending_replay)} events left): {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        """Replay the spool left by a previous process and start the flush loop"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+        self._pending_replay = self._read_spool()
+        if self._pending_replay:
+            logger.info(f"Replaying {len(self._pending_replay)} spooled usage events")
+            await self.flush()
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def stats(self) -> dict:
+        """Get recorder statistics"""
+        return {**self._stats, "queued": len(self._queue)}
+
+
+def _spool_line(event: dict) -> str:
+    return json.dumps({**event, "created_at": event["created_at"].isoformat()}) + "\n"
+
+
+usage_recorder = UsageRecorder()
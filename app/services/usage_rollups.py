@@ -0,0 +1,197 @@
+"""
+Incrementally maintained usage rollups
+
+Every batch written by the usage recorder is folded into UsageRollup rows
+(per API key, endpoint and hour/day bucket) in the same transaction, with an
+INSERT ... ON CONFLICT DO UPDATE that adds to the existing counters. Stats
+and dashboards read these rows instead of scanning api_usage.
+
+Usage recorded before the rollups existed is folded in once by
+backfill_rollups() (migration 0003, or python rebuild_rollups.py).
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from app.models.usage import APIUsage, UsageRollup, ROLLUP_LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+
+KEY_COLUMNS = ("api_key_id", "granularity", "bucket_start", "endpoint")
+LATENCY_COLUMNS = tuple(f"latency_le_{bound}ms" for bound in ROLLUP_LATENCY_BUCKETS_MS) + (
+    f"latency_gt_{ROLLUP_LATENCY_BUCKETS_MS[-1]}ms",
+)
+SUM_COLUMNS = (
+    "request_count", "error_count", "query_count", "cost_sum", "latency_sum_ms", "latency_count"
+) + LATENCY_COLUMNS
+
+# Rows per INSERT statement (keeps bound parameters under SQLite's limit)
+UPSERT_CHUNK = 500
+
+
+# Raw endpoints that embed an identifier, mapped back to their route template
+_ROUTE_PREFIXES = {
+    "/api/v1/expirations/": "/api/v1/expirations/{patent_id}",
+}
+
+
+def route_template(endpoint: str) -> str:
+    """Route template for a recorded endpoint path"""
+    for prefix, template in _ROUTE_PREFIXES.items():
+        if endpoint.startswith(prefix) and len(endpoint) > len(prefix):
+            return template
+    return endpoint
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the hour/day bucket holding timestamp"""
+    if granularity == HOUR:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_column(latency_ms: float) -> str:
+    """Histogram column counting a request of this latency"""
+    for bound, column in zip(ROLLUP_LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if latency_ms <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+
+def rollup_deltas(events: Iterable[dict]) -> List[dict]:
+    """
+    Fold usage events into rollup increments
+
+    Args:
+        events: Dicts with api_key_id, endpoint (or route), created_at,
+            response_status, response_time_ms, query_count and cost
+
+    Returns:
+        One row per (api_key_id, granularity, bucket_start, endpoint)
+    """
+    rows: Dict[Tuple, dict] = {}
+    for event in events:
+        for granularity in (HOUR, DAY):
+            key = (
+                event["api_key_id"],
+                granularity,
+                bucket_start(event["created_at"], granularity),
+                event.get("route") or event["endpoint"],
+            )
+            row = rows.get(key)
+            if row is None:
+                row = dict(zip(KEY_COLUMNS, key), **{column: 0 for column in SUM_COLUMNS})
+                rows[key] = row
+            row["request_count"] += 1
+            row["error_count"] += 1 if event["response_status"] >= 400 else 0
+            row["query_count"] += event.get("query_count") or 0
+            row["cost_sum"] += event.get("cost") or 0.0
+            latency = event.get("response_time_ms")
+            if latency is not None:
+                row["latency_sum_ms"] += latency
+                row["latency_count"] += 1
+                row[latency_column(latency)] += 1
+    return list(rows.values())
+
+
+def upsert_statements(dialect_name: str, rows: List[dict]) -> list:
+    """INSERT ... ON CONFLICT statements that add rows to existing counters"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Usage rollups need ON CONFLICT support, not available on {dialect_name}")
+
+    statements = []
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        stmt = insert(UsageRollup).values(rows[i:i + UPSERT_CHUNK])
+        statements.append(stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={column: getattr(UsageRollup, column) + getattr(stmt.excluded, column) for column in SUM_COLUMNS}
+        ))
+    return statements
+
+
+async def apply_rollups(db, events: List[dict]):
+    """Add events to the rollups inside the caller's (async) transaction"""
+    rows = rollup_deltas(events)
+    if rows:
+        for stmt in upsert_statements(db.bind.dialect.name, rows):
+            await db.execute(stmt)
+
+
+def rebuild_rollups(
+    db: Session,
+    since: Optional[datetime] = None,
+    batch_size: int = 5000,
+    include_archives: bool = True
+) -> int:
+    """
+    Recompute rollups from raw usage rows (backfill or repair)
+
+    Args:
+        db: Sync session on the primary
+        since: Only rebuild buckets from this day on (default: everything)
+        batch_size: Raw rows folded per upsert
+        include_archives: Also fold months already moved to usage archive files
+
+    Returns:
+        Number of usage rows folded
+    """
+    since = bucket_start(since, DAY) if since else None
+    purge = delete(UsageRollup)
+    query = select(
+        APIUsage.api_key_id, APIUsage.endpoint, APIUsage.created_at, APIUsage.response_status,
+        APIUsage.response_time_ms, APIUsage.query_count, APIUsage.cost
+    ).where(APIUsage.created_at.isnot(None))
+    if since:
+        purge = purge.where(UsageRollup.bucket_start >= since)
+        query = query.where(APIUsage.created_at >= since)
+    db.execute(purge)
+
+    def fold(rows) -> int:
+        events = [{**row, "route": route_template(row["endpoint"])} for row in rows]
+        for stmt in upsert_statements(dialect_name, rollup_deltas(events)):
+            db.execute(stmt)
+        return len(events)
+
+    folded = 0
+    dialect_name = db.get_bind().dialect.name
+    for partition in db.execute(query.execution_options(yield_per=batch_size)).mappings().partitions():
+        folded += fold(partition)
+    if include_archives:
+        from app.services.usage_archive import iter_archived_usage
+        archived = iter_archived_usage(start=since)
+        while batch := list(islice(archived, batch_size)):
+            folded += fold(batch)
+    db.commit()
+    logger.info(f"Rebuilt usage rollups from {folded} usage rows")
+    return folded
+
+
+def backfill_rollups(db: Session) -> int:
+    """
+    Build the rollups from existing usage if they are still empty
+
+    Meant to run before the usage recorder starts maintaining them (migration
+    0003 does); once any rollup exists this is a no-op and rebuild_rollups is
+    the repair tool.
+
+    Returns:
+        Number of usage rows folded (0 if the rollups were already populated)
+    """
+    if db.scalar(select(UsageRollup.api_key_id).limit(1)) is not None:
+        logger.info("Usage rollups already populated; skipping backfill")
+        return 0
+    return rebuild_rollups(db)
+
+
+def rollup_window_start(days: int, now: Optional[datetime] = None) -> datetime:
+    """First day bucket of a window covering the last `days` days (today included)"""
+    return bucket_start(now or datetime.utcnow(), DAY) - timedelta(days=days - 1)
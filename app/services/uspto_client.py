@@ -2,30 +2,47 @@
 USPTO API client for patent data
 """
 import httpx
+import hashlib
 import json
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from app.config import settings
-from app.services.cache_service import CacheService
+from app.services.cache_service import CacheService, get_cache_service
 from app.utils.helpers import calculate_patent_expiration
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fields requested from PatentsView
+PATENT_FIELDS = [
+    "patent_number",
+    "patent_title",
+    "patent_abstract",
+    "patent_date",
+    "inventor_last_name",
+    "assignee_organization"
+]
+
 
 class USPTOClient:
     """Client for querying USPTO PatentsView API"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[CacheService] = None):
         self.api_key = settings.uspto_api_key
         self.base_url = settings.uspto_patentsview_url
-        self.cache = CacheService()
+        self._cache = cache
         self.timeout = 30.0
     
+    @property
+    def cache(self) -> CacheService:
+        """Injected cache, or the shared process-wide one (resolved on first use)"""
+        return self._cache or get_cache_service()
+    
     def _get_cache_key(self, query_params: dict) -> str:
         """Generate cache key from query parameters"""
+        # hash() is salted per process, so use a stable digest that every worker agrees on
         key_str = json.dumps(query_params, sort_keys=True)
-        return f"uspto_query:{hash(key_str)}"
+        return f"uspto_query:{hashlib.sha1(key_str.encode()).hexdigest()}"
     
     def _build_query(self, start_date: datetime, end_date: datetime,
                      industry_keywords: Optional[List[str]] = None) -> dict:
@@ -62,7 +79,8 @@ class USPTOClient:
         end_date: datetime,
         industry_keywords: Optional[List[str]] = None,
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        use_cache: bool = True
     ) -> List[Dict]:
         """
         Get patents expiring in the specified date range
@@ -73,6 +91,7 @@ class USPTOClient:
             industry_keywords: Optional list of keywords to filter by
             limit: Maximum number of results
             offset: Offset for pagination
+            use_cache: Read from cache (results are always written back)
             
         Returns:
             List of patent dictionaries
@@ -86,30 +105,25 @@ class USPTOClient:
             "offset": offset
         })
         
-        cached_result = self.cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Cache hit for query: {cache_key}")
-            return cached_result
+        if use_cache:
+            cached_result, is_stale = self.cache.get_with_staleness(cache_key)
+            if cached_result is not None:
+                logger.info(f"Cache hit for query: {cache_key}")
+                if is_stale:
+                    # Serve stale results now, refresh in the background
+                    self.cache.revalidate(cache_key, lambda: self.get_expiring_patents(
+                        start_date, end_date, industry_keywords, limit, offset, use_cache=False
+                    ))
+                return cached_result
         
         # Build query
         query = self._build_query(start_date, end_date, industry_keywords)
         
-        # PatentsView API request
-        request_data = {
-            "q": query,
-            "f": [
-                "patent_number",
-                "patent_title",
-                "patent_abstract",
-                "patent_date",
-                "inventor_last_name",
-                "assignee_organization"
-            ],
-            "o": {
-                "per_page": limit,
-                "page": (offset // limit) + 1
-            }
-        }
+        # PatentsView pages by page number; an offset that isn't a multiple of
+        # limit straddles two pages, so fetch both and slice
+        first_page = offset // limit + 1
+        skip = offset % limit
+        pages = [first_page, first_page + 1] if skip else [first_page]
         
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
@@ -117,21 +131,28 @@ class USPTOClient:
                 if self.api_key:
                     headers["X-API-Key"] = self.api_key
                 
-                response = await client.post(
-                    self.base_url,
-                    json=request_data,
-                    headers=headers
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                patents = data.get("patents", [])
+                patents = []
+                for page in pages:
+                    response = await client.post(
+                        self.base_url,
+                        json={"q": query, "f": PATENT_FIELDS, "o": {"per_page": limit, "page": page}},
+                        headers=headers
+                    )
+                    response.raise_for_status()
+                    page_patents = response.json().get("patents", [])
+                    patents.extend(page_patents)
+                    if len(page_patents) < limit:
+                        break
+                patents = patents[skip:skip + limit]
                 
                 # Process and enrich patent data
                 processed_patents = self._process_patents(patents, start_date, end_date)
                 
-                # Cache results
-                self.cache.set(cache_key, processed_patents, ttl=3600)  # 1 hour cache
+                # Cache results, and each patent individually for ID lookups
+                with self.cache.pipeline() as batch:
+                    batch.set_with_soft_ttl(cache_key, processed_patents, soft_ttl=settings.uspto_query_cache_ttl)
+                    for patent in processed_patents:
+                        batch.set(self._patent_cache_key(patent["id"]), patent, ttl=86400)
                 
                 return processed_patents
                 
@@ -143,6 +164,56 @@ class USPTOClient:
             logger.error(f"Unexpected error querying USPTO: {e}")
             return []
     
+    async def fetch_expiring_range(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        page_size: int = 1000,
+        max_pages: int = 50
+    ) -> Optional[List[Dict]]:
+        """
+        Fetch every patent expiring in a date range, page by page
+        
+        Unlike get_expiring_patents, failures are not hidden behind an empty
+        list: the result is either complete or None, so callers can record
+        the range as fully synced.
+        
+        Args:
+            start_date: Start of expiration date range
+            end_date: End of expiration date range
+            page_size: Patents requested per page
+            max_pages: Give up (return None) if the range needs more pages
+            
+        Returns:
+            Processed patents, or None if any page failed or the range was too large
+        """
+        query = self._build_query(start_date, end_date)
+        patents = []
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                headers = {"X-API-Key": self.api_key} if self.api_key else {}
+                for page in range(1, max_pages + 1):
+                    response = await client.post(
+                        self.base_url,
+                        json={
+                            "q": query,
+                            "f": PATENT_FIELDS,
+                            "o": {"per_page": page_size, "page": page}
+                        },
+                        headers=headers
+                    )
+                    response.raise_for_status()
+                    raw = response.json().get("patents") or []
+                    patents.extend(self._process_patents(raw, start_date, end_date))
+                    if len(raw) < page_size:
+                        return patents
+        except Exception as e:
+            logger.error(f"USPTO sync of {start_date:%Y-%m-%d}..{end_date:%Y-%m-%d} failed: {e}")
+            return None
+        
+        logger.warning(f"USPTO sync of {start_date:%Y-%m-%d}..{end_date:%Y-%m-%d} exceeded {max_pages} pages")
+        return None
+    
     def _process_patents(self, patents: List[Dict], start_date: datetime, end_date: datetime) -> List[Dict]:
         """Process raw patent data and calculate expiration dates"""
         processed = []
@@ -211,27 +282,58 @@ class USPTOClient:
         logger.warning("Using fallback bulk data query (limited functionality)")
         return []
     
+    def _patent_cache_key(self, patent_id: str) -> str:
+        """Cache key for a single processed patent"""
+        return f"patent:{patent_id}"
+    
+    def cache_patents(self, patents: List[Dict], ttl: int = 86400) -> bool:
+        """Store processed patents under their per-patent keys in one round-trip"""
+        return self.cache.mset_with_ttl(
+            {self._patent_cache_key(patent["id"]): patent for patent in patents if patent.get("id")},
+            ttl=ttl
+        )
+    
     async def get_patent_by_id(self, patent_id: str) -> Optional[Dict]:
-        """Get single patent by ID"""
-        cache_key = f"patent:{patent_id}"
+        """Get single patent by ID (served from the patent:{id} cache when present)"""
+        patents = await self.get_patents_by_ids([patent_id])
+        return patents.get(patent_id)
+    
+    async def get_patents_by_ids(self, patent_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get several patents by ID
+        
+        Cached patents are read with a single MGET; the rest are fetched from
+        USPTO in one query and written back in one pipeline.
+        
+        Args:
+            patent_ids: Patent numbers
+            
+        Returns:
+            Dict of patent ID -> patent dictionary for patents that were found
+        """
+        patent_ids = list(dict.fromkeys(patent_ids))
+        if not patent_ids:
+            return {}
         
         # Check cache
-        cached = self.cache.get(cache_key)
-        if cached:
-            return cached
+        cached = self.cache.mget([self._patent_cache_key(patent_id) for patent_id in patent_ids])
+        found = {
+            patent_id: cached[self._patent_cache_key(patent_id)]
+            for patent_id in patent_ids
+            if self._patent_cache_key(patent_id) in cached
+        }
+        missing = [patent_id for patent_id in patent_ids if patent_id not in found]
+        if not missing:
+            return found
         
         try:
-            query = {"patent_number": patent_id}
+            query = {"patent_number": missing[0] if len(missing) == 1 else missing}
             request_data = {
                 "q": query,
-                "f": [
-                    "patent_number",
-                    "patent_title",
-                    "patent_abstract",
-                    "patent_date",
-                    "inventor_last_name",
-                    "assignee_organization"
-                ]
+                "f": PATENT_FIELDS,
+                "o": {
+                    "per_page": len(missing)
+                }
             }
             
             async with httpx.AsyncClient(timeout=self.timeout) as client:
@@ -249,17 +351,13 @@ class USPTOClient:
                 data = response.json()
                 patents = data.get("patents", [])
                 
-                if patents:
-                    patent = patents[0]
-                    processed = self._process_patents([patent], datetime.min, datetime.max)
-                    if processed:
-                        result = processed[0]
-                        self.cache.set(cache_key, result, ttl=86400)  # 24 hour cache
-                        return result
+                processed = self._process_patents(patents, datetime.min, datetime.max)
+                if processed:
+                    self.cache_patents(processed, ttl=86400)  # 24 hour cache
+                    found.update({patent["id"]: patent for patent in processed})
                 
-                return None
+                return found
                 
         except Exception as e:
-            logger.error(f"Error fetching patent {patent_id}: {e}")
-            return None
-
+            logger.error(f"Error fetching patents {', '.join(missing)}: {e}")
+            return found
@@ -18,6 +18,25 @@ def calculate_patent_expiration(grant_date: datetime) -> datetime:
     return grant_date + timedelta(days=365 * 20)
 
 
+def data_version(value) -> str:
+    """Stable digest of JSON-like data (datetimes included), used as an ETag version"""
+    encoded = json.dumps(value, sort_keys=True, default=str, separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def make_etag(version: str, branding: bool, representation: str = "json") -> str:
+    """Strong ETag for one representation of a data version"""
+    return f'"{version}-{representation}-{"b" if branding else "wl"}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as required for GET)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
 def hash_webhook_secret(secret: str) -> str:
     """Hash webhook secret for storage"""
     return hashlib.sha256(secret.encode()).hexdigest()
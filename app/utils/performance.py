@@ -1,37 +1,226 @@
 """
 Performance optimization utilities
 """
+from datetime import date, datetime
+from enum import Enum
 from functools import wraps
+import asyncio
+import hashlib
+import inspect
+import json
+import threading
 import time
 import logging
-from typing import Callable, Any
-from app.services.cache_service import CacheService
+from typing import Callable, Any, Optional, Iterable
+from app.services.cache_service import get_cache_service
+from app.services.local_cache import clone_value
 
 logger = logging.getLogger(__name__)
-cache_service = CacheService()
 
+# Arguments that never take part in a memoization key
+DEFAULT_IGNORED_ARGS = ("self", "cls", "db")
 
-def cache_result(ttl: int = 3600):
-    """Decorator to cache function results"""
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Generate cache key from function name and arguments
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
-            
-            # Check cache
-            cached = cache_service.get(cache_key)
-            if cached is not None:
-                logger.debug(f"Cache hit for {func.__name__}")
-                return cached
-            
-            # Execute function
-            result = await func(*args, **kwargs)
-            
-            # Cache result
-            cache_service.set(cache_key, result, ttl=ttl)
-            
+
+def canonicalize(value: Any) -> Any:
+    """
+    Convert a call argument into a stable, JSON-serializable form
+
+    Raises:
+        TypeError: If the value has no stable representation (e.g. arbitrary objects)
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, Enum):
+        return canonicalize(value.value)
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        items = [canonicalize(v) for v in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    if hasattr(value, "model_dump"):
+        return canonicalize(value.model_dump())
+    raise TypeError(f"Cannot build a stable cache key from {type(value).__name__}")
+
+
+def _is_empty(result: Any) -> bool:
+    """Default negative-result check"""
+    return result is None or result == [] or result == {}
+
+
+class _Call:
+    """In-flight call shared by concurrent callers"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution (per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self._futures: dict = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return clone_value(call.result)
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key: str, func: Callable[[], Any]) -> Any:
+        future = self._futures.get(key)
+        if future is not None and future.get_loop() is asyncio.get_running_loop():
+            return clone_value(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await func()
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        else:
+            future.set_result(result)
             return result
+        finally:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+
+single_flight = SingleFlight()
+
+
+def memoize(
+    ttl: int = 3600,
+    namespace: Optional[str] = None,
+    negative_ttl: Optional[int] = 60,
+    is_negative: Callable[[Any], bool] = _is_empty,
+    ignore: Iterable[str] = DEFAULT_IGNORED_ARGS,
+    version: int = 1
+):
+    """
+    Decorator to cache function results in the shared cache (L1 + Redis)
+
+    Keys are built from the bound arguments (defaults applied, ignored
+    arguments dropped), canonicalized and hashed, so f(1) and f(x=1) share
+    an entry. Concurrent identical calls in a process run the function once.
+    Works on both sync and async functions.
+
+    Args:
+        ttl: Seconds to cache regular results
+        namespace: Key namespace (defaults to module.qualname)
+        negative_ttl: Seconds to cache negative results; None to skip caching them
+        is_negative: Decides whether a result is negative (default: None or empty)
+        ignore: Argument names left out of the key (self, sessions, ...)
+        version: Bump to invalidate every existing entry
+
+    The decorated function gains cache_key(*args, **kwargs) and
+    invalidate(*args, **kwargs) helpers.
+    """
+    ignored = set(ignore)
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+        prefix = f"memo:{namespace or f'{func.__module__}.{func.__qualname__}'}:v{version}"
+
+        def cache_key(*args, **kwargs) -> str:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {
+                name: canonicalize(value)
+                for name, value in bound.arguments.items()
+                if name not in ignored
+            }
+            payload = json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+            return f"{prefix}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+        def try_key(args, kwargs) -> Optional[str]:
+            try:
+                return cache_key(*args, **kwargs)
+            except TypeError as e:
+                logger.debug(f"Not memoizing {func.__qualname__}: {e}")
+                return None
+
+        def lookup(key: str):
+            cached = get_cache_service().get(key)
+            if isinstance(cached, dict) and "v" in cached:
+                return True, cached["v"]
+            return False, None
+
+        def store(key: str, result: Any):
+            if is_negative(result):
+                if negative_ttl is None:
+                    return
+                get_cache_service().set(key, {"v": result}, ttl=negative_ttl)
+            else:
+                get_cache_service().set(key, {"v": result}, ttl=ttl)
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = try_key(args, kwargs)
+                if key is None:
+                    return await func(*args, **kwargs)
+
+                hit, value = lookup(key)
+                if hit:
+                    return value
+
+                async def compute():
+                    result = await func(*args, **kwargs)
+                    store(key, result)
+                    return result
+
+                return await single_flight.do_async(key, compute)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = try_key(args, kwargs)
+                if key is None:
+                    return func(*args, **kwargs)
+
+                hit, value = lookup(key)
+                if hit:
+                    return value
+
+                def compute():
+                    result = func(*args, **kwargs)
+                    store(key, result)
+                    return result
+
+                return single_flight.do(key, compute)
+
+        def invalidate(*args, **kwargs) -> bool:
+            return get_cache_service().delete(cache_key(*args, **kwargs))
+
+        wrapper.cache_key = cache_key
+        wrapper.invalidate = invalidate
         return wrapper
     return decorator
 
@@ -0,0 +1,91 @@
+"""
+Pre-encoded patent JSON
+
+A processed patent is formatted and encoded once, when its page is cached:
+it carries its branded and white-label JSON fragments plus a version digest.
+Responses splice the fragments into the envelope instead of formatting and
+encoding every patent again on each request.
+"""
+from typing import Any, Dict, List
+import json
+from fastapi import Response
+from app.utils.helpers import data_version, format_patent_response
+
+# Try to import orjson for faster encoding
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Fields added to processed patents (underscore-prefixed, so they never reach responses)
+FRAGMENTS_FIELD = "_fragments"
+VERSION_FIELD = "_version"
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def attach_fragments(patents: List[Dict]) -> List[Dict]:
+    """
+    Encode both response variants of patents that don't carry them yet (in place)
+
+    Fragments are stored as text so every cache codec can hold them.
+
+    Returns:
+        The same list
+    """
+    for patent in patents:
+        if FRAGMENTS_FIELD in patent:
+            continue
+        data = {key: value for key, value in patent.items() if not key.startswith("_")}
+        patent[VERSION_FIELD] = data_version(data)
+        patent[FRAGMENTS_FIELD] = {
+            "branded": dumps(format_patent_response(data, True)).decode(),
+            "white_label": dumps(format_patent_response(data, False)).decode(),
+        }
+    return patents
+
+
+def patent_json(patent: Dict, branding: bool) -> str:
+    """Response JSON for one patent: its stored fragment, or encoded now if it has none"""
+    fragments = patent.get(FRAGMENTS_FIELD)
+    if fragments:
+        return fragments["branded" if branding else "white_label"]
+    return dumps(format_patent_response(patent, branding)).decode()
+
+
+def page_version(patents: List[Dict], *extra: Any) -> str:
+    """
+    Data version of a page, computed without formatting or encoding fragments
+
+    Cached pages use their patents' stored versions; other pages (cursor
+    pages) digest the raw records, so a 304 never pays for encoding.
+    """
+    if all(VERSION_FIELD in patent for patent in patents):
+        versions = [patent[VERSION_FIELD] for patent in patents]
+    else:
+        versions = [{key: value for key, value in patent.items() if not key.startswith("_")} for patent in patents]
+    return data_version([versions, *extra])
+
+
+class PatentPageResponse(Response):
+    """
+    JSON envelope whose "data" list is spliced from patent fragments
+
+    Content is the envelope dict with "data" holding the processed patents
+    and "branding" selecting the variant; only the small envelope is encoded.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Dict) -> bytes:
+        envelope = dict(content)
+        patents = envelope.pop("data")
+        branding = envelope.pop("branding")
+        data = ",".join(patent_json(patent, branding) for patent in patents).encode()
+        rest = dumps(envelope)[1:] if envelope else b"}"
+        return b'{"data":[' + data + (b"]," if envelope else b"]") + rest
@@ -10,7 +10,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.database import Base
 from app.config import settings
-from app.models import APIKey, PatentExpiration, APIUsage, WebhookConfig
+from app.models import APIKey, PatentExpiration, PatentCoverage, APIUsage, UsageRollup, WebhookConfig
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
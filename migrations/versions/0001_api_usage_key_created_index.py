@@ -0,0 +1,30 @@
+"""Composite (api_key_id, created_at) index on api_usage
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Tables created by init_db() may already have the new index
+    op.create_index(
+        "ix_api_usage_api_key_id_created_at", "api_usage", ["api_key_id", "created_at"], if_not_exists=True
+    )
+    # Covered by the composite index's leading column
+    op.drop_index("ix_api_usage_api_key_id", table_name="api_usage", if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index("ix_api_usage_api_key_id", "api_usage", ["api_key_id"], if_not_exists=True)
+    op.drop_index("ix_api_usage_api_key_id_created_at", table_name="api_usage", if_exists=True)
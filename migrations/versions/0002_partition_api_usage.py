@@ -0,0 +1,78 @@
+"""Partition api_usage by month on Postgres
+
+The existing table becomes the DEFAULT partition, so no rows are copied;
+monthly partitions start next month and are kept ahead by the usage
+retention job. Other databases keep a single table (see usage_archive).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_api_usage_api_key_id_created_at": "(api_key_id, created_at)",
+    "ix_api_usage_created_at": "(created_at)",
+}
+
+
+def _next_months(count: int):
+    now = datetime.utcnow()
+    for i in range(1, count + 1):
+        index = now.year * 12 + now.month - 1 + i
+        start = datetime(index // 12, index % 12 + 1, 1)
+        end = datetime((index + 1) // 12, (index + 1) % 12 + 1, 1)
+        yield start, end
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("ALTER TABLE api_usage RENAME TO api_usage_default")
+    op.execute("ALTER TABLE api_usage_default RENAME CONSTRAINT api_usage_pkey TO api_usage_default_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name.replace('api_usage', 'api_usage_default', 1)}")
+    op.execute("ALTER TABLE api_usage_default ALTER COLUMN created_at SET NOT NULL")
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        "CREATE TABLE api_usage (LIKE api_usage_default INCLUDING DEFAULTS, "
+        "PRIMARY KEY (id, created_at), "
+        "FOREIGN KEY (api_key_id) REFERENCES api_keys (id)) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON api_usage {columns}")
+    op.execute("ALTER TABLE api_usage ATTACH PARTITION api_usage_default DEFAULT")
+
+    for start, end in _next_months(2):
+        op.execute(
+            f"CREATE TABLE api_usage_p{start:%Y_%m} PARTITION OF api_usage "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE TABLE api_usage_merged (LIKE api_usage INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO api_usage_merged SELECT * FROM api_usage")
+    op.execute("DROP TABLE api_usage CASCADE")
+    op.execute("ALTER TABLE api_usage_merged RENAME TO api_usage")
+    op.execute("ALTER TABLE api_usage ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE api_usage ADD FOREIGN KEY (api_key_id) REFERENCES api_keys (id)")
+    op.execute("ALTER TABLE api_usage ALTER COLUMN created_at DROP NOT NULL")
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON api_usage {columns}")
@@ -0,0 +1,32 @@
+"""Backfill api_usage_rollups from existing usage
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+from alembic import op
+from sqlalchemy.orm import Session
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    from app.models.usage import UsageRollup
+    from app.services.usage_rollups import backfill_rollups
+
+    bind = op.get_bind()
+    # Created by init_db() on databases that already started the new version
+    UsageRollup.__table__.create(bind, checkfirst=True)
+    # Stats and dashboards read only the rollups; fold in the usage recorded before them
+    backfill_rollups(Session(bind=bind))
+
+
+def downgrade() -> None:
+    # Rollups are derived data; leave them for the previous revision to ignore
+    pass
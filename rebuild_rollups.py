@@ -0,0 +1,39 @@
+"""
+Backfill or repair the usage rollup tables
+
+/api/v1/stats and the dashboard read only the rollups, so usage recorded
+before they existed has to be folded in once. Migration 0003 does this on
+`alembic upgrade head`; this script does the same for deployments that
+don't run migrations, and recomputes buckets after a repair.
+
+    python rebuild_rollups.py                      # fill empty rollups from api_usage (+ archives)
+    python rebuild_rollups.py --since 2026-10-01   # recompute buckets from a day on
+    python rebuild_rollups.py --all                # recompute every bucket
+
+Run it before the API starts (or while usage writes are stopped): rows
+recorded during a rebuild may be counted twice.
+"""
+import argparse
+from datetime import datetime
+from app.database import SessionLocal, init_db
+from app.services.usage_rollups import backfill_rollups, rebuild_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--since", type=datetime.fromisoformat, help="Recompute buckets from this day (YYYY-MM-DD)")
+    group.add_argument("--all", action="store_true", help="Recompute every bucket")
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        if args.since or args.all:
+            folded = rebuild_rollups(db, since=args.since)
+        else:
+            folded = backfill_rollups(db)
+    print(f"Folded {folded} usage rows into the rollups")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 @pytest.fixture
 def db():
     """Create test database session"""
+    from app.services.cache_service import get_cache_service
+    get_cache_service().local_cache.clear()  # Drop API keys resolved by earlier tests
     Base.metadata.create_all(bind=engine)
     db = TestingSessionLocal()
     try:
@@ -88,3 +90,19 @@ def test_valid_api_key(client, test_api_key):
     # May be 500 or other error if USPTO client not mocked
     assert response.status_code != 401
 
+
+
+def test_api_key_cached_until_revoked(client, db, test_api_key):
+    """Test resolved keys skip the database and revocation takes effect immediately"""
+    from unittest.mock import patch
+    headers = {"X-API-Key": test_api_key.key}
+    assert client.get("/api/v1/auth/keys/me", headers=headers).status_code == 200
+
+    with patch("sqlalchemy.ext.asyncio.AsyncSession.execute", side_effect=AssertionError("database queried")):
+        response = client.get("/api/v1/auth/keys/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == test_api_key.id
+
+    response = client.post(f"/api/v1/auth/keys/{test_api_key.id}/revoke")
+    assert response.status_code == 200
+    assert client.get("/api/v1/auth/keys/me", headers=headers).status_code == 401
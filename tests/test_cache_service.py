@@ -0,0 +1,327 @@
+"""
+Tests for cache service and serialization codec
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, date
+from app.services.cache_codec import CacheCodec, CacheCodecError
+from app.services.cache_service import CacheService, RATE_LIMIT_SCRIPT
+from app.services.local_cache import LocalCache
+
+
+@pytest.fixture
+def patent():
+    """Processed patent as returned by USPTOClient"""
+    return {
+        "id": "US12345678",
+        "title": "Test Patent",
+        "abstract": "Test abstract " * 200,
+        "grant_date": datetime(2005, 3, 1),
+        "expiration_date": datetime(2025, 2, 24),
+        "inventor": None,
+        "relevance_score": 0.5
+    }
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_codec_round_trips_datetimes(patent, compression):
+    """Test datetimes survive JSON with every compression"""
+    codec = CacheCodec(fmt="json", compression=compression, compression_threshold=64)
+    decoded = codec.decode(codec.encode([patent, {"day": date(2025, 1, 1)}]))
+
+    assert decoded[0] == patent
+    assert isinstance(decoded[0]["expiration_date"], datetime)
+    assert decoded[1]["day"] == date(2025, 1, 1)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "zstd"])
+def test_codec_msgpack_round_trips_datetimes(patent, compression):
+    """Test datetimes survive msgpack with every compression"""
+    pytest.importorskip("msgpack")
+    codec = CacheCodec(fmt="msgpack", compression=compression, compression_threshold=64)
+    payload = codec.encode([patent, {"day": date(2025, 1, 1)}])
+    decoded = codec.decode(payload)
+
+    assert (payload[0] >> 2) & 0x03 == 1  # msgpack format bits
+    assert decoded[0] == patent
+    assert isinstance(decoded[0]["expiration_date"], datetime)
+    assert decoded[1]["day"] == date(2025, 1, 1)
+
+
+def test_codec_msgpack_falls_back_to_json(patent):
+    """Test CACHE_CODEC=msgpack without msgpack installed writes JSON payloads"""
+    with patch("app.services.cache_codec.MSGPACK_AVAILABLE", False):
+        codec = CacheCodec(fmt="msgpack", compression="none")
+    payload = codec.encode({"a": 1})
+
+    assert (payload[0] >> 2) & 0x03 == 0  # JSON format bits
+    assert payload[1:] == b'{"a":1}'
+    assert codec.decode(payload) == {"a": 1}
+
+
+def test_codec_header_byte():
+    """Test payloads carry a versioned header byte"""
+    codec = CacheCodec(fmt="json", compression="none")
+    payload = codec.encode({"a": 1})
+
+    assert payload[0] >> 4 == 1
+    assert payload[1:] == b'{"a":1}'
+
+
+def test_codec_small_values_not_compressed():
+    """Test values below the threshold are stored uncompressed"""
+    codec = CacheCodec(fmt="json", compression="gzip", compression_threshold=1024)
+    assert codec.encode("short")[0] & 0x03 == 0
+
+
+def test_codec_reads_legacy_json():
+    """Test plain JSON written before the codec existed is still readable"""
+    codec = CacheCodec()
+    assert codec.decode(b'[{"id": "US1"}]') == [{"id": "US1"}]
+
+
+def test_codec_errors():
+    """Test unserializable values and corrupt payloads raise CacheCodecError"""
+    codec = CacheCodec()
+    with pytest.raises(CacheCodecError):
+        codec.encode({"session": object()})
+    with pytest.raises(CacheCodecError):
+        codec.decode(b"\x11not-gzip")
+
+
+def test_local_cache_lru_eviction():
+    """Test least recently used entries are evicted first"""
+    cache = LocalCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_local_cache_ttl():
+    """Test expired entries are not returned"""
+    cache = LocalCache(max_entries=10)
+    with patch("app.services.local_cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1, ttl=5)
+    with patch("app.services.local_cache.time.monotonic", return_value=106.0):
+        assert cache.get("a") is None
+
+
+@pytest.fixture
+def redis_cache():
+    """CacheService backed by a mocked Redis client"""
+    cache = CacheService()
+    cache.redis_client = MagicMock()
+    cache.local_cache.clear()
+    yield cache
+    cache.local_cache.clear()
+
+
+def test_l1_serves_hot_keys_without_redis(redis_cache, patent):
+    """Test hot keys are served from L1 and invalidated on write"""
+    redis_cache.redis_client.get.return_value = redis_cache.codec.encode(patent)
+
+    first = redis_cache.get("patent:US12345678")
+    first["title"] = "mutated by caller"
+    second = redis_cache.get("patent:US12345678")
+
+    assert redis_cache.redis_client.get.call_count == 1
+    assert second["title"] == "Test Patent"
+
+    redis_cache.delete("patent:US12345678")
+    redis_cache.redis_client.publish.assert_called_once()
+
+
+def test_invalidation_published_after_redis_delete(redis_cache):
+    """Test peers are told to drop a key only once Redis no longer holds it"""
+    calls = []
+    redis_cache.redis_client.delete.side_effect = lambda key: calls.append("delete") or 1
+    redis_cache.redis_client.publish.side_effect = lambda *args: calls.append("publish")
+
+    redis_cache.delete("patent:US1")
+    assert calls == ["delete", "publish"]
+
+    redis_cache.redis_client.delete.side_effect = ConnectionError("down")
+    redis_cache.redis_client.publish.reset_mock()
+    assert redis_cache.delete("patent:US2") is False
+    redis_cache.redis_client.publish.assert_not_called()
+
+
+def test_failed_pipeline_leaves_l1_untouched(redis_cache, patent):
+    """Test a batched write fills L1 only after Redis stored it"""
+    redis_cache.redis_client.pipeline.return_value.execute.side_effect = ConnectionError("down")
+    with redis_cache.pipeline() as batch:
+        batch.set("patent:US12345678", patent, ttl=60)
+    assert redis_cache.local_cache.get("patent:US12345678") is None
+    redis_cache.redis_client.publish.assert_not_called()
+
+    redis_cache.redis_client.pipeline.return_value.execute.side_effect = None
+    redis_cache.redis_client.pipeline.return_value.execute.return_value = [True]
+    with redis_cache.pipeline() as batch:
+        batch.set("patent:US12345678", patent, ttl=60)
+    assert redis_cache.local_cache.get("patent:US12345678") == patent
+    redis_cache.redis_client.publish.assert_called_once()
+
+
+def test_l1_ignores_other_prefixes(redis_cache):
+    """Test keys outside the hot prefixes always go to Redis"""
+    redis_cache.redis_client.get.return_value = redis_cache.codec.encode(1)
+    redis_cache.get("other:key")
+    redis_cache.get("other:key")
+    assert redis_cache.redis_client.get.call_count == 2
+
+
+@pytest.fixture
+def fake_redis_cache():
+    """CacheService backed by an in-memory Redis with Lua support"""
+    fakeredis = pytest.importorskip("fakeredis")
+    cache = CacheService()
+    cache.redis_client = fakeredis.FakeRedis()
+    try:
+        cache.redis_client.eval("return 1", 0)
+    except Exception:
+        pytest.skip("fakeredis installed without Lua support")
+    cache._rate_limit_script = cache.redis_client.register_script(RATE_LIMIT_SCRIPT)
+    return cache
+
+
+def test_rate_limit_consumes_all_windows_atomically(fake_redis_cache):
+    """Test quota is enforced and denied requests consume nothing"""
+    windows = [("minute", 3, 60), ("day", 100, 86400)]
+    results = [fake_redis_cache.consume_rate_limit("key", windows) for _ in range(4)]
+
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    assert results[3].retry_after > 0
+
+    # Day window only saw the three allowed requests
+    day = fake_redis_cache.consume_rate_limit("key", [("day", 100, 86400)])
+    assert day.remaining == 96
+
+
+@pytest.fixture
+def degraded_cache():
+    """CacheService running on the in-process fallback"""
+    cache = CacheService()
+    cache.redis_client = None
+    cache._last_connect_attempt = float("inf")  # No reconnect attempts
+    cache.fallback_cache.clear()
+    yield cache
+    cache.fallback_cache.clear()
+
+
+def test_fallback_cache_when_redis_down(degraded_cache, patent):
+    """Test values are still cached in-process without Redis"""
+    assert degraded_cache.is_degraded
+    assert degraded_cache.set("patent:US12345678", patent, ttl=60)
+    assert degraded_cache.get("patent:US12345678") == patent
+    assert degraded_cache.delete("patent:US12345678")
+    assert degraded_cache.get("patent:US12345678") is None
+
+
+def test_fallback_rate_limit_when_redis_down(degraded_cache):
+    """Test rate limits are still enforced per worker without Redis"""
+    windows = [("minute", 2, 60), ("day", 100, 86400)]
+    results = [degraded_cache.consume_rate_limit("fallback_key", windows) for _ in range(3)]
+
+    assert [r.allowed for r in results] == [True, True, False]
+    assert results[2].retry_after > 0
+
+
+def test_bulk_operations(fake_redis_cache, patent):
+    """Test mget/mset_with_ttl/delete_many and pipelines"""
+    cache = fake_redis_cache
+    cache.local_cache.clear()
+    assert cache.mset_with_ttl({"patent:A": patent, "other:B": 2}, ttl=60)
+
+    found = cache.mget(["patent:A", "other:B", "other:missing"])
+    assert found == {"patent:A": patent, "other:B": 2}
+
+    with cache.pipeline() as batch:
+        batch.increment("counter", 5).get("other:B").set_expiry("counter", 30)
+    assert batch.results == [5, 2, True]
+
+    assert cache.delete_many(["patent:A", "other:B", "other:missing"]) == 2
+    assert cache.mget(["patent:A", "other:B"]) == {}
+
+
+def test_hash_tags_colocate_related_keys():
+    """Test keys sharing a hash tag map to the same node"""
+    from app.services.redis_sharding import HashRing, hash_tag
+
+    ring = HashRing(node_count=4)
+    assert hash_tag("rate_limit:{pat_abc}:minute") == "pat_abc"
+    assert hash_tag("patent:US1") == "patent:US1"
+    assert ring.get_node("rate_limit:{pat_abc}:minute") == ring.get_node("rate_limit:{pat_abc}:day")
+    assert len({ring.get_node(f"patent:US{i}") for i in range(200)}) == 4
+
+
+def test_sharded_client_spreads_keys(patent):
+    """Test sharded MGET and pipelines return results in request order"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from app.services.redis_sharding import ShardedRedis
+
+    nodes = [fakeredis.FakeRedis(server=fakeredis.FakeServer()) for _ in range(3)]
+    cache = CacheService()
+    cache.redis_client = ShardedRedis(nodes)
+    cache.local_cache.clear()
+
+    keys = [f"other:{i}" for i in range(30)]
+    assert cache.mset_with_ttl({key: i for i, key in enumerate(keys)}, ttl=60)
+    assert cache.mget(keys) == {key: i for i, key in enumerate(keys)}
+    assert all(node.dbsize() > 0 for node in nodes)
+    assert sum(node.dbsize() for node in nodes) == 30
+
+
+def test_metrics_per_prefix(fake_redis_cache, patent):
+    """Test hits, misses, bytes and latency are tracked per key prefix"""
+    from app.services.cache_service import prefix_metrics, get_cache_metrics
+
+    prefix_metrics.reset()
+    fake_redis_cache.local_cache.clear()
+    fake_redis_cache.set("uspto_query:abc", [patent], ttl=60)
+    fake_redis_cache.get("uspto_query:missing")
+    fake_redis_cache.get("other:missing")
+    fake_redis_cache.set("other:bad", object())
+
+    metrics = get_cache_metrics()
+    query = metrics["prefixes"]["uspto_query"]
+    assert query["writes"] == 1
+    assert query["misses"] == 1
+    assert query["bytes_written"] > 0
+    assert query["operations"] == 2
+    assert query["p95_latency_ms"] is not None
+    assert metrics["prefixes"]["other"]["serialization_errors"] == 1
+    assert metrics["totals"]["misses"] == 2
+
+
+def test_shared_cache_service_and_pool_stats():
+    """Test one CacheService is shared per process and pool usage is reported"""
+    import redis
+    fakeredis = pytest.importorskip("fakeredis")
+    from app.services.cache_service import get_cache_service, close_cache_service
+    from app.services.redis_sharding import pool_stats
+
+    assert get_cache_service() is get_cache_service()
+
+    pool = redis.BlockingConnectionPool(
+        max_connections=4, timeout=1,
+        connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer()
+    )
+    connection = pool.get_connection()
+    stats = pool_stats([pool, redis.ConnectionPool(max_connections=2)])
+    assert stats == {"pools": 2, "max_connections": 6, "created": 1, "in_use": 1, "idle": 0}
+    pool.release(connection)
+    assert pool_stats([pool])["idle"] == 1
+
+    from app.services.redis_sharding import create_redis_client, connection_pools
+    client = create_redis_client("redis://localhost:6379/0", pool_timeout=1.0, max_connections=3)
+    assert isinstance(client.connection_pool, redis.BlockingConnectionPool)
+    assert pool_stats(connection_pools(client))["max_connections"] == 3
+
+    close_cache_service()
+    assert get_cache_service() is not None
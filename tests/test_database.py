@@ -0,0 +1,46 @@
+"""
+Tests for database engine setup and read replica routing
+"""
+import pytest
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+from app import database
+from app.database import create_db_engine, get_async_database_url
+
+
+def test_async_database_url():
+    """Test sync URLs map to their async drivers"""
+    assert get_async_database_url("sqlite:///./a.db") == "sqlite+aiosqlite:///./a.db"
+    assert get_async_database_url("postgresql://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """SQLite file standing in for a read replica"""
+    replica_engine = create_db_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    status = database.ReplicaStatus()
+    with patch.object(database, "replica_engine", replica_engine), \
+            patch.object(database, "ReadSessionLocal", sessionmaker(bind=replica_engine)), \
+            patch.object(database, "replica_status", status):
+        yield replica_engine, status
+    replica_engine.dispose()
+
+
+def test_read_sessions_use_replica_when_caught_up(replica):
+    """Test analytics sessions go to a healthy replica"""
+    replica_engine, status = replica
+    db = database.read_session()
+    assert db.get_bind() is replica_engine
+    assert status.snapshot()["usable"]
+    db.close()
+
+
+def test_read_sessions_fall_back_when_replica_lags(replica):
+    """Test analytics sessions use the primary while the replica is behind or down"""
+    _, status = replica
+    with patch.object(status, "claim_check", return_value=False):
+        status.record(database.settings.replica_max_lag_seconds + 1)
+        assert database.read_session().get_bind() is database.engine
+
+        status.record(None, RuntimeError("connection refused"))
+        assert database.read_session().get_bind() is database.engine
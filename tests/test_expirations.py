@@ -16,6 +16,8 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 @pytest.fixture
 def db():
     """Create test database session"""
+    from app.services.cache_service import get_cache_service
+    get_cache_service().local_cache.clear()  # Drop API keys resolved by earlier tests
     Base.metadata.create_all(bind=engine)
     db = TestingSessionLocal()
     try:
@@ -105,6 +107,90 @@ def test_get_patent_by_id(mock_get_patent, client, test_api_key, mock_patent_dat
     assert data["patent_id"] == "US12345678"
 
 
+@patch("app.api.routes.expirations.uspto_client.get_expiring_patents")
+def test_get_expirations_streamed(mock_get_patents, client, test_api_key, mock_patent_data):
+    """Test ndjson and csv responses stream one formatted patent per line"""
+    import csv
+    import io
+    import json
+    mock_get_patents.return_value = mock_patent_data
+
+    response = client.get(
+        "/api/v1/expirations",
+        headers={"X-API-Key": test_api_key.key},
+        params={"limit": 5, "industry": "energy", "format": "ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["patent_id"] for line in lines] == ["US12345678"]
+    assert response.headers["X-Total-Count"] == "1"
+    assert "X-RateLimit-Remaining" in response.headers
+
+    response = client.get(
+        "/api/v1/expirations",
+        headers={"X-API-Key": test_api_key.key},
+        params={"limit": 5, "industry": "energy", "format": "csv", "branding": False}
+    )
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows[0]["patent_id"] == "US12345678"
+    assert "X-RateLimit-Remaining" in response.headers
+    assert "powered_by" not in rows[0]
+
+
+@patch("app.api.routes.expirations.uspto_client.get_patent_by_id")
+@patch("app.api.routes.expirations.uspto_client.get_expiring_patents")
+def test_conditional_requests(mock_get_patents, mock_get_patent, client, test_api_key, mock_patent_data):
+    """Test unchanged data answers If-None-Match with 304 and no body"""
+    import copy
+    mock_get_patents.return_value = mock_patent_data
+    mock_get_patent.side_effect = lambda patent_id: copy.deepcopy(mock_patent_data[0])
+    headers = {"X-API-Key": test_api_key.key}
+
+    for path, params in [("/api/v1/expirations", {"limit": 3, "industry": "materials"}),
+                         ("/api/v1/expirations/US12345678", {})]:
+        first = client.get(path, headers=headers, params=params)
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+        assert "X-API-Key" in first.headers["Vary"]
+        assert "max-age" in first.headers["Cache-Control"]
+
+        second = client.get(path, headers={**headers, "If-None-Match": etag}, params=params)
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+        assert "X-RateLimit-Remaining" in second.headers
+
+        # Another representation (white-label) never matches the branded validator
+        other = client.get(path, headers={**headers, "If-None-Match": etag}, params={**params, "branding": False})
+        if path == "/api/v1/expirations":
+            assert other.status_code == 200 and other.headers["ETag"] != etag
+
+
+@patch("app.api.routes.expirations.uspto_client.get_expiring_patents")
+def test_cached_pages_carry_encoded_fragments(mock_get_patents, client, test_api_key, mock_patent_data):
+    """Test list responses splice the fragments stored with the cached page"""
+    from app.api.routes.expirations import expiration_service
+    from app.utils.helpers import format_patent_response
+    from app.utils.responses import FRAGMENTS_FIELD
+    from app.utils.validators import ExpirationQueryParams
+    mock_get_patents.return_value = mock_patent_data
+    params = {"limit": 4, "industry": "electronics", "branding": False}
+
+    response = client.get("/api/v1/expirations", headers={"X-API-Key": test_api_key.key}, params=params)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["data"] == [format_patent_response(mock_patent_data[0], False)]
+    assert body["count"] == 1 and body["next_cursor"] is None
+    for header in ("X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"):
+        assert header in response.headers
+
+    query = ExpirationQueryParams(industry="electronics", limit=4)
+    cached, _ = expiration_service.cache.get_with_staleness(expiration_service._cache_key(query))
+    assert set(cached[0][FRAGMENTS_FIELD]) == {"branded", "white_label"}
+
+
 def test_expirations_query_params(client, test_api_key):
     """Test query parameters validation"""
     response = client.get(
@@ -116,3 +202,183 @@ def test_expirations_query_params(client, test_api_key):
     # Should return validation error
     assert response.status_code in [400, 422]
 
+
+
+@pytest.mark.asyncio
+async def test_warm_standard_queries(mock_patent_data):
+    """Test warming fills the processed cache for every standard query"""
+    from app.services.expiration_service import (
+        ExpirationService, STANDARD_INDUSTRIES, STANDARD_DATE_RANGES
+    )
+    from app.utils.validators import ExpirationQueryParams
+
+    service = ExpirationService()
+    service.uspto_client.get_expiring_patents = AsyncMock(return_value=mock_patent_data)
+
+    with patch("app.services.expiration_service.settings.cache_warm_stagger_seconds", 0):
+        warmed = await service.warm_standard_queries()
+
+    assert warmed == len(STANDARD_INDUSTRIES) * len(STANDARD_DATE_RANGES)
+
+    # Warmed cells are served without calling USPTO again
+    service.uspto_client.get_expiring_patents.reset_mock()
+    query = ExpirationQueryParams(industry="biotech", date_range="next_90_days")
+    patents = await service.get_processed_patents(query)
+    assert patents[0]["id"] == "US12345678"
+    service.uspto_client.get_expiring_patents.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stale_results_served_while_revalidating(mock_patent_data):
+    """Test soft-expired results are returned immediately and refreshed once in the background"""
+    import asyncio
+    from app.services.expiration_service import ExpirationService
+    from app.utils.validators import ExpirationQueryParams
+
+    service = ExpirationService()
+    service.uspto_client.get_expiring_patents = AsyncMock(return_value=mock_patent_data)
+    query = ExpirationQueryParams(industry="software", date_range="next_7_days")
+    cache_key = service._cache_key(query)
+    service.cache.delete(f"lock:revalidate:{cache_key}")
+    service.cache.set_with_soft_ttl(cache_key, [{"id": "US_STALE"}], soft_ttl=0)
+
+    first = await service.get_processed_patents(query)
+    second = await service.get_processed_patents(query)
+    assert first[0]["id"] == second[0]["id"] == "US_STALE"
+
+    # The refresh checks the local patent store before falling back to USPTO
+    from app.services.cache_service import _background_refreshes
+    await asyncio.gather(*_background_refreshes)
+    service.uspto_client.get_expiring_patents.assert_awaited_once()
+    refreshed, is_stale = service.cache.get_with_staleness(cache_key)
+    assert refreshed[0]["id"] == "US12345678"
+    assert not is_stale
+
+
+@pytest.mark.asyncio
+async def test_synced_ranges_served_from_local_store(db):
+    """Test covered date ranges are answered from patent_expirations without USPTO or summarization"""
+    from app.models.patent import PatentExpiration
+    from app.services.expiration_service import ExpirationService
+    from app.services.patent_store import record_coverage
+    from app.utils.validators import ExpirationQueryParams
+
+    query = ExpirationQueryParams(industry="automotive", date_range="next_30_days", limit=10)
+    start_date, end_date = query.get_date_range_tuple()
+    for patent_id, days, abstract, area in [
+        ("US1", 5, "A solar panel mount", "energy"),
+        ("US2", 10, "A brake caliper", "automotive"),
+        ("US3", 20, "Battery energy storage with fuel cell", "energy"),
+        ("US4", 25, "Vehicle engine with transmission and brake", "automotive"),
+    ]:
+        db.add(PatentExpiration(
+            id=patent_id, title=f"Patent {patent_id}", abstract=abstract, grant_date=datetime(2006, 1, 1),
+            expiration_date=start_date + timedelta(days=days), technology_area=area, ai_summary="stored summary"
+        ))
+    record_coverage(db, start_date, end_date + timedelta(days=60))
+    db.commit()
+
+    service = ExpirationService()
+    service.uspto_client.get_expiring_patents = AsyncMock()
+    service.uspto_client.get_patent_by_id = AsyncMock()
+    service.ai_service.summarize_abstract = lambda *args, **kwargs: pytest.fail("summarized again")
+    service.cache.delete(service._cache_key(query))
+
+    patents = await service.get_processed_patents(query, refresh=True)
+    assert [patent["id"] for patent in patents] == ["US2", "US4"]  # Ordered by expiration date
+    assert patents[1]["relevance_score"] > patents[0]["relevance_score"]
+    assert patents[0]["ai_summary"] == "stored summary"
+    assert (await service.get_patent("US1"))["technology_area"] == "energy"
+    service.uspto_client.get_expiring_patents.assert_not_called()
+    service.uspto_client.get_patent_by_id.assert_not_called()
+
+    # Beyond the synced range USPTO is still consulted
+    service.uspto_client.get_expiring_patents.return_value = []
+    await service.get_processed_patents(ExpirationQueryParams(date_range="next_365_days"), refresh=True)
+    service.uspto_client.get_expiring_patents.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_cursor_pagination_stable_across_refresh(db):
+    """Test cursors page by (expiration_date, id) without repeats or skips while a sync lands between pages"""
+    from app.models.patent import PatentExpiration
+    from app.services.expiration_service import ExpirationService, InvalidCursorError
+    from app.services.patent_store import record_coverage
+    from app.utils.validators import ExpirationQueryParams
+
+    query = ExpirationQueryParams(date_range="next_30_days", limit=2)
+    start_date, end_date = query.get_date_range_tuple()
+    # US3 and US4 share an expiration date, so the id breaks the tie
+    for patent_id, days in [("US1", 1), ("US2", 2), ("US4", 3), ("US3", 3), ("US5", 4)]:
+        db.add(PatentExpiration(
+            id=patent_id, title=f"Patent {patent_id}", grant_date=datetime(2006, 1, 1),
+            expiration_date=start_date + timedelta(days=days)
+        ))
+    record_coverage(db, start_date, end_date)
+    db.commit()
+
+    service = ExpirationService()
+    service.uspto_client.get_expiring_patents = AsyncMock()
+    service.cache.delete(service._cache_key(query))
+    service.cache.delete(f"{service._cache_key(query).rsplit(':', 2)[0]}:meta")
+
+    first = await service.get_page(query)
+    assert [patent["id"] for patent in first["patents"]] == ["US1", "US2"]
+    assert first["total"] == 5
+
+    # A sync lands: a patent before the cursor appears and the snapshot changes
+    db.add(PatentExpiration(
+        id="US0", title="Patent US0", grant_date=datetime(2006, 1, 1), expiration_date=start_date
+    ))
+    record_coverage(db, start_date, end_date)
+    db.commit()
+    service.invalidate_cached_queries()
+
+    second = await service.get_page(query, first["next_cursor"])
+    assert [patent["id"] for patent in second["patents"]] == ["US3", "US4"]
+    assert second["total"] == 6
+    # Versioning a page for its ETag doesn't encode it
+    from app.utils.responses import FRAGMENTS_FIELD, page_version
+    assert page_version(second["patents"], second["total"]) == page_version(second["patents"], second["total"])
+    assert not any(FRAGMENTS_FIELD in patent for patent in second["patents"])
+    third = await service.get_page(query, second["next_cursor"])
+    assert [patent["id"] for patent in third["patents"]] == ["US5"]
+    assert third["next_cursor"] is None
+    service.uspto_client.get_expiring_patents.assert_not_called()
+
+    # Streamed pages stop at the same boundary and hand out the same cursors
+    streamed = await service.stream_page(query)
+    assert [patent["id"] async for patent in streamed["patents"]] == ["US0", "US1"]
+    assert streamed["total"] == 6
+    streamed = await service.stream_page(query, streamed["next_cursor"])
+    assert [patent["id"] async for patent in streamed["patents"]] == ["US2", "US3"]
+    assert streamed["total"] == 6
+
+    with pytest.raises(InvalidCursorError):
+        await service.get_page(ExpirationQueryParams(industry="biotech", limit=2), first["next_cursor"])
+    with pytest.raises(InvalidCursorError):
+        await service.get_page(query, "not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_failed_patent_sync_is_retried(db, mock_patent_data):
+    """Test a failed sync releases its lock for the retry, and a successful one retires cached pages"""
+    from app.models.patent import PatentExpiration
+    from app.services.patent_store import range_covered
+    from app.services.scheduler import SchedulerService
+    from app.utils.validators import ExpirationQueryParams
+
+    scheduler = SchedulerService()
+    scheduler.uspto_client.fetch_expiring_range = AsyncMock(return_value=None)
+    assert await scheduler.refresh_patent_cache() is False
+
+    scheduler.uspto_client.fetch_expiring_range = AsyncMock(return_value=mock_patent_data)
+    scheduler.ai_service.process_patents = lambda patents: patents
+    stale_key = scheduler.expiration_service._cache_key(ExpirationQueryParams())
+    assert await scheduler.refresh_patent_cache() is True
+    # Cached pages and totals from before the sync are no longer served
+    assert scheduler.expiration_service._cache_key(ExpirationQueryParams()) != stale_key
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    assert range_covered(db, today, today + timedelta(days=30))
+    assert db.get(PatentExpiration, "US12345678") is not None
@@ -0,0 +1,101 @@
+"""
+Tests for memoization utilities
+"""
+import asyncio
+import pytest
+from datetime import datetime
+from app.utils.performance import memoize, canonicalize
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    """Isolate memoized entries between tests"""
+    from app.services.cache_service import get_cache_service
+    cache_service = get_cache_service()
+    cache_service.local_cache.clear()
+    cache_service.fallback_cache.clear()
+    yield
+
+
+def test_cache_key_is_stable():
+    """Test keys ignore self, apply defaults and canonicalize values"""
+    class Client:
+        @memoize(namespace="test.stable")
+        def lookup(self, patent_id, since=datetime(2020, 1, 1), tags=()):
+            return patent_id
+
+    a, b = Client(), Client()
+    assert a.lookup.cache_key(a, "US1") == b.lookup.cache_key(b, patent_id="US1", since=datetime(2020, 1, 1))
+    assert a.lookup.cache_key(a, "US1") != a.lookup.cache_key(a, "US2")
+    assert canonicalize({"b": {1, 2}, "a": (1,)}) == {"b": [1, 2], "a": [1]}
+    with pytest.raises(TypeError):
+        canonicalize(object())
+
+
+def test_memoize_sync_and_negative_results():
+    """Test results and negative results are cached and can be invalidated"""
+    calls = []
+
+    @memoize(namespace="test.sync", negative_ttl=60)
+    def find(patent_id):
+        calls.append(patent_id)
+        return None if patent_id == "missing" else {"id": patent_id}
+
+    assert find("US1") == find("US1") == {"id": "US1"}
+    assert find("missing") is None and find("missing") is None
+    assert calls == ["US1", "missing"]
+
+    find.invalidate("US1")
+    find("US1")
+    assert calls == ["US1", "missing", "US1"]
+
+
+def test_memoize_skips_negative_results_when_disabled():
+    """Test negative_ttl=None leaves negative results uncached"""
+    calls = []
+
+    @memoize(namespace="test.no_negative", negative_ttl=None)
+    def find(patent_id):
+        calls.append(patent_id)
+        return []
+
+    find("US1")
+    find("US1")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_memoize_async_single_flight():
+    """Test concurrent identical calls run the function once"""
+    calls = []
+
+    @memoize(namespace="test.async")
+    async def fetch(patent_id):
+        calls.append(patent_id)
+        await asyncio.sleep(0.01)
+        return {"id": patent_id}
+
+    results = await asyncio.gather(*(fetch("US1") for _ in range(5)))
+    assert all(result == {"id": "US1"} for result in results)
+    assert calls == ["US1"]
+
+
+def test_failed_summary_retried_on_next_call():
+    """Test a summarizer error is not memoized as a missing summary"""
+    from app.services.ai_service import AIService
+    calls = []
+
+    def summarizer(abstract, **kwargs):
+        calls.append(abstract)
+        if len(calls) == 1:
+            raise RuntimeError("inference endpoint timed out")
+        return [{"summary_text": "A short summary"}]
+
+    service = AIService.__new__(AIService)
+    service.summarizer = summarizer
+    abstract = "A transient failure test abstract"
+
+    assert service.summarize_abstract(abstract) is None
+    assert service.summarize_abstract(abstract) == "A short summary"
+    assert service.summarize_abstract(abstract) == "A short summary"
+    assert len(calls) == 2
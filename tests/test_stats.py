@@ -0,0 +1,65 @@
+"""
+Tests for usage statistics
+"""
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import Base, SessionLocal, engine
+from app.models.user import APIKey
+from app.models.usage import UsageRollup
+from app.services.usage_rollups import DAY, bucket_start
+
+
+@pytest.fixture
+def db():
+    """Create test database session"""
+    from app.services.cache_service import get_cache_service
+    get_cache_service().local_cache.clear()
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def add_rollup(db, api_key_id, days_ago, endpoint, count, latency_ms=10.0):
+    db.add(UsageRollup(
+        api_key_id=api_key_id,
+        granularity=DAY,
+        bucket_start=bucket_start(datetime.utcnow(), DAY) - timedelta(days=days_ago),
+        endpoint=endpoint,
+        request_count=count,
+        error_count=0,
+        query_count=count,
+        cost_sum=count * 0.01,
+        latency_sum_ms=count * latency_ms,
+        latency_count=count
+    ))
+    db.commit()
+
+
+def test_stats_read_from_rollups_and_cached(db):
+    """Test stats aggregate the daily rollups and are reused within stats_cache_ttl"""
+    api_key = APIKey(key="stats_key_123", partner_name="Stats", partner_email="stats@example.com")
+    db.add(api_key)
+    db.commit()
+    add_rollup(db, api_key.id, 0, "/api/v1/expirations", 3)
+    add_rollup(db, api_key.id, 0, "/api/v1/expirations/{patent_id}", 1, latency_ms=50.0)
+    add_rollup(db, api_key.id, 20, "/api/v1/expirations", 4)
+    add_rollup(db, api_key.id, 40, "/api/v1/expirations", 100)  # Outside the window
+
+    client = TestClient(app)
+    headers = {"X-API-Key": "stats_key_123"}
+    stats = client.get("/api/v1/stats", headers=headers).json()
+    assert stats["total_queries"] == 8
+    assert stats["average_response_time_ms"] == 15.0
+    assert {e["endpoint"]: e["count"] for e in stats["endpoints"]} == {
+        "/api/v1/expirations": 7, "/api/v1/expirations/{patent_id}": 1
+    }
+    assert [day["count"] for day in stats["daily_usage"]] == [0, 0, 0, 0, 0, 0, 4]
+
+    add_rollup(db, api_key.id, 1, "/api/v1/expirations", 5)
+    assert client.get("/api/v1/stats", headers=headers).json()["total_queries"] == 8
@@ -0,0 +1,75 @@
+"""
+Tests for usage retention and archival
+"""
+import os
+from datetime import datetime
+from unittest.mock import patch
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_db_engine
+from app.models.usage import APIUsage, UsageRollup
+from app.services.usage_archive import archive_closed_months, iter_archived_usage
+from app.services.usage_rollups import rebuild_rollups
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Sync session on a fresh SQLite file"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'archive.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def add_usage(db, created_at, endpoint="/api/v1/expirations"):
+    db.add(APIUsage(
+        api_key_id="key-1", endpoint=endpoint, method="GET", response_status=200,
+        response_time_ms=12.5, query_count=3, cost=0.01, created_at=created_at
+    ))
+
+
+def test_closed_months_archived_and_folded_into_rollups(db, tmp_path):
+    """Test months past retention leave api_usage but still count in rebuilt rollups"""
+    archive_dir = str(tmp_path / "archive")
+    add_usage(db, datetime(2026, 7, 3, 10))
+    add_usage(db, datetime(2026, 7, 30, 23), endpoint="/api/v1/expirations/US123")
+    add_usage(db, datetime(2026, 9, 15))
+    add_usage(db, datetime(2026, 10, 2))
+    db.commit()
+
+    with patch("app.services.usage_archive.settings.usage_archive_format", "csv"):
+        paths = archive_closed_months(db, retention_months=1, archive_dir=archive_dir, now=datetime(2026, 10, 19))
+
+    assert [os.path.basename(path) for path in paths] == ["api_usage_2026_07.csv.gz"]
+    assert db.scalar(select(func.count(APIUsage.id))) == 2
+    archived = list(iter_archived_usage(archive_dir=archive_dir))
+    assert [row["created_at"] for row in archived] == [datetime(2026, 7, 3, 10), datetime(2026, 7, 30, 23)]
+    assert archived[0]["response_status"] == 200 and archived[0]["cost"] == 0.01
+    assert list(iter_archived_usage(start=datetime(2026, 8, 1), archive_dir=archive_dir)) == []
+
+    with patch("app.services.usage_archive.settings.usage_archive_dir", archive_dir):
+        assert rebuild_rollups(db) == 4
+    days = db.scalars(select(UsageRollup).where(UsageRollup.granularity == "day")).all()
+    assert sorted((r.bucket_start.month, r.endpoint) for r in days) == [
+        (7, "/api/v1/expirations"), (7, "/api/v1/expirations/{patent_id}"),
+        (9, "/api/v1/expirations"), (10, "/api/v1/expirations")
+    ]
+
+
+def test_backfill_fills_empty_rollups_once(db):
+    """Test existing usage is folded into empty rollups, and the backfill is a no-op afterwards"""
+    from app.services.usage_rollups import backfill_rollups
+    add_usage(db, datetime(2026, 9, 1, 8))
+    add_usage(db, datetime(2026, 9, 1, 9))
+    db.commit()
+
+    assert backfill_rollups(db) == 2
+    day = db.scalars(select(UsageRollup).where(UsageRollup.granularity == "day")).one()
+    assert day.request_count == 2 and day.cost_sum == pytest.approx(0.02)
+    assert backfill_rollups(db) == 0
+    assert db.scalars(select(UsageRollup).where(UsageRollup.granularity == "day")).one().request_count == 2
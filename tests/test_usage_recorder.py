@@ -0,0 +1,159 @@
+"""
+Tests for the buffered usage recorder
+"""
+import json
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.database import Base, create_db_engine, create_async_db_engine
+from app.models.usage import APIUsage, UsageRollup
+from app.services.usage_recorder import UsageRecorder
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Async sessions on a fresh SQLite file"""
+    path = tmp_path / "usage.db"
+    sync_engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+    return async_sessionmaker(create_async_db_engine(f"sqlite+aiosqlite:///{path}"), expire_on_commit=False)
+
+
+async def count_usage(session_factory) -> int:
+    async with session_factory() as db:
+        return await db.scalar(select(func.count(APIUsage.id)))
+
+
+def record(recorder, n):
+    for _ in range(n):
+        recorder.record(api_key_id="key-1", endpoint="/api/v1/expirations", method="GET", response_status=200)
+
+
+@pytest.mark.asyncio
+async def test_events_written_in_bulk_on_flush(session_factory):
+    """Test queued events are only written when flushed"""
+    recorder = UsageRecorder(session_factory, batch_size=2, spool_path="")
+    record(recorder, 5)
+    assert await count_usage(session_factory) == 0
+
+    assert await recorder.flush() == 5
+    assert await count_usage(session_factory) == 5
+    assert recorder.stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_bounded_queue_drops_overflow(session_factory):
+    """Test events beyond max_queue are dropped and counted"""
+    recorder = UsageRecorder(session_factory, max_queue=3, spool_path="")
+    record(recorder, 5)
+    assert recorder.stats()["dropped"] == 2
+    await recorder.stop()
+    assert await count_usage(session_factory) == 3
+
+
+@pytest.mark.asyncio
+async def test_spool_replayed_once_after_crash(session_factory, tmp_path):
+    """Test spooled events survive a crash and replay skips rows already written"""
+    spool = str(tmp_path / "usage.spool")
+    crashed = UsageRecorder(session_factory, batch_size=2, spool_path=spool)
+    record(crashed, 3)
+    await crashed._write([crashed._queue[0]])  # Partially flushed before the crash
+
+    restarted = UsageRecorder(session_factory, spool_path=spool)
+    await restarted.start()
+    await restarted.stop()
+
+    assert await count_usage(session_factory) == 3
+    assert open(spool).read() == ""
+
+
+@pytest.mark.asyncio
+async def test_poison_batch_dead_lettered_after_retries(session_factory, tmp_path):
+    """Test a batch that keeps failing is moved to the dead-letter file instead of blocking the queue"""
+    spool = str(tmp_path / "usage.spool")
+    recorder = UsageRecorder(session_factory, batch_size=2, spool_path=spool, max_retries=3)
+    record(recorder, 2)
+    poison = [event["id"] for event in recorder._queue]
+    write = recorder._write
+
+    async def failing_write(events, skip_existing=False):
+        if events[0]["id"] in poison:
+            raise RuntimeError("constraint violation")
+        await write(events, skip_existing)
+
+    recorder._write = failing_write
+    record(recorder, 3)
+    for _ in range(2):
+        assert await recorder.flush() == 0
+    assert recorder.stats()["queued"] == 5
+
+    assert await recorder.flush() == 3
+    assert await count_usage(session_factory) == 3
+    assert recorder.stats()["dead_lettered"] == 2
+    dead = [json.loads(line)["id"] for line in open(f"{spool}.dead")]
+    assert dead == poison
+    assert open(spool).read() == ""
+
+
+@pytest.mark.asyncio
+async def test_flush_updates_rollups(session_factory):
+    """Test each flush adds its events to the hourly and daily rollups"""
+    recorder = UsageRecorder(session_factory, spool_path="")
+    recorder.record(
+        api_key_id="key-1", endpoint="/api/v1/expirations/US1", method="GET", response_status=200,
+        response_time_ms=40.0, cost=0.01, route="/api/v1/expirations/{patent_id}"
+    )
+    await recorder.flush()
+    recorder.record(
+        api_key_id="key-1", endpoint="/api/v1/expirations/US2", method="GET", response_status=404,
+        response_time_ms=300.0, route="/api/v1/expirations/{patent_id}"
+    )
+    await recorder.flush()
+
+    async with session_factory() as db:
+        rollups = (await db.scalars(select(UsageRollup))).all()
+    assert sorted(r.granularity for r in rollups) == ["day", "hour"]
+    for rollup in rollups:
+        assert rollup.endpoint == "/api/v1/expirations/{patent_id}"
+        assert (rollup.request_count, rollup.error_count) == (2, 1)
+        assert rollup.cost_sum == pytest.approx(0.01)
+        assert (rollup.latency_sum_ms, rollup.latency_count) == (340.0, 2)
+        assert (rollup.latency_le_50ms, rollup.latency_le_500ms) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_counters_follow_flushes_and_reconcile(session_factory):
+    """Test committed events reach the Redis counters and drift is repaired from the rollups"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from sqlalchemy.orm import Session
+    from app.services.cache_service import CacheService
+    from app.services.usage_counters import read_counters, reconcile_counters
+    from app.api.routes.stats import _stats_from_counters
+
+    cache = CacheService()
+    cache.redis_client = fakeredis.FakeRedis()
+    recorder = UsageRecorder(session_factory, spool_path="", cache=cache)
+    record(recorder, 3)
+    recorder.record(
+        api_key_id="key-1", endpoint="/api/v1/expirations/US1", method="GET", response_status=200,
+        response_time_ms=20.0, cost=0.5, route="/api/v1/expirations/{patent_id}"
+    )
+    await recorder.flush()
+
+    stats = _stats_from_counters(read_counters("key-1", cache=cache))
+    assert stats["total_queries"] == 4
+    assert stats["total_cost"] == 0.5
+    assert stats["average_response_time_ms"] == 20.0
+    assert {e["endpoint"]: e["count"] for e in stats["endpoints"]} == {
+        "/api/v1/expirations": 3, "/api/v1/expirations/{patent_id}": 1
+    }
+    assert stats["daily_usage"][-1]["count"] == 4
+
+    cache.redis_client.flushall()  # Counters lost, rollups intact
+    sync_engine = create_db_engine(str(session_factory.kw["bind"].url).replace("+aiosqlite", ""))
+    with Session(sync_engine) as db:
+        assert reconcile_counters(db, cache) == 1
+        assert reconcile_counters(db, cache) == 0
+    sync_engine.dispose()
+    assert _stats_from_counters(read_counters("key-1", cache=cache))["total_queries"] == 4
@@ -61,3 +61,27 @@ def test_calculate_patent_expiration():
     assert expiration.month == expected.month
     assert expiration.day == expected.day
 
+
+
+@pytest.mark.asyncio
+async def test_patent_lookup_failure_not_remembered(uspto_client):
+    """Test an upstream error is not cached as a missing patent"""
+    import httpx
+    from unittest.mock import MagicMock
+    uspto_client.cache.delete("patent:US7654321")
+
+    with patch("app.services.uspto_client.httpx.AsyncClient") as mock_client:
+        post = mock_client.return_value.__aenter__.return_value.post
+        post.side_effect = httpx.ConnectTimeout("timed out")
+        assert await uspto_client.get_patent_by_id("US7654321") is None
+
+        response = MagicMock()
+        response.json.return_value = {"patents": [{
+            "patent_number": "US7654321", "patent_title": "Recovered", "patent_date": "2006-01-01"
+        }]}
+        post.side_effect = None
+        post.return_value = response
+        patent = await uspto_client.get_patent_by_id("US7654321")
+
+    assert patent["title"] == "Recovered"
+    uspto_client.cache.delete("patent:US7654321")